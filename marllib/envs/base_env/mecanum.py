@@ -1,13 +1,34 @@
 import math
 from math import cos, sin
 from shapely import Point, Polygon, LineString
+import numpy as np
 import typing
+
+
+def footprint_corners(x, y, theta, wheelbase_length, track_width):
+    #corners of the robot footprint in ring order (front left, front right, back right, back left), shape (..., 4, 2)
+    #x, y and theta may be scalars or arrays of the same shape
+    cos_theta = np.cos(theta)
+    sin_theta = np.sin(theta)
+    forward_x, forward_y = cos_theta*wheelbase_length, sin_theta*wheelbase_length
+    left_x, left_y = -sin_theta*track_width, cos_theta*track_width
+    corners = np.empty(np.shape(cos_theta) + (4, 2))
+    corners[..., 0, 0] = x + forward_x + left_x
+    corners[..., 0, 1] = y + forward_y + left_y
+    corners[..., 1, 0] = x + forward_x - left_x
+    corners[..., 1, 1] = y + forward_y - left_y
+    corners[..., 2, 0] = x - forward_x - left_x
+    corners[..., 2, 1] = y - forward_y - left_y
+    corners[..., 3, 0] = x - forward_x + left_x
+    corners[..., 3, 1] = y - forward_y + left_y
+    return corners
+
+
 class Mecanum():
     def __init__(self, max_motor_velocity, motor_acceleration, wheel_radius, track_width, wheelbase_length, start_point):
         #assumptions of same motor characteristics on all 4 wheels with orientations of pi/4, 3pi/4, -3pi/4, -pi/4
 
         #motor characteristics
-        self.motor_velocities = [0,0,0,0]
         # 0 --> front left
         # 1 --> front right
         # 2 --> back left
@@ -23,26 +44,26 @@ class Mecanum():
         self.wheelbase_length = wheelbase_length#front & back distance, in
 
 
+        #geometry
+        self.robot_diagonal = math.sqrt(track_width**2 + wheelbase_length**2)
+        self.reset(start_point)
+
+    def reset(self, start_point):
+        #puts the robot back at rest at start_point = (x, y, theta) without rebuilding it
+        self.motor_velocities = [0,0,0,0]
+
         #robot characteristics
         self.x = start_point[0] #based on 2-D center of robot
         self.y = start_point[1]
         self.theta = start_point[2] # rad
 
-        #geometry
-        self.robot_diagonal = math.sqrt(track_width**2 + wheelbase_length**2)
-        robot_p1 = Point(self.x + cos(self.theta)*self.wheelbase_length + cos(self.theta)*self.track_width, 
-                        self.y + sin(self.theta)*self.wheelbase_length + sin(self.theta)*self.track_width)
-        robot_p2 = Point(self.x + cos(self.theta)*self.wheelbase_length - cos(self.theta)*self.track_width, 
-                        self.y + sin(self.theta)*self.wheelbase_length - sin(self.theta)*self.track_width)
-        robot_p3 = Point(self.x - cos(self.theta)*self.wheelbase_length + cos(self.theta)*self.track_width, 
-                        self.y - sin(self.theta)*self.wheelbase_length + sin(self.theta)*self.track_width)
-        robot_p4 = Point(self.x - cos(self.theta)*self.wheelbase_length - cos(self.theta)*self.track_width, 
-                        self.y - sin(self.theta)*self.wheelbase_length - sin(self.theta)*self.track_width)
-        
-        self.robot_shape = Polygon([robot_p1, robot_p2, robot_p3, robot_p4])
+        self.update_shape()
 
         self.last_coords = (None, None, None)
 
+    def update_shape(self):
+        self.robot_shape = Polygon(footprint_corners(self.x, self.y, self.theta, self.wheelbase_length, self.track_width))
+
 
     def move(self, power, strafe, turn, timestep):
         self.last_coords = (self.x, self.y, self.theta)
@@ -52,7 +73,6 @@ class Mecanum():
         demanded_m1_v = (power - strafe - turn)/denom * self.max_motor_velocity
         demanded_m2_v = (power - strafe + turn)/denom * self.max_motor_velocity
         demanded_m3_v = (power + strafe - turn)/denom * self.max_motor_velocity
-
         demanded_motor_velocities = [demanded_m0_v, demanded_m1_v, demanded_m2_v, demanded_m3_v]
 
         for i in range(4):
@@ -73,16 +93,7 @@ class Mecanum():
         self.theta += w*timestep
         self.x = self.x + v_forward * cos(self.theta) * timestep + v_strafe * cos(self.theta + math.pi/2) * timestep
         self.y = self.y + v_forward * sin(self.theta) * timestep + v_strafe * sin(self.theta + math.pi/2) * timestep
-        robot_p1 = Point(self.x + cos(self.theta)*self.wheelbase_length + cos(self.theta)*self.track_width, 
-                        self.y + sin(self.theta)*self.wheelbase_length + sin(self.theta)*self.track_width)
-        robot_p2 = Point(self.x + cos(self.theta)*self.wheelbase_length - cos(self.theta)*self.track_width, 
-                        self.y + sin(self.theta)*self.wheelbase_length - sin(self.theta)*self.track_width)
-        robot_p3 = Point(self.x - cos(self.theta)*self.wheelbase_length + cos(self.theta)*self.track_width, 
-                        self.y - sin(self.theta)*self.wheelbase_length + sin(self.theta)*self.track_width)
-        robot_p4 = Point(self.x - cos(self.theta)*self.wheelbase_length - cos(self.theta)*self.track_width, 
-                        self.y - sin(self.theta)*self.wheelbase_length - sin(self.theta)*self.track_width)
-        
-        self.robot_shape = Polygon([robot_p1, robot_p2, robot_p3, robot_p4])
+        self.update_shape()
         
 
     def return_characteristics(self):
@@ -92,16 +103,7 @@ class Mecanum():
         self.x = self.last_coords[0]
         self.y = self.last_coords[1]
         self.theta = self.last_coords[2]
-        robot_p1 = Point(self.x + cos(self.theta)*self.wheelbase_length + cos(self.theta)*self.track_width, 
-                        self.y + sin(self.theta)*self.wheelbase_length + sin(self.theta)*self.track_width)
-        robot_p2 = Point(self.x + cos(self.theta)*self.wheelbase_length - cos(self.theta)*self.track_width, 
-                        self.y + sin(self.theta)*self.wheelbase_length - sin(self.theta)*self.track_width)
-        robot_p3 = Point(self.x - cos(self.theta)*self.wheelbase_length + cos(self.theta)*self.track_width, 
-                        self.y - sin(self.theta)*self.wheelbase_length + sin(self.theta)*self.track_width)
-        robot_p4 = Point(self.x - cos(self.theta)*self.wheelbase_length - cos(self.theta)*self.track_width, 
-                        self.y - sin(self.theta)*self.wheelbase_length - sin(self.theta)*self.track_width)
-        
-        self.robot_shape = Polygon([robot_p1, robot_p2, robot_p3, robot_p4])
+        self.update_shape()
 
     
     
@@ -116,17 +118,215 @@ class Mecanum():
     
     def out_of_bounds(self, bounds: typing.List[Point]):
         return not(Polygon(bounds).contains_properly(self.robot_shape))
-        
 
-    
-    
-    
-    
 
+class ObstacleArray():
+    '''
+    Static obstacles converted once from shapely polygons into padded vertex/edge-normal arrays for
+    separating-axis tests. Non-convex polygons are tested by their convex hull.
+    Given the robots' reach (center to farthest footprint corner), obstacles are also bucketed into a uniform grid
+    so each robot is only tested against the obstacles near its cell.
+    '''
+    def __init__(self, list_of_polygons: typing.List[Polygon], reach=None, cell_size=None):
+        rings = [np.asarray(poly.convex_hull.exterior.coords)[:-1] for poly in list_of_polygons]
+        self.num_obstacles = len(rings)
+        max_vertices = max([len(ring) for ring in rings], default=1)
+        self.vertices = np.zeros((self.num_obstacles, max_vertices, 2))
+        self.normals = np.zeros((self.num_obstacles, max_vertices, 2))
+        for i, ring in enumerate(rings):
+            edges = np.roll(ring, -1, axis=0) - ring
+            #padding repeats the last vertex and the first normal so it never adds a separating axis
+            self.vertices[i, :len(ring)] = ring
+            self.vertices[i, len(ring):] = ring[-1]
+            self.normals[i, :len(ring)] = np.stack([-edges[:, 1], edges[:, 0]], axis=-1)
+            self.normals[i, len(ring):] = self.normals[i, 0]
+        #each obstacle's extent along its own normals
+        projections = np.einsum("mjd,mvd->mjv", self.normals, self.vertices)
+        #(V, M) copies, indexed by obstacle along the last axis
+        self.vertices_x, self.vertices_y = self.vertices.transpose(2, 1, 0)
+        self.normals_x, self.normals_y = self.normals.transpose(2, 1, 0)
+        self.normal_min = projections.min(axis=-1).T
+        self.normal_max = projections.max(axis=-1).T
 
+        self.candidates = None#(cells + 1, C) obstacle IDs per grid cell, -1 padded; the last row is "outside the grid"
+        if(reach is not None and self.num_obstacles > 0):
+            self.build_grid(reach, cell_size)
 
+    def __len__(self):
+        return self.num_obstacles
 
+    def build_grid(self, reach, cell_size=None):
+        #a robot centered in a cell can only touch obstacles whose bounding box grown by reach covers that cell
+        lower = self.vertices.min(axis=1) - reach
+        upper = self.vertices.max(axis=1) + reach
+        self.cell_size = max(2*reach, 1e-6) if cell_size is None else cell_size
+        self.grid_origin = lower.min(axis=0)
+        self.grid_shape = np.floor((upper.max(axis=0) - self.grid_origin)/self.cell_size).astype(int) + 1
+        first = np.floor((lower - self.grid_origin)/self.cell_size).astype(int)
+        last = np.floor((upper - self.grid_origin)/self.cell_size).astype(int)
 
-        
+        cells = [[] for i in range(self.grid_shape[0]*self.grid_shape[1])]
+        for obstacle in range(self.num_obstacles):
+            for i in range(first[obstacle, 0], last[obstacle, 0] + 1):
+                for j in range(first[obstacle, 1], last[obstacle, 1] + 1):
+                    cells[i*self.grid_shape[1] + j].append(obstacle)
+        self.candidates = np.full((len(cells) + 1, max(len(cell) for cell in cells)), -1)
+        for i, cell in enumerate(cells):
+            self.candidates[i, :len(cell)] = cell
+
+    def nearby(self, points):
+        #(K, C) IDs of the obstacles that could touch a robot centered at each point, -1 padded
+        cell = np.floor((np.asarray(points)[:, :2] - self.grid_origin)/self.cell_size).astype(int)
+        inside = ((cell >= 0) & (cell < self.grid_shape)).all(axis=-1)
+        return self.candidates[np.where(inside, cell[:, 0]*self.grid_shape[1] + cell[:, 1], len(self.candidates) - 1)]
+
+
+class MecanumBatch():
+    '''
+    K mecanum robots advanced together with array math. Same kinematics as Mecanum, but the state lives in
+    (K, ...) arrays and collision/bounds/goal tests are analytic on the rectangular footprint instead of shapely.
+    '''
+    MIXING = np.array([[1, 1, 1], [1, -1, -1], [1, -1, 1], [1, 1, -1]], dtype=np.float64)#(power, strafe, turn) --> motors 0-3
+
+    def __init__(self, num_robots, max_motor_velocity, motor_acceleration, wheel_radius, track_width, wheelbase_length, start_points=None):
+        self.num_robots = num_robots
+        self.max_motor_velocity = max_motor_velocity # rotations/s
+        self.motor_acceleration = motor_acceleration # rotation/s^2
+        self.wheel_radius = wheel_radius # in
+        self.track_width = track_width#left & right distance, in
+        self.wheelbase_length = wheelbase_length#front & back distance, in
+        self.robot_diagonal = math.sqrt(track_width**2 + wheelbase_length**2)
+
+        self.motor_velocities = np.zeros((num_robots, 4))
+        self.pose = np.zeros((num_robots, 3))#x, y, theta of each robot's center
+        self.last_pose = np.full((num_robots, 3), np.nan)
+        if(start_points is not None):
+            self.reset(start_points)
+
+    @property
+    def x(self):
+        return self.pose[:, 0]
+
+    @property
+    def y(self):
+        return self.pose[:, 1]
+
+    @property
+    def theta(self):
+        return self.pose[:, 2]
+
+    def reset(self, start_points, robot_ids=None):
+        #puts robot_ids (default: all) back at rest at start_points = (x, y, theta) rows
+        robot_ids = slice(None) if robot_ids is None else robot_ids
+        self.motor_velocities[robot_ids] = 0.0
+        self.pose[robot_ids] = start_points
+        self.last_pose[robot_ids] = np.nan
+
+    def move(self, power, strafe, turn, timestep, robot_ids=None):
+        #power, strafe, turn are scalars or same-shape (K,) arrays in terms of 0-->1, like a controller
+        robot_ids = slice(None) if robot_ids is None else robot_ids
+        pose = self.pose[robot_ids]
+        self.last_pose[robot_ids] = pose
+
+        command = np.array([power, strafe, turn], dtype=np.float64).reshape(3, -1)
+        denom = np.maximum(np.abs(command).sum(axis=0), 1)
+        demanded = (self.MIXING @ command / denom).T * self.max_motor_velocity
+        velocities = self.motor_velocities[robot_ids]
+        ramp = self.motor_acceleration*timestep
+        velocities = np.where(np.abs(velocities - demanded) < ramp, demanded, velocities + np.copysign(ramp, demanded - velocities))
+        self.motor_velocities[robot_ids] = velocities
+
+        m0, m1, m2, m3 = velocities.T
+        v_forward = (m0 + m1 + m2 + m3)*self.wheel_radius/4
+        v_strafe = (-m0 + m1 + m2 - m3)*self.wheel_radius/4
+        w = (-m0 + m1 - m2 + m3)*self.wheel_radius/(2 * (self.track_width + self.wheelbase_length))
+
+        theta = pose[:, 2] + w*timestep
+        cos_theta = np.cos(theta)
+        sin_theta = np.sin(theta)
+        #cos(theta + pi/2) = -sin(theta), sin(theta + pi/2) = cos(theta)
+        pose[:, 0] += (v_forward * cos_theta - v_strafe * sin_theta) * timestep
+        pose[:, 1] += (v_forward * sin_theta + v_strafe * cos_theta) * timestep
+        pose[:, 2] = theta
+        self.pose[robot_ids] = pose#pose is a view for the default slice, a copy for index arrays
+
+    def revert(self, mask=None):
+        #moves robots (where mask is True, default: all) back to their pose before the last move
+        mask = np.ones(self.num_robots, dtype=bool) if mask is None else np.asarray(mask, dtype=bool)
+        self.pose[mask] = self.last_pose[mask]
+
+    def corners(self):
+        return footprint_corners(self.pose[:, 0], self.pose[:, 1], self.pose[:, 2], self.wheelbase_length, self.track_width)
+
+    def axes(self):
+        #unit forward and left axes of each robot, shape (K, 2, 2)
+        cos_theta = np.cos(self.pose[:, 2])
+        sin_theta = np.sin(self.pose[:, 2])
+        axes = np.empty((self.num_robots, 2, 2))
+        axes[:, 0, 0] = cos_theta
+        axes[:, 0, 1] = sin_theta
+        axes[:, 1, 0] = -sin_theta
+        axes[:, 1, 1] = cos_theta
+        return axes
+
+    def point_contained(self, points):
+        #(K,) whether each robot's footprint strictly contains its point (rows of a (K, 2) array)
+        points = np.asarray(points)
+        dx = points[:, 0] - self.pose[:, 0]
+        dy = points[:, 1] - self.pose[:, 1]
+        cos_theta = np.cos(self.pose[:, 2])
+        sin_theta = np.sin(self.pose[:, 2])
+        return (np.abs(dx*cos_theta + dy*sin_theta) < self.wheelbase_length) & (np.abs(dy*cos_theta - dx*sin_theta) < self.track_width)
+
+    def clips_polygons(self, obstacles: ObstacleArray):
+        #(K, M) whether each robot's footprint overlaps the interior of each obstacle (touching doesn't count)
+        #separating-axis test: the candidate axes are the robot's forward/left axes and the obstacles' edge normals
+        #per-vertex/per-normal terms are laid out (V, K, M or C) so the reductions run over the leading axis
+        if(len(obstacles) == 0):
+            return np.zeros((self.num_robots, 0), dtype=bool)
+        if(obstacles.candidates is None):#no grid, every robot against every obstacle
+            ids = None
+            take = lambda column: column[:, None, :]
+        else:
+            ids = obstacles.nearby(self.pose)
+            if((ids < 0).all()):
+                return np.zeros((self.num_robots, len(obstacles)), dtype=bool)
+            take = lambda column: column[:, np.maximum(ids, 0)]
+        x = self.pose[None, :, 0, None]
+        y = self.pose[None, :, 1, None]
+        cos_theta = np.cos(self.pose[None, :, 2, None])
+        sin_theta = np.sin(self.pose[None, :, 2, None])
+
+        #obstacle vertices in each robot's frame
+        dx = take(obstacles.vertices_x) - x
+        dy = take(obstacles.vertices_y) - y
+        along = dx*cos_theta + dy*sin_theta
+        across = dy*cos_theta - dx*sin_theta
+        separated = ((along.min(axis=0) >= self.wheelbase_length) | (along.max(axis=0) <= -self.wheelbase_length) |
+                     (across.min(axis=0) >= self.track_width) | (across.max(axis=0) <= -self.track_width))
+
+        #robot footprint projected on an obstacle normal is its center's projection +- a radius
+        normals_x = take(obstacles.normals_x)
+        normals_y = take(obstacles.normals_y)
+        center = x*normals_x + y*normals_y
+        radius = (np.abs(normals_x*cos_theta + normals_y*sin_theta)*self.wheelbase_length +
+                  np.abs(normals_y*cos_theta - normals_x*sin_theta)*self.track_width)
+        separated |= ((center - radius >= take(obstacles.normal_max)) | (center + radius <= take(obstacles.normal_min))).any(axis=0)
+        if(ids is None):
+            return ~separated
+
+        #scatter the candidate results back to obstacle columns; padding lands in a dropped extra column
+        clips = np.zeros((self.num_robots, len(obstacles) + 1), dtype=bool)
+        clips[np.arange(self.num_robots)[:, None], np.where(ids >= 0, ids, len(obstacles))] = ~separated & (ids >= 0)
+        return clips[:, :-1]
 
+    def out_of_bounds(self, min_x, min_y, max_x, max_y):
+        #(K,) whether each robot's footprint isn't strictly inside the axis-aligned field
+        #the footprint's axis-aligned half extents are |cos|*wheelbase + |sin|*track and |sin|*wheelbase + |cos|*track
+        cos_theta = np.abs(np.cos(self.pose[:, 2]))
+        sin_theta = np.abs(np.sin(self.pose[:, 2]))
+        extent_x = cos_theta*self.wheelbase_length + sin_theta*self.track_width
+        extent_y = sin_theta*self.wheelbase_length + cos_theta*self.track_width
+        return ((self.pose[:, 0] - extent_x <= min_x) | (self.pose[:, 0] + extent_x >= max_x) |
+                (self.pose[:, 1] - extent_y <= min_y) | (self.pose[:, 1] + extent_y >= max_y))
 
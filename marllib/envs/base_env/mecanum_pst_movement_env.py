@@ -9,11 +9,10 @@ from itertools import islice
 import numpy as np
 import random as rand
 
-from mecanum import Mecanum
+from marllib.envs.base_env.mecanum import MecanumBatch, ObstacleArray
+from marllib.envs.base_env.mecanum_sampler import GoalSampler
 import shapely
 from shapely import Point, Polygon
-from marllib import marl
-from marllib.envs.base_env import ENV_REGISTRY
 import time
 
 
@@ -32,40 +31,55 @@ class MecMvmt(MultiAgentEnv):
         self.env_max_x = env_config["max_x"]
         self.env_min_y = env_config["min_y"]
         self.env_max_y = env_config["max_y"]
-        sample_space = Box(low = np.array([self.env_min_x, self.env_min_y, 0]), 
+        self.sample_space = Box(low = np.array([self.env_min_x, self.env_min_y, 0]), 
                            high = np.array([self.env_max_x, self.env_max_y, 2*math.pi]), dtype = np.float32)
+        self.np_random = np.random.default_rng(env_config.get("seed", None))#per-env stream, persists across resets
+        self.goal_sampler = GoalSampler(self.sample_space.low, self.sample_space.high, self.np_random, env_config)
         self.action_space = Box(low = 0.0, high = 1.0, shape = (1,), dtype = np.float32)
         self.observation_space = Dict({"obs": Box(low = np.array([-10000.0, -10000.0, -10000.0, -10000.0, -10000.0, 0]), 
                                      high = np.array([10000.0, 10000.0, 10000.0, 10000.0, 10000.0, 1000]), dtype = np.float32)})# NEEDS CHANGE
-        self.robot = Mecanum(max_motor_velocity = float(env_config["max_motor_velocity"]),
-                             motor_acceleration= float(env_config["motor_acceleration"]),
-                             wheel_radius=float(env_config["wheel_radius"]),
-                             track_width=float(env_config["track_width"]),
-                             wheelbase_length=float(env_config["wheelbase_length"]),
-                             start_point = sample_space.sample())
+        self.robot = MecanumBatch(num_robots = 1,
+                                  max_motor_velocity = float(env_config["max_motor_velocity"]),
+                                  motor_acceleration= float(env_config["motor_acceleration"]),
+                                  wheel_radius=float(env_config["wheel_radius"]),
+                                  track_width=float(env_config["track_width"]),
+                                  wheelbase_length=float(env_config["wheelbase_length"]))
         self.agents = ["power", "strafe", "turn"]
         self.num_agents = len(self.agents)
         
-        self.goal_point = Point(sample_space.sample()[:-1])
-        self.roadblocks = []
-        self.curtime = float(0.0)
+        self.bounds = (self.env_min_x, self.env_min_y, self.env_max_x, self.env_max_y)
+        self.set_roadblocks([])
         self.maxtime = env_config["max_time"]# 0 < maxtime < 1000
         self.timestep = env_config["timestep"]
-        
+        self.frame_skip = int(env_config.get("frame_skip", 1))#physics steps per policy decision, curtime and max_time count physics steps
+        self.reset_state()
+
+    def set_roadblocks(self, roadblocks):#static obstacles are converted and grid-indexed here once, not every step
+        self.roadblocks = list(roadblocks)
+        self.obstacles = ObstacleArray(self.roadblocks, reach = self.robot.robot_diagonal)
+
+    def sample_point(self):#uniform (x, y, theta) inside the field
+        return self.goal_sampler.sample_point()
+
+    def reset_state(self):#new start and goal for the existing robot; spaces and robot parameters are kept
+        self.start_point, self.goal_point = self.goal_sampler.sample()
+        self.robot.reset(self.start_point)
+        self.reached_goal = False
+        self.curtime = float(0.0)
 
     def reset(self):
-        self.__init__(self.env_config)
+        self.reset_state()
         obs = {}
         for agent in self.agents:
             obs[agent] = self.generate_obs()
         return obs
 
     def generate_obs(self):
-        return {"obs": np.array([self.robot.x,
-                         self.robot.y,
-                         self.robot.theta,
-                         self.goal_point.coords.xy[0][0],
-                         self.goal_point.coords.xy[1][0],
+        return {"obs": np.array([self.robot.x[0],
+                         self.robot.y[0],
+                         self.robot.theta[0],
+                         self.goal_point[0],
+                         self.goal_point[1],
                          self.curtime], 
                          dtype = np.float32)}
     
@@ -79,30 +93,43 @@ class MecMvmt(MultiAgentEnv):
         }
         return env_info
 
+    def physics_step(self, power, strafe, turn):
+        #advances the robot by one physics timestep, returns (reward, done, stop) where stop ends the remaining substeps
+        self.robot.move(power = power, strafe = strafe, turn = turn, timestep=self.timestep)
+        if(self.curtime >= self.maxtime):
+            return -100.0, True, True
+        elif self.robot.clips_polygons(self.obstacles).any():
+            self.robot.revert()
+            return -10.0, False, True
+        elif self.robot.out_of_bounds(*self.bounds)[0]:
+            self.robot.revert()
+            return -1.0, False, True
+        elif self.robot.point_contained(self.goal_point[None])[0]:
+            self.reached_goal = True
+            return 50.0, True, True
+        else:
+            return -0.5, False, False
+
     def step(self, action_dict):
         '''THIS ONLY HANDLES THE MOVEMENT ACTIONS AND IS RESERVED FOR MEC DRIVES, NOT ANY OTHER GAME-SPECIFIC OR ROBOT-SPECIFIC ACTION. '''
         
-        rewards = {}
         #print(action_dict)
-        dones = {"__all__": False}
-        self.robot.move(power = float(action_dict["power"][0]), strafe = float(action_dict["strafe"][0]), turn = float(action_dict["turn"][0]), timestep=self.timestep)
-        if(self.curtime == self.maxtime):
-            rewards ={"power":-100.0, "strafe":-100.0, "turn":-100.0}
-            dones = {"__all__": True}
-        elif True in (self.robot.clips_polygons(self.roadblocks)):
-            self.robot.revert()
-            rewards ={"power":-10.0, "strafe":-10.0, "turn":-10.0}
-        elif self.robot.out_of_bounds(bounds = [Point(self.env_min_x, self.env_min_y),
-                                      Point(self.env_min_x, self.env_max_y),
-                                      Point(self.env_max_x, self.env_min_y),
-                                      Point(self.env_max_x, self.env_max_y)]):
-            self.robot.revert()
-            rewards ={"power":-1.0, "strafe":-1.0, "turn":-1.0}
-        elif self.robot.point_contained(self.goal_point):
-            rewards ={"power":50.0, "strafe":50.0, "turn":50.0}
-            dones = {"__all__": True}
-        else:
-            rewards ={"power":-0.5, "strafe":-0.5, "turn":-0.5}
+        power = float(action_dict["power"][0])
+        strafe = float(action_dict["strafe"][0])
+        turn = float(action_dict["turn"][0])
+        #the action is held for up to frame_skip physics steps; their rewards are summed and a collision, the goal or the time limit cuts it short
+        reward = 0.0
+        for substep in range(self.frame_skip):
+            if(substep > 0):
+                self.curtime += 1
+            substep_reward, done, stop = self.physics_step(power, strafe, turn)
+            reward += substep_reward
+            if(stop):
+                break
+        if(done):
+            self.goal_sampler.record(self.start_point, self.goal_point, self.reached_goal)
+        rewards = {"power": reward, "strafe": reward, "turn": reward}
+        dones = {"__all__": done}
         obs = {"power": self.generate_obs(), "strafe": self.generate_obs(), "turn": self.generate_obs()}
         
         self.curtime += 1
@@ -111,9 +138,11 @@ class MecMvmt(MultiAgentEnv):
         return obs, rewards, dones, {}
     
     def render(self):
-        return "Current location: " + str(self.robot.x) + ", " + str(self.robot.y) + "\n. The goal is at " + str(self.goal_point.coords.xy[0][0]) + ", " + str(self.goal_point.coords.xy[1][0])
+        return "Current location: " + str(self.robot.x[0]) + ", " + str(self.robot.y[0]) + "\n. The goal is at " + str(self.goal_point[0]) + ", " + str(self.goal_point[1])
         
 if __name__ == '__main__':
+    from marllib import marl
+    from marllib.envs.base_env import ENV_REGISTRY
     global timestep
     timestep = 0
     # register new env
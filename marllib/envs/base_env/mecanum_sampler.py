@@ -0,0 +1,75 @@
+
+#start/goal sampling for MecMvmt. "uniform" draws both anywhere in the field; "curriculum" draws the goal within a radius
+#of the start that widens as the recent success rate rises. Either mode can also replay start/goal pairs that timed out,
+#whose outcomes stay out of the curriculum
+from collections import deque
+import math
+import numpy as np
+
+
+class GoalSampler():
+    '''
+    Picks (start, goal) pairs for an env and learns from their outcomes through record().
+    start is (x, y, theta), goal is (x, y); both come from the env's own random stream.
+    '''
+    def __init__(self, low, high, np_random, env_config):
+        self.low = np.asarray(low, dtype=np.float64)#(min_x, min_y, 0)
+        self.high = np.asarray(high, dtype=np.float64)#(max_x, max_y, 2pi)
+        self.np_random = np_random
+        self.mode = env_config.get("goal_sampler", "uniform")
+        if(self.mode not in ("uniform", "curriculum")):
+            raise ValueError("goal_sampler must be 'uniform' or 'curriculum', got " + str(self.mode))
+
+        #curriculum: the radius grows by curriculum_growth whenever curriculum_threshold of the last curriculum_window episodes succeed
+        self.max_radius = math.hypot(*(self.high[:2] - self.low[:2]))
+        self.radius = min(float(env_config.get("curriculum_start_radius", 30.0)), self.max_radius)
+        self.growth = float(env_config.get("curriculum_growth", 1.25))
+        self.threshold = float(env_config.get("curriculum_threshold", 0.6))
+        self.outcomes = deque(maxlen = int(env_config.get("curriculum_window", 20)))
+
+        #hard pairs: timed-out pairs are replayed with probability hard_replay_prob, a buffer size of 0 turns this off
+        self.hard_pairs = deque(maxlen = int(env_config.get("hard_buffer_size", 0)))
+        self.hard_keys = set()#bytes of the stored pairs, so a pair that times out again is not stored twice
+        self.hard_replay_prob = float(env_config.get("hard_replay_prob", 0.2))
+        self.replaying = False#whether the last sample() replayed a hard pair
+
+    def sample_point(self):#uniform (x, y, theta) inside the field
+        return self.np_random.uniform(self.low, self.high)
+
+    def sample(self):
+        self.replaying = len(self.hard_pairs) > 0 and self.np_random.random() < self.hard_replay_prob
+        if(self.replaying):
+            start, goal = self.hard_pairs[self.np_random.integers(len(self.hard_pairs))]
+            return start.copy(), goal.copy()
+        start = self.sample_point()
+        if(self.mode == "uniform"):
+            return start, self.sample_point()[:-1]
+        heading = self.np_random.uniform(0, 2*math.pi)
+        distance = self.np_random.uniform(0, self.radius)
+        goal = start[:-1] + distance*np.array([math.cos(heading), math.sin(heading)])
+        return start, np.clip(goal, self.low[:2], self.high[:2])
+
+    def record(self, start, goal, success):#called once per finished episode, with the pair of the last sample()
+        pair = (np.array(start, dtype=np.float64), np.array(goal, dtype=np.float64))
+        key = pair_key(*pair)
+        if(self.replaying):
+            #a replayed pair was not drawn at the current radius, so it only leaves the buffer once it is solved
+            if(success and key in self.hard_keys):
+                del self.hard_pairs[[pair_key(*stored) for stored in self.hard_pairs].index(key)]
+                self.hard_keys.discard(key)
+            return
+        if(not success and self.hard_pairs.maxlen > 0 and key not in self.hard_keys):
+            if(len(self.hard_pairs) == self.hard_pairs.maxlen):
+                self.hard_keys.discard(pair_key(*self.hard_pairs[0]))
+            self.hard_pairs.append(pair)
+            self.hard_keys.add(key)
+        if(self.mode != "curriculum"):
+            return
+        self.outcomes.append(bool(success))
+        if(len(self.outcomes) == self.outcomes.maxlen and np.mean(self.outcomes) >= self.threshold):
+            self.radius = min(self.radius*self.growth, self.max_radius)
+            self.outcomes.clear()#judge the new radius on its own episodes
+
+
+def pair_key(start, goal):#bytes of a stored (start, goal) pair
+    return start.tobytes() + goal.tobytes()
@@ -3,6 +3,7 @@ from ray.rllib.env.multi_agent_env import MultiAgentEnv
 from gym.spaces import Dict as GymDict, Discrete, Box
 import pommerman
 from collections import defaultdict
+import functools
 import queue
 import random
 from pommerman.characters import Bomber
@@ -25,6 +26,97 @@ policy_mapping_dict = {
     },
 }
 
+# (row, col) offsets of the four neighbours, in the order the rule agents explore them
+NEIGHBOURS = np.array([(-1, 0), (1, 0), (0, -1), (0, 1)])
+
+PASSABLE_ITEMS = [
+    constants.Item.Passage, constants.Item.ExtraBomb, constants.Item.IncrRange, constants.Item.Kick,
+    constants.Item.Agent0, constants.Item.Agent1, constants.Item.Agent2, constants.Item.Agent3,
+]
+
+
+def item_table(values):
+    """Lookup table from a board value to whether it is one of `values`."""
+    table = np.zeros(256, dtype=bool)
+    table[list(values)] = True
+    return table
+
+
+PASSABLE_TABLE = item_table([item.value for item in PASSABLE_ITEMS])
+
+
+def neighbours(padded):
+    """Views of a board padded by one cell on every side, holding at [r, c]
+    the value of the neighbour of (r, c) in each of the NEIGHBOURS directions."""
+    return [padded[1 + row:padded.shape[0] - 1 + row, 1 + col:padded.shape[1] - 1 + col] for row, col in NEIGHBOURS]
+
+
+def distance_map(board, my_position, enemies, depth, exclude):
+    """Breadth-first distances from my_position over the whole board at once.
+
+    The same cells as SimpleAgent's Dijkstra are considered: those within
+    `depth` (Manhattan) of my_position and the scan window around it, and
+    not holding an `exclude` item. Only passable cells are expanded.
+    Returns the considered cells, in row-major order, with their distance
+    (inf when unreachable), their items, and for every cell the neighbours
+    it is reached from at one step less.
+
+    Identical boards seen again, as in consecutive steps where nothing
+    moved, are served from a cache.
+    """
+    board = np.ascontiguousarray(board)
+    return _distance_map(board.tobytes(), board.shape, board.dtype.str, (int(my_position[0]), int(my_position[1])),
+                         tuple(sorted(enemy.value for enemy in enemies)), depth,
+                         tuple(sorted(item.value for item in exclude)))
+
+
+@functools.lru_cache(maxsize=64)
+def _distance_map(board_bytes, shape, dtype, my_position, enemies, depth, exclude):
+    board = np.frombuffer(board_bytes, dtype=dtype).reshape(shape)
+    n = len(board)
+    my_x, my_y = my_position
+    rows, cols = np.indices(board.shape)
+
+    considered = (np.abs(rows - my_x) + np.abs(cols - my_y) <= depth) & ~item_table(exclude)[board]
+    considered[:max(0, my_x - depth)] = considered[min(n, my_x + depth):] = False
+    considered[:, :max(0, my_y - depth)] = considered[:, min(n, my_y + depth):] = False
+    passable = PASSABLE_TABLE[board] & ~item_table(enemies)[board]
+
+    # padded by one cell, so that the neighbours of every cell are plain slices
+    dist = np.full((n + 2, n + 2), np.inf)
+    expanded = np.zeros((n + 2, n + 2), dtype=bool)
+    frontier = np.zeros(board.shape, dtype=bool)
+    if considered[my_x, my_y]:
+        dist[1 + my_x, 1 + my_y] = 0
+        frontier[my_x, my_y] = True
+
+    step = 0
+    while True:
+        expanded[1:-1, 1:-1] = frontier & passable
+        if not expanded.any():
+            break
+        step += 1
+        up, down, left, right = neighbours(expanded)
+        frontier = (up | down | left | right) & considered & np.isinf(dist[1:-1, 1:-1])
+        dist[1:-1, 1:-1][frontier] = step
+
+    # parents[k, r, c]: (r, c) is reached one step after its neighbour NEIGHBOURS[k]
+    expandable = np.zeros((n + 2, n + 2), dtype=bool)
+    expandable[1:-1, 1:-1] = passable & considered
+    cell_dist = dist[1:-1, 1:-1]
+    parents = np.stack([
+        is_expandable & (neighbour_dist == cell_dist - 1)
+        for is_expandable, neighbour_dist in zip(neighbours(expandable), neighbours(dist))
+    ]) & np.isfinite(cell_dist)
+
+    positions = [tuple(position) for position in np.argwhere(considered).tolist()]
+    items = defaultdict(list)
+    for position, value in zip(positions, board[considered].tolist()):
+        items[value].append(position)
+    items = {constants.Item(value): item_positions for value, item_positions in items.items()}
+    return positions, cell_dist[considered].tolist(), items, parents
+
+
 class RllibPommerman(MultiAgentEnv):
 
     def __init__(self, env_config):
@@ -359,60 +451,23 @@ class SimpleAgent(Bomber):
                 constants.Item.Fog, constants.Item.Rigid, constants.Item.Flames
             ]
 
-        def out_of_range(p_1, p_2):
-            '''Determines if two points are out of rang of each other'''
-            x_1, y_1 = p_1
-            x_2, y_2 = p_2
-            return abs(y_2 - y_1) + abs(x_2 - x_1) > depth
-
-        items = defaultdict(list)
-        dist = {}
-        prev = {}
-        Q = queue.Queue()
-
-        my_x, my_y = my_position
-        for r in range(max(0, my_x - depth), min(len(board), my_x + depth)):
-            for c in range(max(0, my_y - depth), min(len(board), my_y + depth)):
-                position = (r, c)
-                if any([
-                    out_of_range(my_position, position),
-                    utility.position_in_items(board, position, exclude),
-                ]):
-                    continue
+        positions, distances, board_items, parents = distance_map(board, my_position, enemies, depth, exclude)
 
-                prev[position] = None
-                item = constants.Item(board[position])
-                items[item].append(position)
+        items = defaultdict(list, {item: list(item_positions) for item, item_positions in board_items.items()})
+        dist = dict(zip(positions, distances))
+        prev = dict.fromkeys(positions)
 
-                if position == my_position:
-                    Q.put(position)
-                    dist[position] = 0
-                else:
-                    dist[position] = np.inf
+        # a uniformly random one of the shortest-path parents of every reached cell; the queue search this
+        # replaced kept a later parent over an earlier one by a coin flip, which favoured the last of 3+ parents
+        reached_x, reached_y = np.nonzero(parents.any(axis=0))
+        choice = np.argmax(np.random.random(parents.shape) * parents, axis=0)[reached_x, reached_y]
+        prev_x, prev_y = reached_x + NEIGHBOURS[choice, 0], reached_y + NEIGHBOURS[choice, 1]
+        prev.update(zip(zip(reached_x.tolist(), reached_y.tolist()), zip(prev_x.tolist(), prev_y.tolist())))
 
         for bomb in bombs:
             if bomb['position'] == my_position:
                 items[constants.Item.Bomb].append(my_position)
 
-        while not Q.empty():
-            position = Q.get()
-
-            if utility.position_is_passable(board, position, enemies):
-                x, y = position
-                val = dist[(x, y)] + 1
-                for row, col in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-                    new_position = (row + x, col + y)
-                    if new_position not in dist:
-                        continue
-
-                    if val < dist[new_position]:
-                        dist[new_position] = val
-                        prev[new_position] = position
-                        Q.put(new_position)
-                    elif (val == dist[new_position] and random.random() < .5):
-                        dist[new_position] = val
-                        prev[new_position] = position
-
         return items, dist, prev
 
     def _directions_in_range_of_bomb(self, board, my_position, bombs, dist):
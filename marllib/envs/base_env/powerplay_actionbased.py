@@ -6,9 +6,12 @@ import networkx as nx
 import typing
 import math
 from itertools import islice
+import heapq
 import numpy as np
 import random as rand
 
+from marllib.envs.base_env.powerplay_circuit import CircuitTracker
+
 policy_mapping_dict = {
     "all_scenario": {
         "description": "powerplay",
@@ -18,6 +21,62 @@ policy_mapping_dict = {
     }
 }
 
+OBS_DIM = 64
+ROBOT_STARTS = {"red_1": ("red", 11, 180),
+                "red_2": ("red", 23, 180),
+                "blue_1": ("blue", 6, 0),
+                "blue_2": ("blue", 24, 0)}#team, box_location, heading
+ROBOT_OBS_DIVISOR = np.array([1, 90.0, 1, 1, 0.5])#robot_state columns --> observation values
+
+HEADING_OF_STEP = {1: 0, -6: 90, -1: 180, 6: 270}#box offset of a move --> heading the robot needs to make it
+_PATH_TABLE = None
+
+
+def build_path_table():
+    '''
+    Heading-aware Dijkstra over (box, heading) states of the 6x6 box grid. Driving straight costs 0.5s per box,
+    turning and driving costs 1s, same as the scoring in ConeStation.closest_path_to.
+    Returns {(start_box, heading): {target_box: (path, time)}}, with paths excluding the start box.
+    '''
+    table = {}
+    for start in range(36):
+        for heading in HEADING_OF_STEP.values():
+            best = {(start, heading): 0.0}
+            prev = {}
+            heap = [(0.0, start, heading)]
+            while(len(heap) != 0):
+                t, box, cur_heading = heapq.heappop(heap)
+                if(t > best[(box, cur_heading)]):
+                    continue
+                for step, new_heading in HEADING_OF_STEP.items():
+                    if(step == 1 and box % 6 == 5 or step == -1 and box % 6 == 0 or not(0 <= box + step < 36)):
+                        continue
+                    new_t = t + (0.5 if new_heading == cur_heading else 1)
+                    state = (box + step, new_heading)
+                    if(new_t < best.get(state, math.inf)):
+                        best[state] = new_t
+                        prev[state] = (box, cur_heading)
+                        heapq.heappush(heap, (new_t, box + step, new_heading))
+            paths = {}
+            for target in range(36):
+                state = min([s for s in best if s[0] == target], key = lambda s: best[s])
+                time = best[state]
+                path = []
+                while(state != (start, heading)):
+                    path.append(state[0])
+                    state = prev[state]
+                paths[target] = (tuple(reversed(path)), time)
+            table[(start, heading)] = paths
+    return table
+
+
+def get_path_table():#built once per process and shared by every env instance
+    global _PATH_TABLE
+    if _PATH_TABLE is None:
+        _PATH_TABLE = build_path_table()
+    return _PATH_TABLE
+
+
 class Powerplay(MultiAgentEnv):
 
     def __init__(self, env_config):
@@ -52,6 +111,8 @@ class Powerplay(MultiAgentEnv):
             27: ConeStation("junction", [27,28,33,34], junction_type = "LOW"),
             28: ConeStation("junction", [28,29,34,35], junction_type = "GROUND"),
         }#every junction and their corresponding ID. IDs will be used to clean up code by a lot
+        self.circuit_tracker = CircuitTracker()#kept in sync with owned_by through set_junction_owner
+        self.junction_owner = np.zeros(29)#owned_by in observation encoding: 0 --> nobody, 1 --> blue, 2 --> red
         self.graph = nx.Graph()#graph of adjacent boxes
         self.graph.add_nodes_from(range(35))
         for r in range(35):
@@ -63,8 +124,6 @@ class Powerplay(MultiAgentEnv):
                 self.graph.add_edge(r, r + 1)
         self.order = None
         
-        self.blue_points = 0
-        self.red_points = 0
         self.blue_substation = ConeStation("substation", [12, 18])
 
         self.red_substation = ConeStation("substation", [17, 23])
@@ -77,6 +136,32 @@ class Powerplay(MultiAgentEnv):
 
         self.red_stack_two = ConeStation("stack", [33])
 
+        self.agents = ["red_1", "red_2", "blue_1", "blue_2"]
+        self.robot_state = np.zeros((4, 5))#observed robot fields, one row per robot in agent order; see Robot
+        self.robots = {name: Robot(name, *ROBOT_STARTS[name], 1, self.robot_state[i])
+                       for i, name in enumerate(self.agents)}#creates the robots mapped to the agent names
+
+        self.action_space = Discrete(29)#will be action-masked down; maximum of 29 choices
+        temp = [241, 2, 30, 36, 4, 2, 2, 20, 36, 4, 2, 2, 20, 36, 4, 2, 2, 20, 36, 4, 2, 2, 20, 40, 40, 2, 2,2, 2, 30, 30, 2, 2, 2, 2]
+        
+        b = Box(low=np.array([0]*(29+len(temp))), high=np.array([2]*29 +temp), dtype=np.float64)
+        self.observation_space = Dict({'obs': b,
+                                    'action_mask': Box(low = 0, high = 1, shape = (29,),  dtype=np.float64)})
+        self.env_config = env_config
+        #precomputed paths by default; set use_path_table to False to fall back to the networkx k-shortest paths
+        self.path_table = get_path_table() if env_config.get("use_path_table", True) else None
+        self.np_random = np.random.default_rng(env_config.get("seed", None))#per-env stream, persists across resets
+        self.reset_state()
+
+
+    def reset_state(self):#reinitializes everything a match changes; the field geometry, graph and spaces are kept
+        for station in list(self.junctions.values()) + [self.blue_substation, self.red_substation, self.blue_stack_one,
+                                                        self.blue_stack_two, self.red_stack_one, self.red_stack_two]:
+            station.reset()
+        self.circuit_tracker.reset()
+        self.junction_owner[:] = 0
+        self.blue_points = 0
+        self.red_points = 0
         self.red_beacon_one_placed = False
         self.blue_beacon_one_placed = False
         self.red_beacon_two_placed = False
@@ -85,29 +170,15 @@ class Powerplay(MultiAgentEnv):
         self.blue_terminal_one_captured = False
         self.red_terminal_two_captured = False
         self.blue_terminal_two_captured = False
-        
 
-        
-        
-        seed = env_config["seed"]
-        rand.seed(seed)
         self.agents = ["red_1", "red_2", "blue_1", "blue_2"]
-        self.robots = {"red_1": Robot("red_1", "red", 11, 180, rand.randint(1, 3)),
-                        "red_2": Robot("red_2", "red", 23, 180, rand.randint(1,3)),
-                        "blue_1": Robot("blue_1", "blue", 6, 0, rand.randint(1,3)),
-                        "blue_2": Robot("blue_2", "blue", 24, 0, rand.randint(1,3))}#creates the robots mapped to the agent names
+        for name in self.agents:
+            _, box_location, heading = ROBOT_STARTS[name]
+            self.robots[name].reset(box_location, heading, int(self.np_random.integers(1, 4)))
         self.action_type = {"red_1": "automated",
                             "red_2": "automated",
                             "blue_1": "automated",
                             "blue_2": "automated"}#Types of actions: junction_choice, cone_choice, to_cones, waiting
-                                                
-        self.action_space = Discrete(29)#will be action-masked down; maximum of 29 choices
-        temp = [241, 2, 30, 36, 4, 2, 2, 20, 36, 4, 2, 2, 20, 36, 4, 2, 2, 20, 36, 4, 2, 2, 20, 40, 40, 2, 2,2, 2, 30, 30, 2, 2, 2, 2]
-        
-        b = Box(low=np.array([0]*(29+len(temp))), high=np.array([2]*29 +temp), dtype=np.float64)
-        self.observation_space = Dict({'obs': b,
-                                    'action_mask': Box(low = 0, high = 1, shape = (29,),  dtype=np.float64)})
-        self.env_config = env_config
         self.time_elapsed = 0
         self.find_path_to_cones("red_1")
         self.find_path_to_cones("red_2")
@@ -125,8 +196,8 @@ class Powerplay(MultiAgentEnv):
         }
         return env_info
     def reset(self):
-        self.__init__({"seed": rand.randint(1,10000)})
-        observations = {i: self.generate_observation(i) for i in self.agents}
+        self.reset_state()
+        observations = self.generate_observations(self.agents)
         return observations
     def step(self, action_dict):
         #print("STEPPPED")
@@ -142,7 +213,7 @@ class Powerplay(MultiAgentEnv):
                 #we find it optimized to ignore the case in which the coach tells the driver to stop placing a cone on a junction if the driver is not going to miss
                 if(not(robot_ptr.targetJunctionID == action)):
 
-                    robot_ptr.path = self.junctions[action].closest_path_to(robot_ptr.box_location, robot_ptr.heading, self.graph)[0]
+                    robot_ptr.path = self.junctions[action].closest_path_to(robot_ptr.box_location, robot_ptr.heading, self.graph, self.path_table)[0]
                 #follow this path if there is stuff to follow
                 robot_ptr.targetJunctionID = action
                 b = self.simulate_movement(a)
@@ -197,9 +268,8 @@ class Powerplay(MultiAgentEnv):
 
         #determine the rewards
         #delete rewards for agents that aren't doing anything atm, since their actions are governed by computers
-        for a in self.agents:
-            if(not(self.time_elapsed < 120 and self.action_type[a] == "automated" and rewards[a] == 0)):
-                obs[a] = self.generate_observation(a)
+        obs = self.generate_observations([a for a in self.agents
+                                          if not(self.time_elapsed < 120 and self.action_type[a] == "automated" and rewards[a] == 0)])
             
         dones = {a : False for a in self.agents}
         dones["__all__"] = False
@@ -373,7 +443,7 @@ class Powerplay(MultiAgentEnv):
                             self.blue_points += 10
                             val += 10
                         
-                    self.junctions[junctionID].owned_by = "red" if robot_ptr.team == "red" else "blue"
+                    self.set_junction_owner(junctionID, "red" if robot_ptr.team == "red" else "blue")
                     if(not(previous_owner == self.junctions[junctionID].owned_by)):
                         val += 1#return +1 for stealing a junction
                 robot_ptr.holdingCone = False
@@ -389,13 +459,13 @@ class Powerplay(MultiAgentEnv):
         robot_ptr = self.robots[bot_name]
         if(robot_ptr.team == "red"):
             if self.red_stack_one.cones_held == 0: path_to_stack1, time_to_stack1 = -1, 100000 
-            else: path_to_stack1, time_to_stack1 = self.red_stack_one.closest_path_to(robot_ptr.box_location, robot_ptr.heading, self.graph)
+            else: path_to_stack1, time_to_stack1 = self.red_stack_one.closest_path_to(robot_ptr.box_location, robot_ptr.heading, self.graph, self.path_table)
             if self.red_stack_two.cones_held == 0: path_to_stack2, time_to_stack2 = -1, 100000
-            else: path_to_stack2, time_to_stack2 = self.red_stack_two.closest_path_to(robot_ptr.box_location, robot_ptr.heading, self.graph)
+            else: path_to_stack2, time_to_stack2 = self.red_stack_two.closest_path_to(robot_ptr.box_location, robot_ptr.heading, self.graph, self.path_table)
             if self.red_substation.cones_held == 0: path_to_substation, time_to_substation = -1, 100000
-            else: path_to_substation, time_to_substation = self.red_substation.closest_path_to(robot_ptr.box_location, robot_ptr.heading, self.graph)
+            else: path_to_substation, time_to_substation = self.red_substation.closest_path_to(robot_ptr.box_location, robot_ptr.heading, self.graph, self.path_table)
             if(path_to_stack1 == -1 and path_to_stack2 == -1 and path_to_substation == -1):
-                robot_ptr.path = self.junctions[0].closest_path_to(robot_ptr.box_location, robot_ptr.heading, self.graph)[0]
+                robot_ptr.path = self.junctions[0].closest_path_to(robot_ptr.box_location, robot_ptr.heading, self.graph, self.path_table)[0]
             else:
                 if(min([time_to_stack1, time_to_stack2, time_to_substation]) == time_to_substation):
                     robot_ptr.path = path_to_substation
@@ -404,12 +474,12 @@ class Powerplay(MultiAgentEnv):
                 else:
                     robot_ptr.path = path_to_stack2
         else:
-            path_to_stack1, time_to_stack1 = -1, 100000 if self.blue_stack_one.cones_held == 0 else self.blue_stack_one.closest_path_to(robot_ptr.box_location, robot_ptr.heading, self.graph)
-            path_to_stack2, time_to_stack2 = -1, 100000 if self.blue_stack_two.cones_held == 0 else self.blue_stack_two.closest_path_to(robot_ptr.box_location, robot_ptr.heading, self.graph)
-            path_to_substation, time_to_substation = -1, 100000 if self.blue_substation.cones_held == 0 else self.blue_substation.closest_path_to(robot_ptr.box_location, robot_ptr.heading, self.graph)
+            path_to_stack1, time_to_stack1 = -1, 100000 if self.blue_stack_one.cones_held == 0 else self.blue_stack_one.closest_path_to(robot_ptr.box_location, robot_ptr.heading, self.graph, self.path_table)
+            path_to_stack2, time_to_stack2 = -1, 100000 if self.blue_stack_two.cones_held == 0 else self.blue_stack_two.closest_path_to(robot_ptr.box_location, robot_ptr.heading, self.graph, self.path_table)
+            path_to_substation, time_to_substation = -1, 100000 if self.blue_substation.cones_held == 0 else self.blue_substation.closest_path_to(robot_ptr.box_location, robot_ptr.heading, self.graph, self.path_table)
 
             if(path_to_stack1 == -1 and path_to_stack2 == -1 and path_to_substation == -1):
-                robot_ptr.path = self.junctions[0].closest_path_to(robot_ptr.box_location, robot_ptr.heading, self.graph)[0]
+                robot_ptr.path = self.junctions[0].closest_path_to(robot_ptr.box_location, robot_ptr.heading, self.graph, self.path_table)[0]
             else:
                 if(min([time_to_stack1, time_to_stack2, time_to_substation]) == time_to_substation):
                     robot_ptr.path = path_to_substation
@@ -429,7 +499,17 @@ class Powerplay(MultiAgentEnv):
             elif (self.junctions[i].owned_by == "blue" and not(self.junctions[i].beaconed)):
                 blue_points += 3
         return red_points + 20 * int(red_circuit), blue_points + 20 * int(blue_circuit), red_circuit, blue_circuit
-    def find_circuit(self):#simple bfses
+    def set_junction_owner(self, junctionID, team):#every ownership change goes through here so the circuit tracker stays current
+        self.junctions[junctionID].owned_by = team
+        self.junction_owner[junctionID] = 0 if team is None else int(team == "red") + 1
+        self.circuit_tracker.set_owner(junctionID, team)
+
+    def find_circuit(self):#O(1) lookups into the incrementally maintained circuit tracker
+        red_cir = self.red_terminal_one_captured and self.red_terminal_two_captured and self.circuit_tracker.connected("red")
+        blue_circ = self.blue_terminal_one_captured and self.blue_terminal_two_captured and self.circuit_tracker.connected("blue")
+        return red_cir, blue_circ
+
+    def find_circuit_bfs(self):#simple bfses, kept as the reference for the circuit tracker
         red_cir = False
         if (self.red_terminal_one_captured and self.red_terminal_two_captured):
             stack = [4, 5, 9]
@@ -477,7 +557,7 @@ class Powerplay(MultiAgentEnv):
 
                 if (val < 4 or val >= 29):
                     continue
-                if (self.junctions[val] == -1):
+                if (self.junctions[val].owned_by == "blue"):
                     if (val in [19, 24, 25]):
                         blue_circ = True
                         break
@@ -504,59 +584,44 @@ class Powerplay(MultiAgentEnv):
         x = 0
 
     def generate_observation(self, botName):
-        action_mask = [0]*29
-        if(self.action_type[botName] == "junction"):
-            action_mask = [0.05]*29
-            jnc_to = self.robots[botName].targetJunctionID
-            
-            if(not(jnc_to is None)):
-                action_mask[jnc_to] = 1#prioritize the one it's headed to over the others if it's chosen one
-        elif(self.action_type[botName] == "cone"):
-            action_mask[0] = 1
-            action_mask[1] = 1
-        junction_owns = []
-        for a in self.junctions:
-            if(self.junctions[a].owned_by is None):
-                junction_owns.append(0)
-            else:
-                junction_owns.append(int(self.junctions[a].owned_by == "red")+1)
-        current_obs = junction_owns + [int(self.time_elapsed),
-                                                         int(self.robots[botName].team == "red"),
-                                                         int(abs(self.robots[botName].targetJunctionID + 1) if self.robots[botName].targetJunctionID is not None else 0),
-                                                         int(self.robots["red_1"].box_location),
-                                                         int(self.robots["red_1"].heading / 90.0),
-                                                         int(self.robots["red_1"].holdingCone),
-                                                         int(self.robots["red_1"].holdingBeacon),
-                                                         int(self.robots["red_1"].adjustmentPeriod * 2),
-                                                         int(self.robots["red_2"].box_location),
-                                                         int(self.robots["red_2"].heading / 90.0),
-                                                         int(self.robots["red_2"].holdingCone),
-                                                         int(self.robots["red_2"].holdingBeacon),
-                                                         int(self.robots["red_2"].adjustmentPeriod * 2),
-                                                         int(self.robots["blue_1"].box_location),
-                                                         int(self.robots["blue_1"].heading / 90.0),
-                                                         int(self.robots["blue_1"].holdingCone),
-                                                         int(self.robots["blue_1"].holdingBeacon),
-                                                         int(self.robots["blue_1"].adjustmentPeriod * 2),
-                                                         int(self.robots["blue_2"].box_location),
-                                                         int(self.robots["blue_2"].heading / 90.0),
-                                                         int(self.robots["blue_2"].holdingCone),
-                                                         int(self.robots["blue_2"].holdingBeacon),
-                                                         int(self.robots["blue_2"].adjustmentPeriod * 2),
-                                                         int(self.blue_points / 10),
-                                                         int(self.red_points / 10),
-                                                         int(self.red_beacon_one_placed+1),
-                                                         int(self.red_beacon_two_placed+1),
-                                                         int(self.blue_beacon_one_placed+1),
-                                                         int(self.blue_beacon_two_placed+1),
-                                                         int(self.blue_substation.cones_held + self.blue_stack_one.cones_held + self.blue_stack_two.cones_held),
-                                                         int(self.red_substation.cones_held + self.red_stack_one.cones_held + self.red_stack_two.cones_held),
-                                                         int(self.red_terminal_one_captured),
-                                                         int(self.blue_terminal_one_captured),
-                                                         int(self.red_terminal_two_captured),
-                                                         int(self.blue_terminal_two_captured)
-                                                         ]
-        return {"obs": np.array(current_obs, dtype=np.float64), "action_mask": np.array(action_mask, dtype=np.float64)}
+        return self.generate_observations([botName])[botName]
+
+    def generate_observations(self, botNames):
+        #the parts every agent shares are written once for all rows, then each row gets its agent-specific fields.
+        #a new array is made per call since RLlib keeps references to the observations it is handed
+        obs = np.empty((len(botNames), OBS_DIM), dtype=np.float64)
+        action_masks = np.zeros((len(botNames), 29), dtype=np.float64)
+        obs[:, 0:29] = self.junction_owner
+        obs[:, 29] = int(self.time_elapsed)
+        obs[:, 32:52] = (self.robot_state / ROBOT_OBS_DIVISOR).reshape(-1)
+        obs[:, 52:64] = (int(self.blue_points / 10),
+                         int(self.red_points / 10),
+                         int(self.red_beacon_one_placed+1),
+                         int(self.red_beacon_two_placed+1),
+                         int(self.blue_beacon_one_placed+1),
+                         int(self.blue_beacon_two_placed+1),
+                         int(self.blue_substation.cones_held + self.blue_stack_one.cones_held + self.blue_stack_two.cones_held),
+                         int(self.red_substation.cones_held + self.red_stack_one.cones_held + self.red_stack_two.cones_held),
+                         int(self.red_terminal_one_captured),
+                         int(self.blue_terminal_one_captured),
+                         int(self.red_terminal_two_captured),
+                         int(self.blue_terminal_two_captured))
+
+        observations = {}
+        for i, botName in enumerate(botNames):
+            robot_ptr = self.robots[botName]
+            obs[i, 30] = int(robot_ptr.team == "red")
+            obs[i, 31] = int(abs(robot_ptr.targetJunctionID + 1) if robot_ptr.targetJunctionID is not None else 0)
+
+            action_mask = action_masks[i]
+            if(self.action_type[botName] == "junction"):
+                action_mask[:] = 0.05
+                if(not(robot_ptr.targetJunctionID is None)):
+                    action_mask[robot_ptr.targetJunctionID] = 1#prioritize the one it's headed to over the others if it's chosen one
+            elif(self.action_type[botName] == "cone"):
+                action_mask[0:2] = 1
+            observations[botName] = {"obs": obs[i], "action_mask": action_mask}
+        return observations
 
     def render(self):
 
@@ -594,10 +659,29 @@ class Powerplay(MultiAgentEnv):
             initial = initial[:ind] + toPut + initial[ind + 1:]
         return initial
 
+def _state_field(index, cast):
+    def get(self):
+        return cast(self._state[index])
+    def set(self, value):
+        self._state[index] = value
+    return property(get, set)
+
 class Robot():
-    def __init__(self, name, team, box_location, heading, adjustmentPeriod):
+    __slots__ = ("name", "team", "_state", "gotBeacon", "adjusting", "adjustingTime", "path", "targetJunctionID", "crashed")
+    #the observed fields live in a row of the env's robot_state buffer so observations can copy them in one go
+    box_location = _state_field(0, int)
+    heading = _state_field(1, int)
+    holdingCone = _state_field(2, bool)
+    holdingBeacon = _state_field(3, bool)
+    adjustmentPeriod = _state_field(4, int)
+
+    def __init__(self, name, team, box_location, heading, adjustmentPeriod, state = None):
+        self._state = np.zeros(5) if state is None else state
         self.name = name
         self.team = team
+        self.reset(box_location, heading, adjustmentPeriod)
+
+    def reset(self, box_location, heading, adjustmentPeriod):
         self.box_location = box_location
         self.heading = heading
         self.adjustmentPeriod = adjustmentPeriod
@@ -619,19 +703,23 @@ class Robot():
         
 
 class ConeStation(): #either junction or cone station; realistically, they both store cones
+    __slots__ = ("box_locations", "owned_by", "beaconed", "junction_type", "type", "cones_held")
     def __init__(self, type : str, box_locations : list, junction_type = "NONE"):
         self.box_locations = box_locations
-        self.owned_by = None
-        self.beaconed = False
         self.junction_type = junction_type#only really used when determining junctions, not when determining cone stations
         self.type = type
-        if(type == "junction"):
+        self.reset()
+
+    def reset(self):
+        self.owned_by = None
+        self.beaconed = False
+        if(self.type == "junction"):
             self.cones_held = 0
-        elif(type == "substation"):
+        elif(self.type == "substation"):
             self.cones_held = 20
-        elif(type == "stack"):
+        elif(self.type == "stack"):
             self.cones_held = 5
-        elif(type == "terminal"):
+        elif(self.type == "terminal"):
             self.cones_held = 0
     
     def determine_value(self):
@@ -643,8 +731,7 @@ class ConeStation(): #either junction or cone station; realistically, they both
             return 3
         elif(self.junction_type == "GROUND"):
             return 2
-    def closest_path_to(self, starting_box, starting_orientation, graph):#finds the shortest path from the robot's box to this cone station
-        pathNum = 5
+    def nearest_box(self, starting_box):#the box of this station closest to starting_box as the crow flies
         shortest_box_dist = 1000000
         shortest_box_num = -1
 
@@ -657,6 +744,14 @@ class ConeStation(): #either junction or cone station; realistically, they both
             if(euclid_dist < shortest_box_dist):
                 shortest_box_dist = euclid_dist
                 shortest_box_num = box
+        return shortest_box_num
+
+    def closest_path_to(self, starting_box, starting_orientation, graph, path_table = None):#finds the shortest path from the robot's box to this cone station
+        if(path_table is not None):
+            path, time = path_table[(starting_box, starting_orientation)][self.nearest_box(starting_box)]
+            return list(path), time
+        pathNum = 5
+        shortest_box_num = self.nearest_box(starting_box)
         t = list(islice(nx.shortest_simple_paths(graph, starting_box, shortest_box_num), pathNum))
         
         bestPath = []
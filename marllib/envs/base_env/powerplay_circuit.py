@@ -0,0 +1,76 @@
+
+#incremental circuit bookkeeping for the Powerplay envs.
+#junctions 4-28 form a 5x5 lattice (lattice node = junction ID - 4); a team has a circuit when an 8-connected
+#chain of its junctions links one of its seed junctions to one of its target junctions and both its terminals are captured
+
+LATTICE_SIZE = 5
+SEEDS = {"red": (0, 1, 5), "blue": (3, 4, 9)}#junctions 4, 5, 9 and 7, 8, 13
+TARGETS = {"red": (19, 23, 24), "blue": (15, 20, 21)}#junctions 23, 27, 28 and 19, 24, 25
+_SOURCE = LATTICE_SIZE**2#virtual node joined to every owned seed
+_SINK = LATTICE_SIZE**2 + 1#virtual node joined to every owned target
+
+NEIGHBOURS = []
+for _node in range(LATTICE_SIZE**2):
+    _row, _col = divmod(_node, LATTICE_SIZE)
+    NEIGHBOURS.append(tuple(r * LATTICE_SIZE + c
+                            for r in range(_row - 1, _row + 2)
+                            for c in range(_col - 1, _col + 2)
+                            if (r, c) != (_row, _col) and 0 <= r < LATTICE_SIZE and 0 <= c < LATTICE_SIZE))
+
+
+class CircuitTracker():
+    '''
+    Per-team union-find over the junction lattice, kept up to date as junctions change owner so that
+    connected(team) is a constant-time query instead of a BFS over the lattice.
+    Union-find can't delete, so a team losing a junction rebuilds that team's sets (at most 25 nodes).
+    '''
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.owner = [None] * LATTICE_SIZE**2
+        self.parent = {team: list(range(LATTICE_SIZE**2 + 2)) for team in SEEDS}
+
+    def _find(self, team, node):
+        parent = self.parent[team]
+        while(parent[node] != node):
+            parent[node] = parent[parent[node]]#path halving
+            node = parent[node]
+        return node
+
+    def _union(self, team, a, b):
+        root_a = self._find(team, a)
+        root_b = self._find(team, b)
+        if(root_a != root_b):
+            self.parent[team][root_a] = root_b
+
+    def _add(self, team, node):
+        for neighbour in NEIGHBOURS[node]:
+            if(self.owner[neighbour] == team):
+                self._union(team, node, neighbour)
+        if(node in SEEDS[team]):
+            self._union(team, node, _SOURCE)
+        if(node in TARGETS[team]):
+            self._union(team, node, _SINK)
+
+    def _rebuild(self, team):
+        self.parent[team] = list(range(LATTICE_SIZE**2 + 2))
+        for node in range(LATTICE_SIZE**2):
+            if(self.owner[node] == team):
+                self._add(team, node)
+
+    def set_owner(self, junction_id, team):#team is "red", "blue" or None
+        node = junction_id - 4
+        if(node < 0 or node >= LATTICE_SIZE**2):#terminals aren't part of the lattice
+            return
+        previous = self.owner[node]
+        if(previous == team):
+            return
+        self.owner[node] = team
+        if(previous is not None):
+            self._rebuild(previous)
+        if(team is not None):
+            self._add(team, node)
+
+    def connected(self, team):
+        return self._find(team, _SOURCE) == self._find(team, _SINK)
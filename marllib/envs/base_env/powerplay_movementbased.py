@@ -10,6 +10,8 @@ from itertools import islice
 import numpy as np
 import random as rand
 
+from marllib.envs.base_env.powerplay_circuit import CircuitTracker
+
 policy_mapping_dict = {
     "all_scenario": {
         "description": "powerplay",
@@ -19,6 +21,26 @@ policy_mapping_dict = {
     }
 }
 
+OBS_DIM = 64
+ROBOT_STARTS = {"red_1": ("red", 11, 180),
+                "red_2": ("red", 23, 180),
+                "blue_1": ("blue", 6, 0),
+                "blue_2": ("blue", 24, 0)}#team, box_location, heading
+ROBOT_OBS_DIVISOR = np.array([1, 90.0, 1, 1, 0.5])#robot_state columns --> observation values
+
+#part of the action mask that only depends on the box: no moving or reaching for junctions off the edge of the field
+#choices are [left, right, forward, backward, junction_topleft, junction_topright, junction_botleft, junction_botright, terminal, pick_up_cone, pick_up_beacon]
+POSITION_MASK = np.ones((36, 11), dtype=np.float32)
+for _box in range(36):
+    if(_box % 6 == 0):
+        POSITION_MASK[_box, [0, 4, 6]] = 0
+    if(_box % 6 == 5):
+        POSITION_MASK[_box, [1, 5, 7]] = 0
+    if(_box < 6):#first row
+        POSITION_MASK[_box, [2, 4, 5]] = 0
+    if(_box >= 30):#last row
+        POSITION_MASK[_box, [3, 6, 7]] = 0
+
 class Powerplay(MultiAgentEnv):
 
     def __init__(self, env_config):
@@ -53,9 +75,9 @@ class Powerplay(MultiAgentEnv):
             27: ConeStation("junction", [27,28,33,34], junction_type = "LOW"),
             28: ConeStation("junction", [28,29,34,35], junction_type = "GROUND"),
         }#every junction and their corresponding ID. IDs will be used to clean up code by a lot
+        self.circuit_tracker = CircuitTracker()#kept in sync with owned_by through set_junction_owner
+        self.junction_owner = np.zeros(29)#owned_by in observation encoding: 0 --> nobody, 1 --> blue, 2 --> red
         
-        self.blue_points = 0
-        self.red_points = 0
         self.blue_substation = ConeStation("substation", [12, 18])
 
         self.red_substation = ConeStation("substation", [17, 23])
@@ -68,6 +90,32 @@ class Powerplay(MultiAgentEnv):
 
         self.red_stack_two = ConeStation("stack", [33])
 
+        self.agents = ["red_1", "red_2", "blue_1", "blue_2"]
+        self.robot_state = np.zeros((4, 5))#observed robot fields, one row per robot in agent order; see Robot
+        self.robots = {name: Robot(name, *ROBOT_STARTS[name], 1, self.robot_state[i])
+                       for i, name in enumerate(self.agents)}#creates the robots mapped to the agent names
+
+        self.action_space = Discrete(11)
+        #can be action masked down: choices are [left, right, forward, backward, junction_topleft, junction_topright, 
+        #junction_botleft, junction_botright, terminal, pick_up_cone, pick_up_beacon]
+        temp = [241, 2, 30, 36, 4, 2, 2, 20, 36, 4, 2, 2, 20, 36, 4, 2, 2, 20, 36, 4, 2, 2, 20, 40, 40, 2, 2,2, 2, 30, 30, 2, 2, 2, 2]
+        
+        b = Box(low=np.array([0]*(29+len(temp))), high=np.array([2]*29 +temp), dtype=np.float32)
+        self.observation_space = Dict({'obs': b,
+                                    'action_mask': Box(low = 0, high = 1, shape = (11,),  dtype=np.float32)})
+        self.env_config = env_config
+        self.np_random = np.random.default_rng(env_config.get("seed", None))#per-env stream, persists across resets
+        self.reset_state()
+
+
+    def reset_state(self):#reinitializes everything a match changes; the field geometry, graph and spaces are kept
+        for station in list(self.junctions.values()) + [self.blue_substation, self.red_substation, self.blue_stack_one,
+                                                        self.blue_stack_two, self.red_stack_one, self.red_stack_two]:
+            station.reset()
+        self.circuit_tracker.reset()
+        self.junction_owner[:] = 0
+        self.blue_points = 0
+        self.red_points = 0
         self.red_beacon_one_placed = False
         self.blue_beacon_one_placed = False
         self.red_beacon_two_placed = False
@@ -76,33 +124,16 @@ class Powerplay(MultiAgentEnv):
         self.blue_terminal_one_captured = False
         self.red_terminal_two_captured = False
         self.blue_terminal_two_captured = False
-        
 
-        
-        
-        seed = 1
-        rand.seed(seed)
         self.agents = ["red_1", "red_2", "blue_1", "blue_2"]
-        self.robots = {"red_1": Robot("red_1", "red", 11, 180, rand.randint(1, 3)),
-                        "red_2": Robot("red_2", "red", 23, 180, rand.randint(1,3)),
-                        "blue_1": Robot("blue_1", "blue", 6, 0, rand.randint(1,3)),
-                        "blue_2": Robot("blue_2", "blue", 24, 0, rand.randint(1,3))}#creates the robots mapped to the agent names
+        for name in self.agents:
+            _, box_location, heading = ROBOT_STARTS[name]
+            self.robots[name].reset(box_location, heading, int(self.np_random.integers(1, 4)))
         self.action_type = {"red_1": "choice",
                             "red_2": "choice",
                             "blue_1": "choice",
                             "blue_2": "choice"}#Types of actions: junction_choice, cone_choice, to_cones, waiting
-                                                
-        self.action_space = Discrete(11)
-        #can be action masked down: choices are [left, right, forward, backward, junction_topleft, junction_topright, 
-        #junction_botleft, junction_botright, terminal, pick_up_cone, pick_up_beacon]
-        temp = [241, 2, 30, 36, 4, 2, 2, 20, 36, 4, 2, 2, 20, 36, 4, 2, 2, 20, 36, 4, 2, 2, 20, 40, 40, 2, 2,2, 2, 30, 30, 2, 2, 2, 2]
-        
-        b = Box(low=np.array([0]*(29+len(temp))), high=np.array([2]*29 +temp), dtype=np.float32)
-        self.observation_space = Dict({'obs': b,
-                                    'action_mask': Box(low = 0, high = 1, shape = (11,),  dtype=np.float32)})
-        self.env_config = env_config
         self.time_elapsed = 0
-        
 
 
     def get_env_info(self):
@@ -115,8 +146,8 @@ class Powerplay(MultiAgentEnv):
         }
         return env_info
     def reset(self):
-        self.__init__({"seed": rand.randint(1,10000)})
-        observations = {i: self.generate_observation(i) for i in self.agents}
+        self.reset_state()
+        observations = self.generate_observations(self.agents)
         return observations
     def step(self, action_dict):
         #print("STEPPPED")
@@ -233,7 +264,7 @@ class Powerplay(MultiAgentEnv):
                                 junc.beaconed = True
                                 robot_ptr.gotBeacon = True
                             rewards[a] += junc.determine_value()
-                            junc.owned_by = robot_ptr.team
+                            self.set_junction_owner(robot_ptr.junction_to, robot_ptr.team)
                             if(robot_ptr.team == "red"):
                                 self.red_points += junc.determine_value()
                             else:
@@ -262,9 +293,8 @@ class Powerplay(MultiAgentEnv):
 
         #determine the rewards
         #delete rewards for agents that aren't doing anything atm, since their actions are governed by computers
-        for a in self.agents:
-            if(not(self.time_elapsed < 120 and self.action_type[a] == "automated" and rewards[a] == 0)):
-                obs[a] = self.generate_observation(a)
+        obs = self.generate_observations([a for a in self.agents
+                                          if not(self.time_elapsed < 120 and self.action_type[a] == "automated" and rewards[a] == 0)])
             
         dones = {a : False for a in self.agents}
         dones["__all__"] = False
@@ -381,7 +411,17 @@ class Powerplay(MultiAgentEnv):
             elif (self.junctions[i].owned_by == "blue" and not(self.junctions[i].beaconed)):
                 blue_points += 3
         return red_points + 20 * int(red_circuit), blue_points + 20 * int(blue_circuit), red_circuit, blue_circuit
-    def find_circuit(self):#simple bfses
+    def set_junction_owner(self, junctionID, team):#every ownership change goes through here so the circuit tracker stays current
+        self.junctions[junctionID].owned_by = team
+        self.junction_owner[junctionID] = 0 if team is None else int(team == "red") + 1
+        self.circuit_tracker.set_owner(junctionID, team)
+
+    def find_circuit(self):#O(1) lookups into the incrementally maintained circuit tracker
+        red_cir = self.red_terminal_one_captured and self.red_terminal_two_captured and self.circuit_tracker.connected("red")
+        blue_circ = self.blue_terminal_one_captured and self.blue_terminal_two_captured and self.circuit_tracker.connected("blue")
+        return red_cir, blue_circ
+
+    def find_circuit_bfs(self):#simple bfses, kept as the reference for the circuit tracker
         red_cir = False
         if (self.red_terminal_one_captured and self.red_terminal_two_captured):
             stack = [4, 5, 9]
@@ -429,7 +469,7 @@ class Powerplay(MultiAgentEnv):
 
                 if (val < 4 or val >= 29):
                     continue
-                if (self.junctions[val] == -1):
+                if (self.junctions[val].owned_by == "blue"):
                     if (val in [19, 24, 25]):
                         blue_circ = True
                         break
@@ -456,88 +496,51 @@ class Powerplay(MultiAgentEnv):
         x = 0
 
     def generate_observation(self, botName):
-        action_mask = [1]*11
-        robot_ptr = self.robots[botName]
-
-        #determine valid moves
-        #choices are [left, right, forward, backward, junction_topleft, junction_topright, junction_botleft, junction_botright, terminal, pick_up_cone, pick_up_beacon]
-        if(robot_ptr.box_location % 6 == 0):
-            action_mask[0] = 0
-            action_mask[4] = 0
-            action_mask[6] = 0
-        if(robot_ptr.box_location % 6 == 5):
-            action_mask[1] = 0
-            action_mask[5] = 0
-            action_mask[7] = 0
-        if(robot_ptr.box_location < 6):#first row
-            action_mask[2] = 0
-            action_mask[4] = 0
-            action_mask[5] = 0
-        if(robot_ptr.box_location >= 30):#last row
-            action_mask[3] = 0
-            action_mask[6] = 0
-            action_mask[7] = 0
-        if(not(robot_ptr.holdingBeacon or robot_ptr.holdingCone)):
-            action_mask[4] = 0
-            action_mask[5] = 0
-            action_mask[6] = 0
-            action_mask[7] = 0
-            action_mask[8] = 0
-            substationAt = self.findSubstation(botName)
-            if(substationAt == None or substationAt.cones_held == 0):
-                action_mask[9] = 0
-                action_mask[10] = 0
-        if(robot_ptr.holdingBeacon or robot_ptr.holdingCone):
-            action_mask[9] = 0
-            action_mask[10] = 0
-        if(robot_ptr.adjusting):
-            action_mask = [0]*11
-        if(self.time_elapsed <= 90 or robot_ptr.gotBeacon):
-            action_mask[10] = 0
-        
-        junction_owns = []
-        for a in self.junctions:
-            if(self.junctions[a].owned_by is None):
-                junction_owns.append(0)
+        return self.generate_observations([botName])[botName]
+
+    def generate_observations(self, botNames):
+        #the parts every agent shares are written once for all rows, then each row gets its agent-specific fields.
+        #a new array is made per call since RLlib keeps references to the observations it is handed
+        obs = np.empty((len(botNames), OBS_DIM), dtype=np.float32)
+        action_masks = np.empty((len(botNames), 11), dtype=np.float32)
+        obs[:, 0:29] = self.junction_owner
+        obs[:, 29] = int(self.time_elapsed)
+        obs[:, 32:52] = (self.robot_state / ROBOT_OBS_DIVISOR).reshape(-1)
+        obs[:, 52:64] = (int(self.blue_points / 10),
+                         int(self.red_points / 10),
+                         int(self.red_beacon_one_placed+1),
+                         int(self.red_beacon_two_placed+1),
+                         int(self.blue_beacon_one_placed+1),
+                         int(self.blue_beacon_two_placed+1),
+                         int(self.blue_substation.cones_held + self.blue_stack_one.cones_held + self.blue_stack_two.cones_held),
+                         int(self.red_substation.cones_held + self.red_stack_one.cones_held + self.red_stack_two.cones_held),
+                         int(self.red_terminal_one_captured),
+                         int(self.blue_terminal_one_captured),
+                         int(self.red_terminal_two_captured),
+                         int(self.blue_terminal_two_captured))
+
+        observations = {}
+        for i, botName in enumerate(botNames):
+            robot_ptr = self.robots[botName]
+            obs[i, 30] = int(robot_ptr.team == "red")
+            obs[i, 31] = int(abs(robot_ptr.junction_to + 1) if robot_ptr.junction_to is not None else 0)
+
+            #determine valid moves
+            action_mask = action_masks[i]
+            action_mask[:] = POSITION_MASK[robot_ptr.box_location]
+            if(not(robot_ptr.holdingBeacon or robot_ptr.holdingCone)):
+                action_mask[4:9] = 0
+                substationAt = self.findSubstation(botName)
+                if(substationAt == None or substationAt.cones_held == 0):
+                    action_mask[9:11] = 0
             else:
-                junction_owns.append(int(self.junctions[a].owned_by == "red")+1)
-        current_obs = junction_owns + [int(self.time_elapsed),
-                                                         int(self.robots[botName].team == "red"),
-                                                         int(abs(self.robots[botName].junction_to + 1) if self.robots[botName].junction_to is not None else 0),
-                                                         int(self.robots["red_1"].box_location),
-                                                         int(self.robots["red_1"].heading / 90.0),
-                                                         int(self.robots["red_1"].holdingCone),
-                                                         int(self.robots["red_1"].holdingBeacon),
-                                                         int(self.robots["red_1"].adjustmentPeriod * 2),
-                                                         int(self.robots["red_2"].box_location),
-                                                         int(self.robots["red_2"].heading / 90.0),
-                                                         int(self.robots["red_2"].holdingCone),
-                                                         int(self.robots["red_2"].holdingBeacon),
-                                                         int(self.robots["red_2"].adjustmentPeriod * 2),
-                                                         int(self.robots["blue_1"].box_location),
-                                                         int(self.robots["blue_1"].heading / 90.0),
-                                                         int(self.robots["blue_1"].holdingCone),
-                                                         int(self.robots["blue_1"].holdingBeacon),
-                                                         int(self.robots["blue_1"].adjustmentPeriod * 2),
-                                                         int(self.robots["blue_2"].box_location),
-                                                         int(self.robots["blue_2"].heading / 90.0),
-                                                         int(self.robots["blue_2"].holdingCone),
-                                                         int(self.robots["blue_2"].holdingBeacon),
-                                                         int(self.robots["blue_2"].adjustmentPeriod * 2),
-                                                         int(self.blue_points / 10),
-                                                         int(self.red_points / 10),
-                                                         int(self.red_beacon_one_placed+1),
-                                                         int(self.red_beacon_two_placed+1),
-                                                         int(self.blue_beacon_one_placed+1),
-                                                         int(self.blue_beacon_two_placed+1),
-                                                         int(self.blue_substation.cones_held + self.blue_stack_one.cones_held + self.blue_stack_two.cones_held),
-                                                         int(self.red_substation.cones_held + self.red_stack_one.cones_held + self.red_stack_two.cones_held),
-                                                         int(self.red_terminal_one_captured),
-                                                         int(self.blue_terminal_one_captured),
-                                                         int(self.red_terminal_two_captured),
-                                                         int(self.blue_terminal_two_captured)
-                                                         ]
-        return {"obs": np.array(current_obs, dtype=np.float32), "action_mask": np.array(action_mask, dtype=np.float32)}
+                action_mask[9:11] = 0
+            if(robot_ptr.adjusting):
+                action_mask[:] = 0
+            if(self.time_elapsed <= 90 or robot_ptr.gotBeacon):
+                action_mask[10] = 0
+            observations[botName] = {"obs": obs[i], "action_mask": action_mask}
+        return observations
 
     def render(self):
 
@@ -576,10 +579,29 @@ class Powerplay(MultiAgentEnv):
             initial = initial[:ind] + toPut + initial[ind + 1:]
         return initial
 
+def _state_field(index, cast):
+    def get(self):
+        return cast(self._state[index])
+    def set(self, value):
+        self._state[index] = value
+    return property(get, set)
+
 class Robot():
-    def __init__(self, name, team, box_location, heading, adjustmentPeriod):
+    __slots__ = ("name", "team", "_state", "gotBeacon", "adjusting", "adjustingTime", "path", "junction_to", "crashed")
+    #the observed fields live in a row of the env's robot_state buffer so observations can copy them in one go
+    box_location = _state_field(0, int)
+    heading = _state_field(1, int)
+    holdingCone = _state_field(2, bool)
+    holdingBeacon = _state_field(3, bool)
+    adjustmentPeriod = _state_field(4, int)
+
+    def __init__(self, name, team, box_location, heading, adjustmentPeriod, state = None):
+        self._state = np.zeros(5) if state is None else state
         self.name = name
         self.team = team
+        self.reset(box_location, heading, adjustmentPeriod)
+
+    def reset(self, box_location, heading, adjustmentPeriod):
         self.box_location = box_location
         self.heading = heading
         self.adjustmentPeriod = adjustmentPeriod
@@ -601,19 +623,23 @@ class Robot():
         
 
 class ConeStation(): #either junction or cone station; realistically, they both store cones
+    __slots__ = ("box_locations", "owned_by", "beaconed", "junction_type", "type", "cones_held")
     def __init__(self, type : str, box_locations : list, junction_type = "NONE"):
         self.box_locations = box_locations
-        self.owned_by = None
-        self.beaconed = False
         self.junction_type = junction_type#only really used when determining junctions, not when determining cone stations
         self.type = type
-        if(type == "junction"):
+        self.reset()
+
+    def reset(self):
+        self.owned_by = None
+        self.beaconed = False
+        if(self.type == "junction"):
             self.cones_held = 0
-        elif(type == "substation"):
+        elif(self.type == "substation"):
             self.cones_held = 20
-        elif(type == "stack"):
+        elif(self.type == "stack"):
             self.cones_held = 5
-        elif(type == "terminal"):
+        elif(self.type == "terminal"):
             self.cones_held = 0
     
     def determine_value(self):
@@ -0,0 +1,366 @@
+import numpy as np
+from gym.spaces import Discrete, Dict, Box
+
+from marllib.envs.base_env.powerplay_movementbased import policy_mapping_dict
+
+# static field geometry shared by every match. Junction IDs follow the scalar env: 0-3 are the terminals,
+# 4-28 are the 5x5 junction lattice laid row by row over the 6x6 box grid
+AGENTS = ["red_1", "red_2", "blue_1", "blue_2"]
+NUM_AGENTS = 4
+NUM_JUNCTIONS = 29
+NUM_ACTIONS = 11
+OBS_DIM = 64
+EPISODE_TIME = 120
+
+TEAM_RED = np.array([True, True, False, False])
+TEAM_INDEX = np.array([0, 0, 1, 1])  # 0 --> red, 1 --> blue
+OWNER_CODE = np.array([2, 2, 1, 1])  # matches the observation encoding: 0 --> nobody, 1 --> blue, 2 --> red
+START_BOX = np.array([11, 23, 6, 24])
+START_HEADING = np.array([180, 180, 0, 0])
+
+JUNCTION_VALUE = np.zeros(NUM_JUNCTIONS, dtype=np.int64)
+JUNCTION_VALUE[4:] = np.array([[2, 3, 2, 3, 2],
+                               [3, 4, 5, 4, 3],
+                               [2, 5, 2, 5, 2],
+                               [3, 4, 5, 4, 3],
+                               [2, 3, 2, 3, 2]]).reshape(-1)  # GROUND = 2, LOW = 3, MEDIUM = 4, HIGH = 5
+
+# junction reached from a box by actions 4-7 (topleft, topright, botleft, botright), -1 if there is none
+JUNCTION_AT = np.full((36, 4), -1, dtype=np.int64)
+for _box in range(36):
+    _row, _col = divmod(_box, 6)
+    for _k, (_jr, _jc) in enumerate([(_row - 1, _col - 1), (_row - 1, _col), (_row, _col - 1), (_row, _col)]):
+        if 0 <= _jr < 5 and 0 <= _jc < 5:
+            JUNCTION_AT[_box, _k] = 4 + _jr * 5 + _jc
+
+# terminal bits are ordered like the observation: red_one, blue_one, red_two, blue_two
+TERMINAL_AT = np.full(36, -1, dtype=np.int64)
+TERMINAL_AT[[0, 5, 35, 30]] = [0, 1, 2, 3]
+
+# cone stations: red_substation, red_stack_one, red_stack_two, blue_substation, blue_stack_one, blue_stack_two
+STATION_CONES = np.array([20, 5, 5, 20, 5, 5], dtype=np.int64)
+STATION_AT = np.full((2, 36), -1, dtype=np.int64)
+STATION_AT[0, [17, 23, 3, 33]] = [0, 0, 1, 2]
+STATION_AT[1, [12, 18, 2, 32]] = [3, 3, 4, 5]
+
+MOVE_DELTA = np.array([-1, 1, -6, 6], dtype=np.int64)
+
+# circuit seeds/targets on the 5x5 lattice (junction ID - 4)
+CIRCUIT_SEEDS = {0: [0, 1, 5], 1: [3, 4, 9]}
+CIRCUIT_TARGETS = {0: [19, 23, 24], 1: [15, 20, 21]}
+
+_CRASH_PAIRS = [(a, b) for a in range(NUM_AGENTS) for b in range(a + 1, NUM_AGENTS)]
+
+
+def lattice_circuit(owned, seeds, targets):
+    """
+    Vectorized version of the Powerplay.find_circuit flood fill.
+    owned is a [N, 25] bool array of the junctions held by one team; returns a [N] bool array that is True where
+    an 8-connected chain of owned junctions links a seed junction to a target junction.
+    """
+    owned = owned.reshape(-1, 5, 5)
+    reach = np.zeros_like(owned)
+    reach.reshape(-1, 25)[:, seeds] = True
+    reach &= owned
+    while True:
+        padded = np.pad(reach, ((0, 0), (1, 1), (1, 1)))
+        grown = reach.copy()
+        for dr in range(3):
+            for dc in range(3):
+                grown |= padded[:, dr:dr + 5, dc:dc + 5]
+        grown &= owned
+        if (grown == reach).all():
+            break
+        reach = grown
+    return reach.reshape(-1, 25)[:, targets].any(axis=1)
+
+
+class PowerplayVecEnv:
+    """
+    N movement-based Powerplay matches simulated in lock-step.
+
+    Every match follows the rules of powerplay_movementbased.Powerplay, but the state is held in [N, ...] NumPy
+    arrays and one call to step() advances all matches at once. Actions are passed as an [N, 4] int array in
+    AGENTS order, where -1 stands for an agent that did not act this step. Finished matches are frozen until they
+    are reset with reset(env_ids).
+    """
+
+    def __init__(self, env_config):
+        self.env_config = env_config
+        self.num_envs = int(env_config.get("num_envs", 1))
+        self.rng = np.random.default_rng(env_config.get("seed", None))
+        self.agents = list(AGENTS)
+
+        self.action_space = Discrete(NUM_ACTIONS)
+        temp = [241, 2, 30, 36, 4, 2, 2, 20, 36, 4, 2, 2, 20, 36, 4, 2, 2, 20, 36, 4, 2, 2, 20, 40, 40, 2, 2, 2, 2,
+                30, 30, 2, 2, 2, 2]
+        b = Box(low=np.array([0] * (29 + len(temp))), high=np.array([2] * 29 + temp), dtype=np.float32)
+        self.observation_space = Dict({'obs': b,
+                                       'action_mask': Box(low=0, high=1, shape=(NUM_ACTIONS,), dtype=np.float32)})
+
+        n = self.num_envs
+        # match state
+        self.time_elapsed = np.zeros(n, dtype=np.float64)
+        self.finished = np.zeros(n, dtype=bool)
+        self.owner = np.zeros((n, NUM_JUNCTIONS), dtype=np.int64)
+        self.beaconed = np.zeros((n, NUM_JUNCTIONS), dtype=bool)
+        self.station_cones = np.zeros((n, len(STATION_CONES)), dtype=np.int64)
+        self.points = np.zeros((n, 2), dtype=np.int64)  # red, blue
+        self.terminal_captured = np.zeros((n, 4), dtype=bool)
+        self.beacon_placed = np.zeros((n, 4), dtype=bool)
+        # robot state
+        self.box = np.zeros((n, NUM_AGENTS), dtype=np.int64)
+        self.heading = np.zeros((n, NUM_AGENTS), dtype=np.int64)
+        self.adjustment_period = np.zeros((n, NUM_AGENTS), dtype=np.int64)
+        self.adjusting_time = np.zeros((n, NUM_AGENTS), dtype=np.float64)
+        self.junction_to = np.zeros((n, NUM_AGENTS), dtype=np.int64)
+        self.got_beacon = np.zeros((n, NUM_AGENTS), dtype=bool)
+        self.holding_beacon = np.zeros((n, NUM_AGENTS), dtype=bool)
+        self.holding_cone = np.zeros((n, NUM_AGENTS), dtype=bool)
+        self.adjusting = np.zeros((n, NUM_AGENTS), dtype=bool)
+        self.crashed = np.zeros((n, NUM_AGENTS), dtype=bool)
+        self.automated = np.zeros((n, NUM_AGENTS), dtype=bool)  # action_type "automated" vs "choice"
+
+        self._reset_state(np.arange(n))
+
+    def get_env_info(self):
+        env_info = {
+            "space_obs": self.observation_space,
+            "space_act": self.action_space,
+            "num_agents": NUM_AGENTS,
+            "num_envs": self.num_envs,
+            "episode_limit": 400,
+            "policy_mapping_info": policy_mapping_dict
+        }
+        return env_info
+
+    def _reset_state(self, idx):
+        self.time_elapsed[idx] = 0
+        self.finished[idx] = False
+        self.owner[idx] = 0
+        self.beaconed[idx] = False
+        self.station_cones[idx] = STATION_CONES
+        self.points[idx] = 0
+        self.terminal_captured[idx] = False
+        self.beacon_placed[idx] = False
+        self.box[idx] = START_BOX
+        self.heading[idx] = START_HEADING
+        self.adjustment_period[idx] = self.rng.integers(1, 4, size=(len(idx), NUM_AGENTS))
+        self.adjusting_time[idx] = 0
+        self.junction_to[idx] = -1
+        self.got_beacon[idx] = False
+        self.holding_beacon[idx] = False
+        self.holding_cone[idx] = False
+        self.adjusting[idx] = False
+        self.crashed[idx] = False
+        self.automated[idx] = False
+
+    def reset(self, env_ids=None):
+        """
+        Resets the given matches (all of them by default) and returns the batched observation of every match.
+        """
+        if env_ids is None:
+            env_ids = np.arange(self.num_envs)
+        self._reset_state(np.asarray(env_ids, dtype=np.int64).reshape(-1))
+        return self.generate_observation()
+
+    def step(self, actions):
+        """
+        actions: [N, 4] int array, -1 for agents without an action.
+        returns obs ({"obs": [N, 4, 64], "action_mask": [N, 4, 11]}), rewards [N, 4], dones [N] and an info dict
+        whose "active" [N, 4] mask marks the agents the scalar env would have returned an observation for.
+        """
+        actions = np.asarray(actions, dtype=np.int64)
+        live = ~self.finished
+        rewards = np.zeros((self.num_envs, NUM_AGENTS), dtype=np.float64)
+
+        # agents act one after another, exactly like the scalar env, but each agent is handled for all matches at once
+        for i in range(NUM_AGENTS):
+            act = actions[:, i]
+            box = self.box[:, i]
+            choice = live & ~self.automated[:, i]
+            auto = live & self.automated[:, i]
+
+            # move left/right/forward/backward
+            rows = np.nonzero(choice & (act >= 0) & (act <= 3))[0]
+            self.box[rows, i] += MOVE_DELTA[act[rows]]
+            rewards[rows, i] -= 1
+
+            # start placing on one of the four surrounding junctions
+            rows = np.nonzero(choice & (act >= 4) & (act <= 7))[0]
+            self.automated[rows, i] = True
+            self.adjusting[rows, i] = True
+            self.adjusting_time[rows, i] = self.adjustment_period[rows, i]
+            self.junction_to[rows, i] = JUNCTION_AT[box[rows], act[rows] - 4]
+
+            # capture a terminal
+            rows = np.nonzero(choice & (act == 8))[0]
+            terminal = TERMINAL_AT[box[rows]]
+            at_terminal = terminal >= 0
+            t_rows, terminal = rows[at_terminal], terminal[at_terminal]
+            rewards[t_rows, i] += np.where(self.terminal_captured[t_rows, terminal], -1, 3)
+            self.terminal_captured[t_rows, terminal] = True
+            self.points[rows, TEAM_INDEX[i]] += 1
+
+            # pick up a cone or a beacon
+            rows = np.nonzero(choice & ((act == 9) | (act == 10)))[0]
+            self.holding_cone[rows[act[rows] == 9], i] = True
+            self.holding_beacon[rows[act[rows] == 10], i] = True
+            station = STATION_AT[TEAM_INDEX[i], box[rows]]
+            at_station = station >= 0
+            self.station_cones[rows[at_station], station[at_station]] -= 1
+
+            # waiting out a crash
+            waiting = auto & self.crashed[:, i] & (self.adjusting_time[:, i] != 0) & ~self.adjusting[:, i]
+            self.adjusting_time[waiting, i] -= 0.5
+            self.automated[waiting & (self.adjusting_time[:, i] == 0), i] = False
+
+            # putting a cone on a pole
+            placing = auto & ~waiting & self.adjusting[:, i]
+            self.adjusting_time[placing, i] -= 0.5
+            rows = np.nonzero(placing & (self.adjusting_time[:, i] == 0))[0]
+            junction = self.junction_to[rows, i]
+            already_beaconed = self.beaconed[rows, junction]
+            rewards[rows[already_beaconed], i] -= 5
+            rows, junction = rows[~already_beaconed], junction[~already_beaconed]
+            beacon = self.holding_beacon[rows, i]
+            rewards[rows[beacon], i] += 6
+            self.beaconed[rows[beacon], junction[beacon]] = True
+            self.got_beacon[rows[beacon], i] = True
+            rewards[rows, i] += JUNCTION_VALUE[junction]
+            self.owner[rows, junction] = OWNER_CODE[i]
+            self.points[rows, TEAM_INDEX[i]] += JUNCTION_VALUE[junction]
+            rows = np.nonzero(placing & (self.adjusting_time[:, i] == 0))[0]
+            self.automated[rows, i] = False
+            self.junction_to[rows, i] = -1
+            self.adjusting[rows, i] = False
+            self.crashed[rows, i] = False
+
+        # crashes between robots sharing a box
+        for a, b in _CRASH_PAIRS:
+            hit = (live & ~self.crashed[:, a] & ~self.crashed[:, b] & (self.box[:, a] == self.box[:, b])
+                   & ~self.adjusting[:, a] & ~self.adjusting[:, b])
+            for r in (a, b):
+                self.crashed[hit, r] = True
+                self.adjusting_time[hit, r] = 1
+                self.automated[hit, r] = True
+
+        active = live[:, None] & ~((self.time_elapsed < EPISODE_TIME)[:, None] & self.automated & (rewards == 0))
+        obs = self.generate_observation()
+
+        ending = live & (self.time_elapsed >= EPISODE_TIME)
+        if ending.any():
+            self._final_rewards(np.nonzero(ending)[0], rewards)
+            self.finished |= ending
+        self.time_elapsed[live] += 0.5
+
+        return obs, rewards, self.finished.copy(), {"active": active}
+
+    def find_circuit(self, rows=None):
+        """
+        Returns the red and blue circuit flags ([N] bool arrays) of the given matches.
+        """
+        if rows is None:
+            rows = np.arange(self.num_envs)
+        lattice = self.owner[rows, 4:]
+        terminals = self.terminal_captured[rows]
+        red_circ = terminals[:, 0] & terminals[:, 2] & lattice_circuit(lattice == 2, CIRCUIT_SEEDS[0],
+                                                                       CIRCUIT_TARGETS[0])
+        blue_circ = terminals[:, 1] & terminals[:, 3] & lattice_circuit(lattice == 1, CIRCUIT_SEEDS[1],
+                                                                        CIRCUIT_TARGETS[1])
+        return red_circ, blue_circ
+
+    def _final_rewards(self, rows, rewards):
+        # same terms, in the same order, as the end of Powerplay.step
+        red_circ, blue_circ = self.find_circuit(rows)
+        red_p = self.points[rows, 0] + 20 * red_circ.astype(np.int64)
+        blue_p = self.points[rows, 1] + 20 * blue_circ.astype(np.int64)
+        red = rewards[rows, :2]
+        blue = rewards[rows, 2:]
+        red += (red_p / 5)[:, None]
+        blue += (blue_p / 5)[:, None]
+
+        period = self.adjustment_period[rows]
+        red_faster = period[:, 0] + period[:, 1] < period[:, 2] + period[:, 3]
+
+        f = red_faster
+        red[f] -= np.where(red_p < blue_p, blue_p / 5, blue_p / 10)[f][:, None]
+        blue[f & (red_p >= blue_p)] -= (red_p / 10)[f & (red_p >= blue_p)][:, None]
+        red[f] += np.where(red_circ, 15, -13)[f][:, None]
+        blue[f] += np.where(red_circ, -8, 10)[f][:, None]
+        red[f] += np.where(blue_circ, -7, 8)[f][:, None]
+        blue[f] += np.where(blue_circ, 15, -7)[f][:, None]
+
+        f = ~red_faster
+        blue[f] -= np.where(blue_p < red_p, red_p / 5, red_p / 10)[f][:, None]
+        red[f] -= (blue_p / 10)[f][:, None]
+        blue[f] += np.where(blue_circ, 5, -15)[f][:, None]
+        red[f] += np.where(blue_circ, -5, 10)[f][:, None]
+        blue[f] += np.where(red_circ, -7, 7)[f][:, None]
+        red[f] += np.where(red_circ, 15, -5)[f][:, None]
+
+        rewards[rows, :2] = red
+        rewards[rows, 2:] = blue
+
+    def generate_action_mask(self):
+        box = self.box
+        col = box % 6
+        holding = self.holding_beacon | self.holding_cone
+        station = STATION_AT[TEAM_INDEX[None, :], box]
+        cones = np.take_along_axis(self.station_cones, np.maximum(station, 0), axis=1)
+        no_cones = (station < 0) | (cones == 0)
+
+        mask = np.ones(box.shape + (NUM_ACTIONS,), dtype=np.float32)
+        mask[col == 0, :] *= _MASK_LEFT
+        mask[col == 5, :] *= _MASK_RIGHT
+        mask[box < 6, :] *= _MASK_TOP
+        mask[box >= 30, :] *= _MASK_BOTTOM
+        mask[~holding, :] *= _MASK_EMPTY_HANDED
+        mask[~holding & no_cones, 9:] = 0
+        mask[holding, 9:] = 0
+        mask[self.adjusting, :] = 0
+        mask[(self.time_elapsed <= 90)[:, None] | self.got_beacon, 10] = 0
+        return mask
+
+    def generate_observation(self):
+        """
+        Builds the observation of every agent of every match. The match-wide block is computed once and broadcast to
+        the four agents; only the team flag and junction target differ per agent.
+        """
+        n = self.num_envs
+        obs = np.empty((n, NUM_AGENTS, OBS_DIM), dtype=np.float32)
+        obs[:, :, 0:29] = self.owner[:, None, :]
+        obs[:, :, 29] = np.floor(self.time_elapsed)[:, None]
+        obs[:, :, 30] = TEAM_RED
+        obs[:, :, 31] = self.junction_to + 1
+        robots = np.stack([self.box,
+                           self.heading // 90,
+                           self.holding_cone,
+                           self.holding_beacon,
+                           self.adjustment_period * 2], axis=2).reshape(n, 1, 20)
+        obs[:, :, 32:52] = robots
+        obs[:, :, 52] = (self.points[:, 1] // 10)[:, None]
+        obs[:, :, 53] = (self.points[:, 0] // 10)[:, None]
+        obs[:, :, 54:58] = (self.beacon_placed + 1)[:, None, :]
+        obs[:, :, 58] = self.station_cones[:, 3:].sum(axis=1)[:, None]
+        obs[:, :, 59] = self.station_cones[:, :3].sum(axis=1)[:, None]
+        obs[:, :, 60:64] = self.terminal_captured[:, None, :]
+        return {"obs": obs, "action_mask": self.generate_action_mask()}
+
+    def close(self):
+        pass
+
+
+def _mask_without(*actions):
+    m = np.ones(NUM_ACTIONS, dtype=np.float32)
+    m[list(actions)] = 0
+    return m
+
+
+# choices are [left, right, forward, backward, junction_topleft, junction_topright, junction_botleft,
+# junction_botright, terminal, pick_up_cone, pick_up_beacon]
+_MASK_LEFT = _mask_without(0, 4, 6)
+_MASK_RIGHT = _mask_without(1, 5, 7)
+_MASK_TOP = _mask_without(2, 4, 5)
+_MASK_BOTTOM = _mask_without(3, 6, 7)
+_MASK_EMPTY_HANDED = _mask_without(4, 5, 6, 7, 8)
@@ -0,0 +1,64 @@
+from collections.abc import MutableMapping
+import importlib
+
+
+class LazyEnvRegistry(MutableMapping):
+    """
+    Maps environment names to env classes, importing each env module only when its entry is first looked up.
+    Entries are given as "module.path:ClassName". A failed import resolves to the error message string, so
+    registry[name] behaves like the old eagerly built registry. Classes assigned directly are stored as-is.
+    """
+
+    def __init__(self, paths):
+        self._paths = dict(paths)
+        self._resolved = {}
+
+    def _resolve(self, name):
+        if name not in self._resolved:
+            module_name, class_name = self._paths[name].split(":")
+            try:
+                self._resolved[name] = getattr(importlib.import_module(module_name), class_name)
+            except Exception as e:
+                self._resolved[name] = str(e)
+        return self._resolved[name]
+
+    def __getitem__(self, name):
+        if name not in self._paths and name not in self._resolved:
+            raise KeyError(name)
+        return self._resolve(name)
+
+    def __setitem__(self, name, env_class):
+        self._paths.pop(name, None)
+        self._resolved[name] = env_class
+
+    def __delitem__(self, name):
+        if name not in self._paths and name not in self._resolved:
+            raise KeyError(name)
+        self._paths.pop(name, None)
+        self._resolved.pop(name, None)
+
+    def __contains__(self, name):
+        return name in self._paths or name in self._resolved
+
+    def __iter__(self):
+        return iter(dict.fromkeys(list(self._paths) + list(self._resolved)))
+
+    def __len__(self):
+        return len(set(self._paths) | set(self._resolved))
+
+    def error(self, name):
+        """
+        Import error message of an env, or None if it is ready. Imports the env module if it hasn't been yet.
+        """
+        env_class = self[name]
+        return env_class if isinstance(env_class, str) else None
+
+    def status(self):
+        """
+        [name, "Ready"/"Error", error message] rows for every registered env. Imports every env module.
+        """
+        rows = []
+        for name in self:
+            error = self.error(name)
+            rows.append([name, "Error" if error else "Ready", error or "Null"])
+        return rows
@@ -10,7 +10,6 @@ import yaml
 import os
 import sys
 from copy import deepcopy
-from tabulate import tabulate
 
 with open(os.path.join(os.path.dirname(__file__), "ray/ray.yaml"), "r") as f:
     CONFIG_DICT = yaml.load(f, Loader=yaml.FullLoader)
@@ -89,29 +88,14 @@ def make_env(environment_name,
     env_config = env_config.set_ray()
     
 
-    # initialize env
-    env_reg_ls = []
-    check_current_used_env_flag = False
-    for env_n in ENV_REGISTRY.keys():
-        if isinstance(ENV_REGISTRY[env_n], str):  # error
-            info = [env_n, "Error", ENV_REGISTRY[env_n], "envs/base_env/config/{}.yaml".format(env_n),
-                    "envs/base_env/{}.py".format(env_n)]
-            env_reg_ls.append(info)
-        else:
-            info = [env_n, "Ready", "Null", "envs/base_env/config/{}.yaml".format(env_n),
-                    "envs/base_env/{}.py".format(env_n)]
-            env_reg_ls.append(info)
-            if env_n == env_config["env"]:
-                check_current_used_env_flag = True
-
-    print(tabulate(env_reg_ls,
-                   headers=['Env_Name', 'Check_Status', "Error_Log", "Config_File_Location", "Env_File_Location"],
-                   tablefmt='grid'))
-
-    if not check_current_used_env_flag:
+    # initialize env, only the chosen env module gets imported
+    registry = COOP_ENV_REGISTRY if env_config["force_coop"] else ENV_REGISTRY
+    if env_config["env"] not in registry:
+        raise ValueError("environment \"{}\" not registered yet, see envs/base_env/__init__.py".format(env_config["env"]))
+    if registry.error(env_config["env"]):
         raise ValueError(
-            "environment \"{}\" not installed properly or not registered yet, please see the Error_Log below".format(
-                env_config["env"]))
+            "environment \"{}\" not installed properly, error log: {}\nconfig file: envs/base_env/config/{}.yaml".format(
+                env_config["env"], registry.error(env_config["env"]), env_config["env"]))
 
     env_reg_name = env_config["env"] + "_" + env_config["env_args"]["map_name"]
 
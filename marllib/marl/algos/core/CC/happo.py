@@ -22,8 +22,57 @@ from marllib.marl.algos.utils.centralized_critic_hetero import (
 from ray.rllib.examples.centralized_critic import CentralizedValueMixin
 from marllib.marl.algos.utils.setup_utils import get_device
 from ray.rllib.agents.ppo.ppo_torch_policy import PPOTorchPolicy, KLCoeffMixin
+import functools
 import torch
-from marllib.marl.algos.utils.heterogeneous_updateing import update_m_advantage, get_each_agent_train
+from marllib.marl.algos.utils.heterogeneous_updateing import (
+    get_each_agent_group_train,
+    update_agent_group,
+    update_group_m_advantage,
+)
+
+
+def happo_agent_update(iter_train_info, m_advantage):
+    """Clipped surrogate step of one agent's actor against m_advantage, returns its surrogate loss, entropy and KL."""
+    iter_model, iter_dist_class, iter_train_batch, iter_mask, \
+        iter_reduce_mean, iter_actions, iter_policy, iter_prev_action_logp = iter_train_info
+
+    iter_model.train()
+
+    iter_prev_action_dist = iter_dist_class(iter_train_batch[SampleBatch.ACTION_DIST_INPUTS], iter_model)
+
+    iter_logits, iter_state = iter_model(iter_train_batch)
+    iter_current_action_dist = iter_dist_class(iter_logits, iter_model)
+    logp_ratio = torch.exp(iter_current_action_dist.logp(iter_actions) - iter_prev_action_logp)
+
+    iter_action_kl = iter_prev_action_dist.kl(iter_current_action_dist)
+    iter_mean_kl_loss = iter_reduce_mean(iter_action_kl)
+
+    iter_curr_entropy = iter_current_action_dist.entropy()
+    iter_mean_entropy = iter_reduce_mean(iter_curr_entropy)
+
+    iter_surrogate_loss = torch.min(
+        m_advantage * logp_ratio,
+        m_advantage * torch.clamp(
+            logp_ratio, 1 - iter_policy.config["clip_param"], 1 + iter_policy.config["clip_param"]
+        )
+    )
+
+    iter_surrogate_loss = iter_reduce_mean(iter_surrogate_loss)
+
+    torch.autograd.set_detect_anomaly(True)
+
+    current_lr = (
+        iter_policy.cur_lr / iter_model.custom_config['critic_lr'] * iter_model.custom_config['actor_lr']
+    )
+
+    iter_model.update_actor(
+        loss=iter_surrogate_loss + iter_policy.entropy_coeff * iter_mean_entropy -
+             iter_policy.kl_coeff * iter_mean_kl_loss,
+        lr=current_lr,
+        grad_clip=iter_policy.config['grad_clip'],
+    )
+
+    return iter_surrogate_loss, iter_mean_entropy, iter_mean_kl_loss
 
 
 def happo_surrogate_loss(
@@ -59,63 +108,24 @@ def happo_surrogate_loss(
 
     m_advantage = train_batch[Postprocessing.ADVANTAGES]
 
-    for i, iter_train_info in enumerate(get_each_agent_train(model, policy, dist_class, train_batch)):
-        iter_model, iter_dist_class, iter_train_batch, iter_mask, \
-            iter_reduce_mean, iter_actions, iter_policy, iter_prev_action_logp = iter_train_info
-
-        iter_model.train()
-
-        iter_prev_action_dist = iter_dist_class(iter_train_batch[SampleBatch.ACTION_DIST_INPUTS], iter_model)
-
-        iter_logits, iter_state = iter_model(iter_train_batch)
-        iter_current_action_dist = iter_dist_class(iter_logits, iter_model)
-        logp_ratio = torch.exp(iter_current_action_dist.logp(iter_actions) - iter_prev_action_logp)
+    group_size = policy.config["model"]["custom_model_config"].get("update_group_size", 1)
 
-        iter_action_kl = iter_prev_action_dist.kl(iter_current_action_dist)
-        iter_mean_kl_loss = iter_reduce_mean(iter_action_kl)
+    for group in get_each_agent_group_train(model, policy, dist_class, train_batch, group_size):
+        group_results = update_agent_group(functools.partial(happo_agent_update, m_advantage=m_advantage), group)
 
-        iter_curr_entropy = iter_current_action_dist.entropy()
-        iter_mean_entropy = iter_reduce_mean(iter_curr_entropy)
-
-        if iter_model == model:
-            reduce_mean_valid = iter_reduce_mean
-            mean_entropy = iter_mean_entropy
-            mean_kl_loss = iter_mean_kl_loss
-
-        iter_surrogate_loss = torch.min(
-            m_advantage * logp_ratio,
-            m_advantage * torch.clamp(
-                logp_ratio, 1 - iter_policy.config["clip_param"], 1 + iter_policy.config["clip_param"]
-            )
-        )
+        for iter_train_info, (iter_surrogate_loss, iter_mean_entropy, iter_mean_kl_loss) in zip(group, group_results):
+            iter_model, _, _, _, iter_reduce_mean, _, _, _ = iter_train_info
 
-        iter_surrogate_loss = iter_reduce_mean(iter_surrogate_loss)
+            if iter_model == model:
+                reduce_mean_valid = iter_reduce_mean
+                mean_entropy = iter_mean_entropy
+                mean_kl_loss = iter_mean_kl_loss
 
-        policies_loss += iter_surrogate_loss
+            policies_loss += iter_surrogate_loss
 
-        torch.autograd.set_detect_anomaly(True)
-
-        current_lr = (
-            iter_policy.cur_lr / iter_model.custom_config['critic_lr'] * iter_model.custom_config['actor_lr']
-        )
-
-        iter_model.update_actor(
-            loss=iter_surrogate_loss + iter_policy.entropy_coeff * iter_mean_entropy -
-                 iter_policy.kl_coeff * iter_mean_kl_loss,
-            lr=current_lr,
-            grad_clip=iter_policy.config['grad_clip'],
-        )
-
-        m_advantage = update_m_advantage(
-            iter_model=iter_model,
-            iter_train_batch=iter_train_batch,
-            iter_actions=iter_actions,
-            m_advantage=m_advantage,
-            iter_dist_class=iter_dist_class,
-            iter_prev_action_logp=iter_prev_action_logp
-        )
+        m_advantage = update_group_m_advantage(group, m_advantage)
 
-        agent_num += 1
+        agent_num += len(group)
 
     mean_policy_loss = policies_loss / agent_num
 
@@ -4,6 +4,7 @@ __author__: minquan
 __data__: May-15
 """
 
+import functools
 import logging
 from typing import List, Type, Union
 from ray.rllib.models.torch.torch_action_dist import TorchDistributionWrapper
@@ -24,8 +25,13 @@ from marllib.marl.algos.utils.centralized_critic_hetero import (
     hatrpo_post_process,
 )
 
-from marllib.marl.algos.utils.trust_regions import TrustRegionUpdator
-from marllib.marl.algos.utils.heterogeneous_updateing import update_m_advantage, get_each_agent_train, get_mask_and_reduce_mean
+from marllib.marl.algos.utils.trust_regions import TrustRegionUpdator, average_metrics, trust_region_stats
+from marllib.marl.algos.utils.heterogeneous_updateing import (
+    get_each_agent_group_train,
+    get_mask_and_reduce_mean,
+    update_agent_group,
+    update_group_m_advantage,
+)
 
 from ray.rllib.examples.centralized_critic import CentralizedValueMixin
 from marllib.marl.algos.utils.setup_utils import get_device
@@ -47,6 +53,36 @@ def get_trpo_loss(reduce_mean, mask, logp_ratio, advantages):
     return loss
 
 
+def hatrpo_agent_update(iter_agent_info, m_advantage):
+    """Trust-region update of one agent's actor against m_advantage, returns its surrogate loss and the update metrics."""
+    iter_model, iter_dist_class, iter_train_batch, iter_mask, \
+        iter_reduce_mean, iter_actions, iter_policy, iter_prev_action_logp = iter_agent_info
+
+    iter_logits, iter_state = iter_model(iter_train_batch)
+    iter_current_action_dist = iter_dist_class(iter_logits, iter_model)
+    iter_prev_action_logp = iter_train_batch[SampleBatch.ACTION_LOGP]
+    iter_logp_ratio = torch.exp(iter_current_action_dist.logp(iter_actions) - iter_prev_action_logp)
+
+    iter_loss = get_trpo_loss(
+        reduce_mean=iter_reduce_mean,
+        mask=iter_mask,
+        logp_ratio=iter_logp_ratio,
+        advantages=m_advantage
+    )
+
+    trust_region_updator = TrustRegionUpdator(
+        model=iter_model,
+        dist_class=iter_dist_class,
+        train_batch=iter_train_batch,
+        adv_targ=m_advantage.to(device=get_device()),
+        initialize_policy_loss=iter_loss.to(device=get_device()),
+    )
+
+    trust_region_updator.update(update_critic=False)
+
+    return iter_loss, trust_region_updator.metrics
+
+
 def hatrpo_loss_fn(
         policy: Policy, model: ModelV2,
         dist_class: Type[TorchDistributionWrapper],
@@ -112,50 +148,29 @@ def hatrpo_loss_fn(
 
     agent_num = 1
 
-    print('')
-    for i, iter_agent_info in enumerate(get_each_agent_train(model, policy, dist_class, train_batch)):
-        print(i, end=' ')
-        iter_model, iter_dist_class, iter_train_batch, iter_mask, \
-            iter_reduce_mean, iter_actions, iter_policy, iter_prev_action_logp = iter_agent_info
-
-        iter_logits, iter_state = iter_model(iter_train_batch)
-        iter_current_action_dist = iter_dist_class(iter_logits, iter_model)
-        iter_prev_action_logp = iter_train_batch[SampleBatch.ACTION_LOGP]
-        iter_logp_ratio = torch.exp(iter_current_action_dist.logp(iter_actions) - iter_prev_action_logp)
-
-        iter_loss = get_trpo_loss(
-            reduce_mean=iter_reduce_mean,
-            mask=iter_mask,
-            logp_ratio=iter_logp_ratio,
-            advantages=m_advantage
-        )
-
-        loss += iter_loss
-
-        trust_region_updator = TrustRegionUpdator(
-            model=iter_model,
-            dist_class=iter_dist_class,
-            train_batch=iter_train_batch,
-            adv_targ=m_advantage.to(device=get_device()),
-            initialize_policy_loss=iter_loss.to(device=get_device()),
-        )
-
-        trust_region_updator.update(update_critic=False)
-
-        m_advantage = update_m_advantage(
-            iter_model=iter_model,
-            iter_dist_class=iter_dist_class,
-            iter_train_batch=iter_train_batch,
-            iter_actions=iter_actions,
-            m_advantage=m_advantage,
-            iter_prev_action_logp=iter_prev_action_logp
-        )
-
-        agent_num += 1
+    trust_region_metrics = []
+
+    group_size = policy.config["model"]["custom_model_config"].get("update_group_size", 1)
+
+    for group in get_each_agent_group_train(model, policy, dist_class, train_batch, group_size):
+        # the updators switch cudnn off for the double backward, which is a global flag,
+        # so it stays off while the agents of a group are updated concurrently
+        with torch.backends.cudnn.flags(enabled=False):
+            group_results = update_agent_group(functools.partial(hatrpo_agent_update, m_advantage=m_advantage), group)
+
+        for iter_loss, iter_metrics in group_results:
+            loss += iter_loss
+            trust_region_metrics.append(iter_metrics)
+
+        m_advantage = update_group_m_advantage(group, m_advantage)
+
+        agent_num += len(group)
 
     model.value_function = vf_saved
     # recovery the value function.
 
+    policy.trust_region_metrics = average_metrics(trust_region_metrics)
+
     total_loss = reduce_mean_valid(policy.kl_coeff * action_kl +
                                                   policy.config["vf_loss_coeff"] * vf_loss -
                                                   policy.entropy_coeff * curr_entropy
@@ -184,6 +199,7 @@ HAPTRPOTorchPolicy = PPOTorchPolicy.with_updates(
         get_default_config=lambda: PPO_CONFIG,
         postprocess_fn=hatrpo_post_process,
         loss_fn=hatrpo_loss_fn,
+        stats_fn=trust_region_stats,
         before_init=setup_torch_mixins,
         extra_grad_process_fn=apply_grad_clipping,
         mixins=[
@@ -3,7 +3,7 @@ from ray.rllib.agents.ppo.ppo_torch_policy import PPOTorchPolicy, KLCoeffMixin
 from ray.rllib.agents.ppo.ppo import PPOTrainer, DEFAULT_CONFIG as PPO_CONFIG
 from ray.rllib.policy.torch_policy import LearningRateSchedule, EntropyCoeffSchedule
 from marllib.marl.algos.utils.centralized_critic import CentralizedValueMixin, centralized_critic_postprocessing
-from marllib.marl.algos.utils.trust_regions import TrustRegionUpdator
+from marllib.marl.algos.utils.trust_regions import TrustRegionUpdator, trust_region_stats, trust_region_step
 from ray.rllib.policy.policy import Policy
 from ray.rllib.models.modelv2 import ModelV2
 from typing import List, Type, Union
@@ -144,7 +144,8 @@ def centre_critic_trpo_loss_fn(
 
 
 def apply_gradients(policy, gradients) -> None:
-    policy.trpo_updator.update()
+    # the parameters were already moved by trust_region_step, the optimizer must not step on top of it
+    pass
 
 
 MATRPOTorchPolicy = PPOTorchPolicy.with_updates(
@@ -152,6 +153,8 @@ MATRPOTorchPolicy = PPOTorchPolicy.with_updates(
     get_default_config=lambda: PPO_CONFIG,
     postprocess_fn=centralized_critic_postprocessing,
     loss_fn=centre_critic_trpo_loss_fn,
+    stats_fn=trust_region_stats,
+    extra_grad_process_fn=trust_region_step,
     apply_gradients_fn=apply_gradients,
     before_init=setup_torch_mixins,
     mixins=[
@@ -560,6 +560,12 @@ IDDPG_DEFAULT_CONFIG = DDPGTrainer.merge_trainer_configs(
         "policy_model": {},
         "normalize_actions": False,
         "clip_actions": False,
+        # Keep replayed episodes in memory-mapped files under this
+        # directory instead of in RAM (see MmapEpisodeStore).
+        "replay_directory": None,
+        # Per-column storage codecs for replay, e.g. {"obs": "uint8"} (see
+        # EpisodeStore).
+        "replay_codecs": None,
     },
     _allow_unknown_configs=True,
 )
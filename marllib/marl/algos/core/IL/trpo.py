@@ -21,7 +21,7 @@ from marllib.marl.algos.utils.setup_utils import setup_torch_mixins
 from marllib.marl.algos.utils.centralized_critic_hetero import trpo_post_process
 
 
-from marllib.marl.algos.utils.trust_regions import TrustRegionUpdator
+from marllib.marl.algos.utils.trust_regions import TrustRegionUpdator, trust_region_stats, trust_region_step
 
 from ray.rllib.examples.centralized_critic import CentralizedValueMixin
 from icecream import ic
@@ -140,8 +140,8 @@ def trpo_loss_fn(
 
 
 def apply_gradients(policy, gradients) -> None:
-    # print('\nstep into apply updater!')
-    policy.trpo_updator.update()
+    # the parameters were already moved by trust_region_step, the optimizer must not step on top of it
+    pass
 
 
 TRPOTorchPolicy = PPOTorchPolicy.with_updates(
@@ -149,6 +149,8 @@ TRPOTorchPolicy = PPOTorchPolicy.with_updates(
         get_default_config=lambda: PPO_CONFIG,
         postprocess_fn=trpo_post_process,
         loss_fn=trpo_loss_fn,
+        stats_fn=trust_region_stats,
+        extra_grad_process_fn=trust_region_step,
         before_init=setup_torch_mixins,
         apply_gradients_fn=apply_gradients,
         mixins=[
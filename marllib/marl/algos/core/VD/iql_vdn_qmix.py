@@ -22,6 +22,15 @@ from marllib.marl.models.zoo.mlp.jointQ_mlp import JointQ_MLP
 from marllib.marl.models.zoo.mixer import QMixer, VDNMixer
 from marllib.marl.algos.utils.episode_execution_plan import episode_execution_plan
 
+
+def _unroll(model, obs_tensor):
+    # JointQ models unroll all timesteps in one pass, others are stepped
+    # through time by RLlib's _unroll_mac
+    if hasattr(model, "unroll"):
+        return model.unroll(obs_tensor)[0]
+    return _unroll_mac(model, obs_tensor)
+
+
 # original _unroll_mac for next observation is different from Pymarl.
 # thus we provide a new JointQLoss here
 class JointQLoss(nn.Module):
@@ -54,7 +63,8 @@ class JointQLoss(nn.Module):
                 action_mask,
                 next_action_mask,
                 state=None,
-                next_state=None):
+                next_state=None,
+                weights=None):
         """Forward pass of the loss.
 
         Args:
@@ -68,6 +78,8 @@ class JointQLoss(nn.Module):
             next_action_mask: Tensor of shape [B, T, n_agents, n_actions]
             state: Tensor of shape [B, T, state_dim] (optional)
             next_state: Tensor of shape [B, T, state_dim] (optional)
+            weights: Tensor of shape [B, T, 1] of importance weights from
+                prioritized replay (optional)
         """
 
         # Assert either none or both of state and next_state are given
@@ -84,42 +96,38 @@ class JointQLoss(nn.Module):
         whole_obs = torch.cat((obs[:, 0:1], next_obs), axis=1)
 
         # Calculate estimated Q-Values
-        mac_out = _unroll_mac(self.model, whole_obs)
+        mac_out = _unroll(self.model, whole_obs)
 
         # Pick the Q-Values for the actions taken -> [B * n_agents, T]
         chosen_action_qvals = torch.gather(
             mac_out[:, :-1], dim=3, index=actions.unsqueeze(3)).squeeze(3)
 
-        # Calculate the Q-Values necessary for the target
-
-        target_mac_out = _unroll_mac(self.target_model, whole_obs)
-
-        # we only need target_mac_out for raw next_obs part
-        target_mac_out = target_mac_out[:, 1:]
-
         # Mask out unavailable actions for the t+1 step
         ignore_action_tp1 = (next_action_mask == 0) & (mask == 1).unsqueeze(-1)
-        target_mac_out[ignore_action_tp1] = -np.inf
-
-        # Max over target Q-Values
-        if self.double_q:
-            # large bugs here in original QMixloss, the gradient is calculated
-            # we fix this follow pymarl
-            mac_out_tp1 = mac_out.clone().detach()
-            mac_out_tp1 = mac_out_tp1[:, 1:]
-
-            # mask out unallowed actions
-            mac_out_tp1[ignore_action_tp1] = -np.inf
 
-            # obtain best actions at t+1 according to policy NN
-            cur_max_actions = mac_out_tp1.argmax(dim=3, keepdim=True)
-
-            # use the target network to estimate the Q-values of policy
-            # network's selected actions
-            target_max_qvals = torch.gather(target_mac_out, 3,
-                                            cur_max_actions).squeeze(3)
-        else:
-            target_max_qvals = target_mac_out.max(dim=3)[0]
+        # Calculate the Q-Values necessary for the target, no gradient flows
+        # through them
+        with torch.no_grad():
+            # we only need target_mac_out for raw next_obs part
+            target_mac_out = _unroll(self.target_model, whole_obs)[:, 1:]
+            target_mac_out = target_mac_out.masked_fill(ignore_action_tp1,
+                                                        -np.inf)
+
+            # Max over target Q-Values
+            if self.double_q:
+                # large bugs here in original QMixloss, the gradient is calculated
+                # we fix this follow pymarl
+                # obtain best actions at t+1 according to policy NN, with
+                # unallowed actions masked out
+                cur_max_actions = mac_out[:, 1:].detach().masked_fill(
+                    ignore_action_tp1, -np.inf).argmax(dim=3, keepdim=True)
+
+                # use the target network to estimate the Q-values of policy
+                # network's selected actions
+                target_max_qvals = torch.gather(target_mac_out, 3,
+                                                cur_max_actions).squeeze(3)
+            else:
+                target_max_qvals = target_mac_out.max(dim=3)[0]
 
         assert target_max_qvals.min().item() != -np.inf, \
             "target_max_qvals contains a masked action; \
@@ -128,7 +136,9 @@ class JointQLoss(nn.Module):
         # Mix
         if self.mixer is not None:
             chosen_action_qvals = self.mixer(chosen_action_qvals, state)
-            target_max_qvals = self.target_mixer(target_max_qvals, next_state)
+            with torch.no_grad():
+                target_max_qvals = self.target_mixer(target_max_qvals,
+                                                     next_state)
 
         # Calculate 1-step Q-Learning targets
         targets = rewards + self.gamma * (1 - terminated) * target_max_qvals
@@ -142,7 +152,10 @@ class JointQLoss(nn.Module):
         masked_td_error = td_error * mask
 
         # Normal L2 loss, take mean over actual data
-        loss = (masked_td_error ** 2).sum() / mask.sum()
+        if weights is not None:
+            loss = (weights * masked_td_error ** 2).sum() / mask.sum()
+        else:
+            loss = (masked_td_error ** 2).sum() / mask.sum()
         return loss, mask, masked_td_error, chosen_action_qvals, targets
 
 
@@ -324,17 +337,31 @@ class JointQPolicy(Policy):
         ]
         if self.has_env_global_state:
             input_list.extend([env_global_state, next_env_global_state])
-
-        output_list, _, seq_lens = \
-            chop_into_sequences(
-                episode_ids=samples[SampleBatch.EPS_ID],
-                unroll_ids=samples[SampleBatch.UNROLL_ID],
-                agent_indices=samples[SampleBatch.AGENT_INDEX],
-                feature_columns=input_list,
-                state_columns=[],  # RNN states not used here
-                max_seq_len=self.config["model"]["max_seq_len"],
-                dynamic_max=True)
+        # replayed episodes carry importance weights and their buffer slots
+        replayed = "weights" in samples and "batch_indexes" in samples
+        if replayed:
+            input_list.extend([samples["weights"], samples["batch_indexes"]])
+
+        if samples.get(SampleBatch.SEQ_LENS) is not None and \
+                getattr(samples, "zero_padded", False):
+            # the episode replay buffer already laid each episode out as one
+            # zero-padded sequence, nothing left to chop
+            output_list = input_list
+            seq_lens = samples[SampleBatch.SEQ_LENS]
+        else:
+            output_list, _, seq_lens = \
+                chop_into_sequences(
+                    episode_ids=samples[SampleBatch.EPS_ID],
+                    unroll_ids=samples[SampleBatch.UNROLL_ID],
+                    agent_indices=samples[SampleBatch.AGENT_INDEX],
+                    feature_columns=input_list,
+                    state_columns=[],  # RNN states not used here
+                    max_seq_len=self.config["model"]["max_seq_len"],
+                    dynamic_max=True)
         # These will be padded to shape [B * T, ...]
+        if replayed:
+            weights, batch_indexes = output_list[-2:]
+            output_list = output_list[:-2]
         if self.has_env_global_state:
             (rew, action_mask, next_action_mask, act, dones, obs, next_obs,
              env_global_state, next_env_global_state) = output_list
@@ -381,7 +408,9 @@ class JointQPolicy(Policy):
         loss_out, mask, masked_td_error, chosen_action_qvals, targets = (
             self.loss(rewards, actions, terminated, mask, obs, next_obs,
                       action_mask, next_action_mask, env_global_state,
-                      next_env_global_state))
+                      next_env_global_state,
+                      to_batches(weights, torch.float).unsqueeze(2)
+                      if replayed else None))
 
         # Optimise
         self.optimiser.zero_grad()
@@ -400,7 +429,13 @@ class JointQPolicy(Policy):
                             mask_elems,
             "target_mean": (targets * mask).sum().item() / mask_elems,
         }
-        return {LEARNER_STATS_KEY: stats}
+        out = {LEARNER_STATS_KEY: stats}
+        if replayed:
+            # mean absolute TD error of each episode, for prioritized replay
+            out["td_error"] = (masked_td_error.abs().sum((1, 2)) /
+                               mask.sum((1, 2))).detach().cpu().numpy()
+            out["batch_indexes"] = np.reshape(batch_indexes, [B, T])[:, 0]
+        return out
 
     @override(Policy)
     def get_initial_state(self):  # initial RNN state
@@ -453,6 +488,7 @@ class JointQPolicy(Policy):
     def _get_group_rewards(self, info_batch):
         group_rewards = np.array([
             info.get("_group_rewards", [0.0] * self.n_agents)
+            if info is not None else [0.0] * self.n_agents  # padding
             for info in info_batch
         ])
         return group_rewards
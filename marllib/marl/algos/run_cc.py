@@ -3,6 +3,7 @@ from ray import tune
 from ray.rllib.utils.framework import try_import_tf, try_import_torch
 from marllib.marl.algos.scripts import POlICY_REGISTRY
 from marllib.marl.common import recursive_dict_update, merge_default_and_customized
+from marllib.marl.models.zoo.tracing import ModelTracingCallbacks
 
 tf1, tf, tfv = try_import_tf()
 torch, nn = try_import_torch()
@@ -108,6 +109,9 @@ def run_cc(algo_config, env, model, stop=None):
         "evaluation_interval": algo_config["evaluation_interval"],
         "simple_optimizer": False  # force using better optimizer
     }
+    if algo_config["model_arch_args"].get("trace_capacity", 0):
+        # report the model traces in result["info"]["model_trace"]
+        common_config["callbacks"] = ModelTracingCallbacks
 
     stop_config = {
         "episode_reward_mean": algo_config["stop_reward"],
@@ -15,7 +15,7 @@ from ray.rllib.models import ModelCatalog
 from marllib.marl.algos.core.CC.mappo import MAPPOTrainer
 from marllib.marl.algos.utils.log_dir_util import available_local_dir
 from marllib.marl.algos.utils.setup_utils import AlgVar
-from marllib.envs.base_env.powerplay_movementbased import Powerplay
+from marllib.envs.base_env import ENV_REGISTRY
 import json
 import numpy as np
 from ray.rllib.policy.rnn_sequencing import add_time_dimension
@@ -24,6 +24,8 @@ torch, nn = try_import_torch()
 
 
 def run_test(algo_config, env, model, stop=None):
+    # resolved here, so that importing marllib does not load the powerplay env and its dependencies
+    Powerplay = ENV_REGISTRY["powerplay_movementbased"]
     ray.init(local_mode=algo_config["local_mode"])
 
     ########################
@@ -40,6 +40,7 @@ def run_happo(model_class, config_dict, common_config, env_dict, stop, restore):
     config_dict['actor_lr'] = lr
     config_dict['critic_lr'] = critic_lr
     config_dict['gain'] = _param['gain']
+    config_dict['update_group_size'] = _param.get('update_group_size', 1)
 
     seed = random.randint(0, 10)
 
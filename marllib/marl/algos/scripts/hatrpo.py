@@ -24,6 +24,8 @@ def run_hatrpo(model_class, config_dict, common_config, env_dict, stop, restore)
     TrustRegionUpdator.accept_ratio = accept_ratio
     TrustRegionUpdator.critic_lr = critic_lr
 
+    config_dict['update_group_size'] = _param.get('update_group_size', 1)
+
     train_batch_size = _param["batch_episode"] * env_dict["episode_limit"]
     if "fixed_batch_timesteps" in config_dict:
         train_batch_size = config_dict["fixed_batch_timesteps"]
@@ -35,6 +35,9 @@ def run_joint_q(model_class, config_dict, common_config, env_dict, stop, restore
     epsilon_timesteps = _param["epsilon_timesteps"]
     reward_standardize = _param["reward_standardize"]
     optimizer = _param["optimizer"]
+    prioritized_replay = _param["prioritized_replay"]
+    prioritized_replay_alpha = _param["prioritized_replay_alpha"]
+    prioritized_replay_beta = _param["prioritized_replay_beta"]
 
     mixer_dict = {
         "qmix": "qmix",
@@ -65,12 +68,20 @@ def run_joint_q(model_class, config_dict, common_config, env_dict, stop, restore
                 "final_epsilon": final_epsilon,
                 "epsilon_timesteps": epsilon_timesteps,
             },
-            "mixer": mixer_dict[algorithm]
+            "mixer": mixer_dict[algorithm],
+            "prioritized_replay": prioritized_replay,
+            "prioritized_replay_alpha": prioritized_replay_alpha,
+            "prioritized_replay_beta": prioritized_replay_beta,
+            "prioritized_replay_eps": 1e-6,
         })
 
     JointQ_Config["reward_standardize"] = reward_standardize  # this may affect the final performance if you turn it on
     JointQ_Config["optimizer"] = optimizer
     JointQ_Config["training_intensity"] = None
+    JointQ_Config["padded_episode_replay"] = True  # replay hands JointQPolicy episodes already padded to [B, T]
+    JointQ_Config["shared_memory_replay"] = False  # ingest rollouts on a thread, see episode_execution_plan
+    JointQ_Config["replay_directory"] = None  # keep replay in memory-mapped files there, see MmapEpisodeStore
+    JointQ_Config["replay_codecs"] = None  # per-column storage codecs, e.g. {"obs": "uint8"}, see EpisodeStore
 
     JQTrainer = JointQTrainer.with_updates(
         name=algorithm.upper(),
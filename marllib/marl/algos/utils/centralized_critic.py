@@ -22,6 +22,99 @@ class CentralizedValueMixin:
         self.compute_central_vf = self.model.central_value_function
 
 
+def _aligned(column, length):
+    # an opponent's rows matched to the agent's `length` timesteps: cut if
+    # longer, the last rows repeated if shorter
+    if len(column) >= length:
+        return column[:length]
+    return np.concatenate([column, column[2 * len(column) - length:]])
+
+
+def _central_inputs(custom_config, sample_batch, others, need_opponents):
+    """
+    The central critic's state and opponent actions for one agent, with
+    `others` the other agents' (agent_id, batch) pairs in collector order.
+    """
+    obs_dim = get_dim(custom_config["space_obs"]["obs"].shape)
+    action_mask_dim = custom_config["space_act"].n if custom_config["mask_flag"] else 0
+    length = len(sample_batch)
+    if custom_config["global_state_flag"]:  # include self obs and global state
+        state = sample_batch['obs'][:, action_mask_dim:]
+    else:
+        # must stack in order for the consistency
+        other_obs = {agent_id: batch["obs"] for agent_id, batch in others}
+        state = np.stack([
+            _aligned(other_obs[agent_name][:, action_mask_dim:action_mask_dim + obs_dim], length)
+            if agent_name in other_obs else sample_batch['obs'][:, action_mask_dim:action_mask_dim + obs_dim]
+            for agent_name in custom_config['agent_name_ls']], 1)
+    if not need_opponents:
+        return state, None
+    opponent_actions = np.stack(
+        [_aligned(batch["actions"], length) for _, batch in others[:custom_config["num_agents"] - 1]], 1)
+    return state, opponent_actions
+
+
+def _central_vf_preds(policy, sample_batch, other_agent_batches, episode, need_opponents):
+    """
+    State, opponent actions and central value predictions for `sample_batch`.
+
+    The collector postprocesses an episode's agents one after another, each
+    call seeing the others' batches. The first call of an agent of `policy`
+    builds the inputs of every agent of that policy and runs the central
+    value function once over all of them; later calls for the other agents
+    pick up their share from `episode.user_data`.
+    """
+    custom_config = policy.config["model"]["custom_model_config"]
+    others = list(other_agent_batches.items()) if other_agent_batches is not None else []
+    own = [agent_name for agent_name in custom_config['agent_name_ls'] if agent_name not in dict(others)]
+    if episode is None or len(own) != 1:
+        state, opponent_actions = _central_inputs(
+            custom_config, sample_batch, [(agent_id, batch) for agent_id, (_, batch) in others], need_opponents)
+        agents = {None: (sample_batch, state, opponent_actions)}
+        _compute_central_vf(policy, agents)
+        return agents[None]
+
+    shared = episode.user_data.get("_central_vf")
+    if shared is None or shared["batches"].get(own[0]) is not sample_batch:
+        # first agent of this postprocessing round, the others come in this order
+        shared = {
+            "order": own + [agent_id for agent_id, _ in others],
+            "batches": dict([(own[0], sample_batch)] + [(agent_id, batch) for agent_id, (_, batch) in others]),
+            "policies": dict([(own[0], policy)] + [(agent_id, p) for agent_id, (p, _) in others]),
+            "results": {},
+        }
+        episode.user_data["_central_vf"] = shared
+    if own[0] not in shared["results"]:
+        agents = {}
+        for agent_id in shared["order"]:
+            if shared["policies"][agent_id] is policy and agent_id not in shared["results"]:
+                batch = shared["batches"][agent_id]
+                agents[agent_id] = (batch,) + _central_inputs(
+                    custom_config, batch,
+                    [(k, shared["batches"][k]) for k in shared["order"] if k != agent_id], need_opponents)
+        _compute_central_vf(policy, agents)
+        shared["results"].update(agents)
+    return shared["results"].pop(own[0])
+
+
+def _compute_central_vf(policy, agents):
+    # one forward pass over the concatenated inputs, split back per agent
+    custom_config = policy.config["model"]["custom_model_config"]
+    opp_action_in_cc = custom_config["opp_action_in_cc"]
+    inputs = list(agents.values())
+    vf_preds = policy.compute_central_vf(
+        convert_to_torch_tensor(np.concatenate([state for _, state, _ in inputs]), policy.device),
+        convert_to_torch_tensor(
+            np.concatenate([opponent_actions for _, _, opponent_actions in inputs]),
+            policy.device) if opp_action_in_cc else None,
+    ).cpu().detach().numpy()
+    vf_preds = np.split(vf_preds, np.cumsum([len(batch) for batch, _, _ in inputs])[:-1])
+    for (agent_id, (batch, state, opponent_actions)), preds in zip(agents.items(), vf_preds):
+        if custom_config["algorithm"] in ["coma"]:
+            preds = np.take(preds, np.expand_dims(batch["actions"], axis=1)).squeeze(axis=1)
+        agents[agent_id] = (state, opponent_actions, preds)
+
+
 def centralized_critic_postprocessing(policy,
                                       sample_batch,
                                       other_agent_batches=None,
@@ -29,88 +122,23 @@ def centralized_critic_postprocessing(policy,
     custom_config = policy.config["model"]["custom_model_config"]
     pytorch = custom_config["framework"] == "torch"
     obs_dim = get_dim(custom_config["space_obs"]["obs"].shape)
-    algorithm = custom_config["algorithm"]
     opp_action_in_cc = custom_config["opp_action_in_cc"]
     global_state_flag = custom_config["global_state_flag"]
-    mask_flag = custom_config["mask_flag"]
-
-    if mask_flag:
-        action_mask_dim = custom_config["space_act"].n
-    else:
-        action_mask_dim = 0
 
     n_agents = custom_config["num_agents"]
     opponent_agents_num = n_agents - 1
 
     if (pytorch and hasattr(policy, "compute_central_vf")) or \
             (not pytorch and policy.loss_initialized()):
-
-        if not opp_action_in_cc and global_state_flag:
-            sample_batch["state"] = sample_batch['obs'][:, action_mask_dim:]
-            sample_batch[SampleBatch.VF_PREDS] = policy.compute_central_vf(
-                convert_to_torch_tensor(
-                    sample_batch["state"], policy.device),
-            ).cpu().detach().numpy()
-        else:  # need opponent info
+        need_opponents = opp_action_in_cc or not global_state_flag
+        if need_opponents:
             assert other_agent_batches is not None
-            opponent_batch_list = list(other_agent_batches.values())
-            raw_opponent_batch = [opponent_batch_list[i][1] for i in range(opponent_agents_num)]
-            opponent_batch = []
-            for one_opponent_batch in raw_opponent_batch:
-                if len(one_opponent_batch) == len(sample_batch):
-                    pass
-                else:
-                    if len(one_opponent_batch) > len(sample_batch):
-                        one_opponent_batch = one_opponent_batch.slice(0, len(sample_batch))
-                    else:  # len(one_opponent_batch) < len(sample_batch):
-                        length_dif = len(sample_batch) - len(one_opponent_batch)
-                        one_opponent_batch = one_opponent_batch.concat(
-                            one_opponent_batch.slice(len(one_opponent_batch) - length_dif, len(one_opponent_batch)))
-                opponent_batch.append(one_opponent_batch)
-
-            # all other agent obs as state
-            # sample_batch["state"] = sample_batch['obs'][:, action_mask_dim:action_mask_dim + obs_dim]
-            if global_state_flag:  # include self obs and global state
-                sample_batch["state"] = sample_batch['obs'][:, action_mask_dim:]
-            else:
-                # must stack in order for the consistency
-                state_batch_list = []
-                for agent_name in custom_config['agent_name_ls']:
-                    if agent_name in other_agent_batches:
-                        index = list(other_agent_batches).index(agent_name)
-                        state_batch_list.append(
-                            opponent_batch[index]["obs"][:, action_mask_dim:action_mask_dim + obs_dim])
-                    else:
-                        state_batch_list.append(sample_batch['obs'][:, action_mask_dim:action_mask_dim + obs_dim])
-                sample_batch["state"] = np.stack(state_batch_list, 1)
-                # sample_batch["state"] = np.stack(
-                #     [sample_batch['obs'][:, action_mask_dim:action_mask_dim + obs_dim]] + [
-                #         opponent_batch[i]["obs"][:, action_mask_dim:action_mask_dim + obs_dim] for i in
-                #         range(opponent_agents_num)], 1)
-
-            sample_batch["opponent_actions"] = np.stack(
-                [opponent_batch[i]["actions"] for i in range(opponent_agents_num)],
-                1)
-
-            if algorithm in ["coma"]:
-                sample_batch[SampleBatch.VF_PREDS] = policy.compute_central_vf(
-                    convert_to_torch_tensor(
-                        sample_batch["state"], policy.device),
-                    convert_to_torch_tensor(
-                        sample_batch["opponent_actions"], policy.device) if opp_action_in_cc else None,
-                ) \
-                    .cpu().detach().numpy()
-                sample_batch[SampleBatch.VF_PREDS] = np.take(sample_batch[SampleBatch.VF_PREDS],
-                                                             np.expand_dims(sample_batch["actions"], axis=1)).squeeze(
-                    axis=1)
-            else:
-                sample_batch[SampleBatch.VF_PREDS] = policy.compute_central_vf(
-                    convert_to_torch_tensor(
-                        sample_batch["state"], policy.device),
-                    convert_to_torch_tensor(
-                        sample_batch["opponent_actions"], policy.device) if opp_action_in_cc else None,
-                ) \
-                    .cpu().detach().numpy()
+        state, opponent_actions, vf_preds = _central_vf_preds(
+            policy, sample_batch, other_agent_batches, episode, need_opponents)
+        sample_batch["state"] = state
+        if need_opponents:
+            sample_batch["opponent_actions"] = opponent_actions
+        sample_batch[SampleBatch.VF_PREDS] = vf_preds
 
     else:
         # Policy hasn't been initialized yet, use zeros.
@@ -1,6 +1,9 @@
+import threading
+import time
+
 from ray.rllib.agents.trainer import Trainer
 from ray.rllib.evaluation.worker_set import WorkerSet
-from ray.util.iter import LocalIterator
+from ray.util.iter import LocalIterator, SharedMetrics, _NextValueNotReady
 from ray.rllib.execution.rollout_ops import ParallelRollouts
 from ray.rllib.execution.replay_ops import Replay, StoreToReplayBuffer
 from ray.rllib.execution.train_ops import TrainOneStep, UpdateTargetNetwork
@@ -21,9 +24,18 @@ def episode_execution_plan(trainer: Trainer, workers: WorkerSet,
         learning_starts=config["learning_starts"],
         capacity=config["buffer_size"],
         replay_batch_size=config["train_batch_size"],
+        prioritized_replay_alpha=config.get("prioritized_replay_alpha", 0.6),
+        prioritized_replay_beta=config.get("prioritized_replay_beta", 0.4),
+        prioritized_replay_eps=config.get("prioritized_replay_eps", 1e-6),
         replay_sequence_length=config.get("replay_sequence_length", 1),
         replay_burn_in=config.get("burn_in", 0),
-        replay_zero_init_states=config.get("zero_init_states", True)
+        replay_zero_init_states=config.get("zero_init_states", True),
+        episode_limit=config["model"]["max_seq_len"],
+        padded=config.get("padded_episode_replay", False),
+        prioritized=config.get("prioritized_replay", False),
+        shared=config.get("shared_memory_replay", False),
+        directory=config.get("replay_directory"),
+        codecs=config.get("replay_codecs"),
     )
     # Assign to Trainer, so we can store the LocalReplayBuffer's
     # data when we save checkpoints.
@@ -44,12 +56,36 @@ def episode_execution_plan(trainer: Trainer, workers: WorkerSet,
 
     train_step_op = TrainOneStep(workers)
 
+    # Policies that learn from whole episodes report one TD error per
+    # sampled episode ("td_error") along with the episode's buffer slot
+    # ("batch_indexes").
+    def update_prio(item):
+        samples, info_dict = item
+        if config.get("prioritized_replay"):
+            prio_dict = {
+                policy_id: (info["batch_indexes"], info["td_error"])
+                for policy_id, info in info_dict.items()
+                if "td_error" in info and "batch_indexes" in info
+            }
+            local_replay_buffer.update_priorities(prio_dict)
+        return item
+
     replay_op = Replay(local_buffer=local_replay_buffer) \
         .for_each(lambda x: post_fn(x, workers, config)) \
         .for_each(train_step_op) \
+        .for_each(update_prio) \
         .for_each(UpdateTargetNetwork(
             workers, config["target_network_update_freq"]))
 
+    if config.get("shared_memory_replay", False) and workers.remote_workers():
+        # (1) runs on its own thread and (2) learns at its own rate. Other
+        # processes can sample the same store through
+        # local_replay_buffer.shared_layouts(). Without remote workers (1)
+        # would sample the local worker while (2) trains its policies, so
+        # the two alternate below as usual.
+        return StandardMetricsReporting(
+            _ingest_in_background(store_op, replay_op), workers, config)
+
     # Alternate deterministically between (1) and (2). Only return the output
     # of (2) since training metrics are not available until (2) runs.
     train_op = Concurrently(
@@ -59,3 +95,34 @@ def episode_execution_plan(trainer: Trainer, workers: WorkerSet,
         round_robin_weights=[1, 1])
 
     return StandardMetricsReporting(train_op, workers, config)
+
+
+def _ingest_in_background(store_op: LocalIterator,
+                          replay_op: LocalIterator,
+                          poll_interval: float = 0.01) -> LocalIterator:
+    # both ops report into the same metrics, as they would under Concurrently
+    SharedMetrics(parents=[store_op.shared_metrics, replay_op.shared_metrics])
+    errors = []
+
+    def ingest():
+        try:
+            for _ in store_op:
+                pass
+        except Exception as e:
+            errors.append(e)
+
+    threading.Thread(target=ingest, name="replay_ingest", daemon=True).start()
+
+    # Replay() yields _NextValueNotReady until the buffer holds
+    # learning_starts timesteps. Concurrently used to drop those; here the
+    # trainer waits for the ingest thread to fill the buffer instead.
+    def wait_for_replay(items):
+        for item in items:
+            if errors:
+                raise errors[0]
+            if isinstance(item, _NextValueNotReady):
+                time.sleep(poll_interval)
+                continue
+            yield item
+
+    return replay_op.transform(wait_for_replay)
@@ -1,5 +1,505 @@
+import os
+
 from ray.rllib.execution.replay_buffer import *
 
+# Column codecs: narrower dtypes a column is cast to for storage, and "lz4"
+# for per-episode LZ4 frames. Integer casts must be exact.
+CAST_CODECS = {
+    "uint8": np.uint8,
+    "int8": np.int8,
+    "uint16": np.uint16,
+    "int16": np.int16,
+    "float16": np.float16,
+}
+
+
+def _lz4():
+    try:
+        import lz4.frame
+    except ImportError:
+        raise ImportError(
+            "The lz4 replay codec needs the lz4 package: pip install lz4")
+    return lz4.frame
+
+
+class EpisodeStore:
+    """Columnar FIFO storage of whole episodes.
+
+    Every per-timestep SampleBatch column lives in one preallocated array of
+    shape [capacity_episodes, max_episode_len, ...] and a length array records
+    how many timesteps of each slot are valid, so sampling is a single
+    fancy-index gather per column instead of SampleBatch.concat_samples over a
+    list of batches. Per-sequence RNN columns (state_in_*) are kept the same
+    way in [capacity_episodes, max_sequences, ...] arrays next to the slot's
+    seq_lens. Columns are allocated from the first added episode and grow if
+    a longer episode shows up.
+
+    Columns named in `codecs` are stored compressed and decoded back to
+    their own dtype for the sampled rows only. A cast codec stores the
+    column in a narrower dtype, e.g. "uint8" for small integer features
+    encoded as float32. "lz4" keeps one LZ4 frame per episode instead.
+    """
+
+    def __init__(self,
+                 capacity: int,
+                 episode_limit: Optional[int] = None,
+                 padded: bool = False,
+                 codecs: Optional[Dict[str, str]] = None):
+        """
+        Args:
+            capacity (int): Max number of timesteps to store, like
+                ReplayBuffer. The store keeps capacity // episode_limit
+                episodes, oldest evicted first.
+            episode_limit (Optional[int]): Expected max length of an episode.
+                If None, the length of the first added episode is used.
+            padded (bool): Whether `sample()` returns the episodes zero-padded
+                to the longest one (see `gather_padded`) instead of
+                concatenated.
+            codecs (Optional[Dict[str, str]]): Codec per column, one of
+                CAST_CODECS or "lz4". Other columns are stored as they come.
+        """
+        codecs = dict(codecs or {})
+        for column, codec in codecs.items():
+            if codec not in CAST_CODECS and codec != "lz4":
+                raise ValueError("Unknown codec {} for column {}.".format(
+                    codec, column))
+        if "lz4" in codecs.values():
+            _lz4()
+        self.capacity = capacity
+        self.episode_limit = episode_limit
+        self.capacity_episodes = None
+        self.padded = padded
+        self.codecs = codecs
+
+        self._columns = {}
+        # dtype each encoded column is decoded to
+        self._dtypes = {}
+        # lz4 columns: one frame per slot, and the shape of a row
+        self._compressed = {}
+        self._row_shapes = {}
+        self._seq_columns = {}
+        self._lengths = None
+        self._seq_lens = None
+        self._num_seqs = None
+        self._num_episodes = 0
+        # The next slot to override in the buffer.
+        self._next_idx = 0
+
+        self._num_timesteps_added = 0
+        self._num_timesteps_sampled = 0
+        self._eviction_started = False
+
+    def __len__(self) -> int:
+        return self._num_episodes
+
+    def _allocate(self, value: np.ndarray, width: int) -> np.ndarray:
+        shape = (self.capacity_episodes, width) + value.shape[1:]
+        if value.dtype == object:
+            return np.empty(shape, dtype=object)
+        return np.zeros(shape, dtype=value.dtype)
+
+    @staticmethod
+    def _grow(arrays: Dict[str, np.ndarray], width: int) -> None:
+        # widen axis 1 of every array, keeping the stored data
+        for column, array in arrays.items():
+            if array.shape[1] < width:
+                grown = np.zeros((array.shape[0], width) + array.shape[2:],
+                                 dtype=array.dtype)
+                grown[:, :array.shape[1]] = array
+                arrays[column] = grown
+
+    @staticmethod
+    def _write(arrays: Dict[str, np.ndarray], values: Dict[str, np.ndarray],
+               slot: int, start: int, end: int) -> None:
+        for column, array in arrays.items():
+            length = end - start if column in values else 0
+            if length:
+                array[slot, :length] = values[column][start:end]
+            array[slot, length:] = 0 if array.dtype != object else None
+
+    def add(self, item: SampleBatch, weight: float = None) -> np.ndarray:
+        """Adds every episode in `item`, split where EPS_ID changes.
+
+        Returns the slots the episodes were written to.
+        """
+        assert item.count > 0, item
+        seq_lens = item.get(SampleBatch.SEQ_LENS)
+        if seq_lens is not None:
+            seq_lens = np.asarray(seq_lens)
+        seq_columns = {
+            k: np.asarray(v)
+            for k, v in item.items()
+            if seq_lens is not None and k.startswith("state_in_")
+        }
+        # Other per-sequence columns have no timestep to be stored at.
+        columns = {
+            k: np.asarray(v)
+            for k, v in item.items()
+            if k not in seq_columns and k != SampleBatch.SEQ_LENS and
+            len(v) == item.count
+        }
+        columns = self._encode(columns)
+        if SampleBatch.EPS_ID in columns:
+            eps_id = columns[SampleBatch.EPS_ID]
+            starts = np.flatnonzero(
+                np.concatenate([[True], eps_id[1:] != eps_id[:-1]]))
+        else:
+            starts = np.zeros(1, dtype=np.int64)
+        ends = np.append(starts[1:], item.count)
+        if seq_lens is not None:
+            # sequences never cross episodes; map each to the one it starts in
+            seq_episode = np.searchsorted(
+                starts, np.cumsum(seq_lens) - seq_lens, side="right") - 1
+            seq_starts = np.searchsorted(seq_episode, np.arange(len(starts)))
+            seq_ends = np.append(seq_starts[1:], len(seq_lens))
+
+        if self.capacity_episodes is None:
+            if self.episode_limit is None:
+                self.episode_limit = int(ends[0] - starts[0])
+            self.capacity_episodes = max(1, self.capacity // self.episode_limit)
+            self._lengths = np.zeros(self.capacity_episodes, dtype=np.int64)
+            self._seq_lens = np.zeros((self.capacity_episodes, 1), dtype=np.int64)
+            self._num_seqs = np.zeros(self.capacity_episodes, dtype=np.int64)
+            warn_replay_capacity(item=item, num_items=self.capacity_episodes)
+
+        max_len = max([int(np.max(ends - starts)), self.episode_limit] +
+                      [a.shape[1] for a in self._columns.values()])
+        self._grow(self._columns, max_len)
+        for column, value in columns.items():
+            if self.codecs.get(column) == "lz4":
+                if column not in self._compressed:
+                    self._compressed[column] = np.full(
+                        self.capacity_episodes, None, dtype=object)
+                    self._dtypes[column] = value.dtype
+                    self._row_shapes[column] = value.shape[1:]
+            elif column not in self._columns:
+                self._columns[column] = self._allocate(value, max_len)
+        if seq_lens is not None:
+            max_seqs = max([int(np.max(seq_ends - seq_starts)),
+                            self._seq_lens.shape[1]])
+            arrays = dict(self._seq_columns, **{SampleBatch.SEQ_LENS: self._seq_lens})
+            self._grow(arrays, max_seqs)
+            self._seq_lens = arrays.pop(SampleBatch.SEQ_LENS)
+            self._seq_columns.update(arrays)
+            for column, value in seq_columns.items():
+                if column not in self._seq_columns:
+                    self._seq_columns[column] = self._allocate(value, max_seqs)
+
+        slots = np.empty(len(starts), dtype=np.int64)
+        for i, (start, end) in enumerate(zip(starts, ends)):
+            slot = self._next_idx
+            slots[i] = slot
+            if seq_lens is not None:
+                self._write_slot(slot, columns, start, end, seq_columns,
+                                 seq_lens, seq_starts[i], seq_ends[i])
+            else:
+                self._write_slot(slot, columns, start, end)
+            self._num_timesteps_added += end - start
+            self._num_episodes = max(self._num_episodes, slot + 1)
+            # Wrap around storage as a circular buffer once we hit capacity.
+            self._next_idx = (slot + 1) % self.capacity_episodes
+            if self._next_idx == 0:
+                self._eviction_started = True
+        return slots
+
+    def _encode(self, columns: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        # apply the cast codecs; lz4 columns are compressed per slot
+        encoded = dict(columns)
+        for column, value in columns.items():
+            codec = self.codecs.get(column)
+            if codec not in CAST_CODECS:
+                continue
+            cast = value.astype(CAST_CODECS[codec])
+            if cast.dtype.kind in "iu" and not np.array_equal(cast, value):
+                raise ValueError(
+                    "Column {} has values the {} codec cannot store "
+                    "exactly.".format(column, codec))
+            self._dtypes.setdefault(column, value.dtype)
+            encoded[column] = cast
+        return encoded
+
+    def _decode(self, column: str, values: np.ndarray) -> np.ndarray:
+        dtype = self._dtypes.get(column)
+        return values if dtype is None else values.astype(dtype)
+
+    def _episode(self, column: str, slot: int) -> np.ndarray:
+        # the decompressed rows of an lz4 column in `slot`
+        frame = self._compressed[column][slot]
+        shape = (-1, ) + tuple(self._row_shapes[column])
+        if frame is None:
+            return np.zeros((self._lengths[slot], ) + shape[1:],
+                            dtype=self._dtypes[column])
+        return np.frombuffer(_lz4().decompress(frame),
+                             dtype=self._dtypes[column]).reshape(shape)
+
+    def _write_slot(self, slot: int, columns: Dict[str, np.ndarray],
+                    start: int, end: int,
+                    seq_columns: Optional[Dict[str, np.ndarray]] = None,
+                    seq_lens: Optional[np.ndarray] = None,
+                    seq_start: int = 0, seq_end: int = 0) -> None:
+        # rows start:end (and sequences seq_start:seq_end) become the episode
+        # in `slot`
+        self._write(self._columns, columns, slot, start, end)
+        self._lengths[slot] = end - start
+        for column, frames in self._compressed.items():
+            frames[slot] = _lz4().compress(
+                np.ascontiguousarray(columns[column][start:end]).tobytes()) \
+                if column in columns else None
+        self._write(self._seq_columns, seq_columns or {}, slot, seq_start,
+                    seq_end)
+        if seq_lens is not None:
+            self._seq_lens[slot, :seq_end - seq_start] = seq_lens[seq_start:seq_end]
+        self._seq_lens[slot, seq_end - seq_start:] = 0
+        self._num_seqs[slot] = seq_end - seq_start
+
+    def sample_indexes(self, num_items: int) -> np.ndarray:
+        # Without replacement whenever there are enough episodes.
+        return np.random.choice(
+            self._num_episodes, num_items,
+            replace=self._num_episodes < num_items)
+
+    @staticmethod
+    def _ragged(idxes: np.ndarray, counts: np.ndarray):
+        # (slot, position) pairs of the first counts[i] entries of each slot
+        rows = np.repeat(idxes, counts)
+        positions = np.arange(counts.sum()) - np.repeat(
+            np.cumsum(counts) - counts, counts)
+        return rows, positions
+
+    def gather(self, idxes: np.ndarray,
+               weights: Optional[np.ndarray] = None) -> SampleBatch:
+        """Concatenation of the episodes in slots `idxes`, in that order.
+
+        `weights` holds one importance weight per episode, spread over its
+        timesteps; defaults to ones.
+        """
+        lengths = self._lengths[idxes]
+        rows, steps = self._ragged(idxes, lengths)
+        out = {column: self._decode(column, array[rows, steps])
+               for column, array in self._columns.items()}
+        for column in self._compressed:
+            out[column] = np.concatenate(
+                [self._episode(column, slot) for slot in idxes])
+        if self._seq_columns:
+            seq_rows, seqs = self._ragged(idxes, self._num_seqs[idxes])
+            out.update({column: array[seq_rows, seqs]
+                        for column, array in self._seq_columns.items()})
+            out[SampleBatch.SEQ_LENS] = self._seq_lens[seq_rows, seqs]
+        out = SampleBatch(out)
+        out["batch_indexes"] = rows
+        out["weights"] = np.ones(len(rows), dtype=np.float32) \
+            if weights is None else np.repeat(weights, lengths).astype(np.float32)
+        out.decompress_if_needed()
+        self._num_timesteps_sampled += len(rows)
+        return out
+
+    def gather_padded(self, idxes: np.ndarray,
+                      weights: Optional[np.ndarray] = None) -> SampleBatch:
+        """The episodes in slots `idxes`, each zero-padded to the longest.
+
+        Per-timestep columns come out flattened to [B * T, ...], seq_lens
+        holds the B episode lengths and the batch is marked zero_padded, i.e.
+        what chop_into_sequences(dynamic_max=True) would make of the
+        concatenated episodes. Per-sequence RNN columns are left out.
+        `weights` is as in `gather`.
+        """
+        lengths = self._lengths[idxes]
+        T = int(lengths.max())
+        out = {
+            column: self._decode(
+                column, array[idxes, :T].reshape((-1, ) + array.shape[2:]))
+            for column, array in self._columns.items()
+        }
+        for column in self._compressed:
+            padded = np.zeros((len(idxes), T) + tuple(self._row_shapes[column]),
+                              dtype=self._dtypes[column])
+            for i, slot in enumerate(idxes):
+                episode = self._episode(column, slot)
+                padded[i, :len(episode)] = episode
+            out[column] = padded.reshape((-1, ) + padded.shape[2:])
+        out = SampleBatch(out, _zero_padded=True, _max_seq_len=T)
+        out[SampleBatch.SEQ_LENS] = lengths
+        out["batch_indexes"] = np.repeat(idxes, T)
+        out["weights"] = np.ones(len(idxes) * T, dtype=np.float32) \
+            if weights is None else np.repeat(weights, T).astype(np.float32)
+        out.decompress_if_needed()
+        self._num_timesteps_sampled += int(lengths.sum())
+        return out
+
+    def sample(self, num_items: int, beta: float = None) -> SampleBatch:
+        """Samples `num_items` whole episodes.
+
+        `beta` is accepted for LocalReplayBuffer compatibility; sampling is
+        uniform.
+        """
+        idxes = self.sample_indexes(num_items)
+        return self.gather_padded(idxes) if self.padded else self.gather(idxes)
+
+    def update_priorities(self, idxes, priorities) -> None:
+        pass
+
+    def stats(self, debug=False) -> dict:
+        return {
+            "added_count": self._num_timesteps_added,
+            "eviction_started": self._eviction_started,
+            "sampled_count": self._num_timesteps_sampled,
+            "est_size_bytes": sum(
+                a.nbytes for a in list(self._columns.values()) +
+                list(self._seq_columns.values())) + sum(
+                    len(frame) for frames in self._compressed.values()
+                    for frame in frames if frame is not None),
+            "num_entries": self._num_episodes,
+        }
+
+    def get_state(self) -> Dict[str, Any]:
+        state = {
+            "_columns": self._columns,
+            "_seq_columns": self._seq_columns,
+            "_dtypes": self._dtypes,
+            "_compressed": self._compressed,
+            "_row_shapes": self._row_shapes,
+            "_lengths": self._lengths,
+            "_seq_lens": self._seq_lens,
+            "_num_seqs": self._num_seqs,
+            "capacity_episodes": self.capacity_episodes,
+            "episode_limit": self.episode_limit,
+            "_num_episodes": self._num_episodes,
+            "_next_idx": self._next_idx,
+        }
+        state.update(self.stats(debug=False))
+        return state
+
+    def set_state(self, state: Dict[str, Any]) -> None:
+        self._columns = state["_columns"]
+        self._seq_columns = state["_seq_columns"]
+        self._dtypes = state["_dtypes"]
+        self._compressed = state["_compressed"]
+        self._row_shapes = state["_row_shapes"]
+        self._lengths = state["_lengths"]
+        self._seq_lens = state["_seq_lens"]
+        self._num_seqs = state["_num_seqs"]
+        self.capacity_episodes = state["capacity_episodes"]
+        self.episode_limit = state["episode_limit"]
+        self._num_episodes = state["_num_episodes"]
+        self._next_idx = state["_next_idx"]
+        self._num_timesteps_added = state["added_count"]
+        self._eviction_started = state["eviction_started"]
+        self._num_timesteps_sampled = state["sampled_count"]
+
+
+class SumTree:
+    """Binary sum tree over a fixed number of leaves in one flat array.
+
+    Node i has children 2i and 2i + 1 and leaves start at `size`, so both a
+    batch of updates and a batch of prefix-sum searches walk the log2(size)
+    levels once, with array operations per level.
+    """
+
+    def __init__(self, capacity: int):
+        self.size = 1
+        while self.size < capacity:
+            self.size *= 2
+        self.tree = np.zeros(2 * self.size, dtype=np.float64)
+
+    def total(self) -> float:
+        return self.tree[1]
+
+    def __getitem__(self, idxes):
+        return self.tree[self.size + np.asarray(idxes)]
+
+    def update(self, idxes, values) -> None:
+        """Sets leaves `idxes` to `values`; on duplicates the last one wins."""
+        nodes = self.size + np.asarray(idxes)
+        self.tree[nodes] = values
+        nodes = np.unique(nodes // 2)
+        while nodes[0] >= 1:
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+            nodes = np.unique(nodes // 2)
+
+    def find_prefixsum_idx(self, prefixes) -> np.ndarray:
+        """Leaf at which the running sum of leaves first exceeds each prefix."""
+        prefixes = np.array(prefixes, dtype=np.float64)
+        nodes = np.ones(len(prefixes), dtype=np.int64)
+        while nodes[0] < self.size:
+            left = 2 * nodes
+            go_right = prefixes > self.tree[left]
+            prefixes -= np.where(go_right, self.tree[left], 0.)
+            nodes = left + go_right
+        return nodes - self.size
+
+
+class PrioritizedEpisodeStore(EpisodeStore):
+    """EpisodeStore sampling episodes in proportion to priority ** alpha.
+
+    New episodes get the highest priority seen so far. Importance weights
+    (N * P(i)) ** -beta are normalised by the largest one in the sampled
+    batch, as in PyMARL, rather than by the global minimum priority.
+    """
+
+    def __init__(self,
+                 capacity: int,
+                 episode_limit: Optional[int] = None,
+                 padded: bool = False,
+                 alpha: float = 0.6,
+                 codecs: Optional[Dict[str, str]] = None):
+        EpisodeStore.__init__(self, capacity, episode_limit, padded, codecs)
+        assert alpha >= 0
+        self._alpha = alpha
+        self._max_priority = 1.0
+        self._tree = None
+
+    def add(self, item: SampleBatch, weight: float = None) -> np.ndarray:
+        slots = EpisodeStore.add(self, item, weight)
+        if self._tree is None:
+            self._tree = SumTree(self.capacity_episodes)
+        self._tree.update(slots, self._max_priority ** self._alpha)
+        return slots
+
+    def sample_indexes(self, num_items: int) -> np.ndarray:
+        # one draw from each of num_items equal slices of the total priority
+        total = self._tree.total()
+        prefixes = (np.arange(num_items) + np.random.random(num_items)) * \
+            total / num_items
+        return np.minimum(self._tree.find_prefixsum_idx(prefixes),
+                          self._num_episodes - 1)
+
+    def sample(self, num_items: int, beta: float = None) -> SampleBatch:
+        """Samples `num_items` episodes by priority, with replacement."""
+        assert beta is None or beta >= 0.0
+        idxes = self.sample_indexes(num_items)
+        weights = (self._num_episodes * self._tree[idxes] /
+                   self._tree.total()) ** -(beta or 0.0)
+        weights /= weights.max()
+        if self.padded:
+            return self.gather_padded(idxes, weights)
+        return self.gather(idxes, weights)
+
+    def update_priorities(self, idxes, priorities) -> None:
+        """Sets the priority of the episode in slot idxes[i] to priorities[i]."""
+        idxes = np.asarray(idxes)
+        priorities = np.asarray(priorities, dtype=np.float64)
+        assert len(idxes) == len(priorities)
+        assert np.all(priorities > 0)
+        assert np.all((0 <= idxes) & (idxes < self._num_episodes))
+        self._tree.update(idxes, priorities ** self._alpha)
+        self._max_priority = max(self._max_priority, priorities.max())
+
+    def get_state(self) -> Dict[str, Any]:
+        state = EpisodeStore.get_state(self)
+        state.update({
+            "_tree": self._tree.tree if self._tree is not None else None,
+            "_max_priority": self._max_priority,
+        })
+        return state
+
+    def set_state(self, state: Dict[str, Any]) -> None:
+        EpisodeStore.set_state(self, state)
+        self._max_priority = state["_max_priority"]
+        self._tree = None
+        if state["_tree"] is not None:
+            self._tree = SumTree(self.capacity_episodes)
+            self._tree.tree = state["_tree"]
+
 
 class EpisodeBasedReplayBuffer(LocalReplayBuffer):
 
@@ -17,6 +517,12 @@ class EpisodeBasedReplayBuffer(LocalReplayBuffer):
             replay_burn_in: int = 0,
             replay_zero_init_states: bool = True,
             buffer_size=DEPRECATED_VALUE,
+            episode_limit: Optional[int] = None,
+            padded: bool = False,
+            prioritized: bool = False,
+            shared: bool = False,
+            directory: Optional[str] = None,
+            codecs: Optional[Dict[str, str]] = None,
     ):
         LocalReplayBuffer.__init__(self, num_shards, learning_starts, capacity, replay_batch_size,
                                    prioritized_replay_alpha, prioritized_replay_beta,
@@ -26,23 +532,54 @@ class EpisodeBasedReplayBuffer(LocalReplayBuffer):
 
         self.replay_batch_size = replay_batch_size
 
+        # whole episodes go to columnar stores instead of lists of SampleBatches
+        if prioritized and shared:
+            raise ValueError(
+                "prioritized replay is not supported with shared memory "
+                "replay")
+        if prioritized and directory is not None:
+            raise ValueError(
+                "prioritized replay is not supported with memory-mapped "
+                "replay")
+
+        def new_buffer():
+            if directory is not None:
+                # the defaultdict cannot pass the key, so number the stores
+                from marllib.marl.algos.utils.mmap_episode_store import \
+                    MmapEpisodeStore
+                return MmapEpisodeStore(
+                    self.capacity, episode_limit, padded, codecs=codecs,
+                    directory=os.path.join(
+                        directory, "policy_{}".format(len(self.replay_buffers))))
+            if shared:
+                from marllib.marl.algos.utils.shared_episode_store import \
+                    SharedEpisodeStore
+                return SharedEpisodeStore(self.capacity, episode_limit, padded,
+                                          codecs=codecs)
+            if prioritized:
+                return PrioritizedEpisodeStore(self.capacity, episode_limit,
+                                               padded, prioritized_replay_alpha,
+                                               codecs)
+            return EpisodeStore(self.capacity, episode_limit, padded, codecs)
+
+        self.replay_buffers = collections.defaultdict(new_buffer)
+
+    def shared_layouts(self) -> Dict[str, Dict[str, Any]]:
+        """Per-policy layouts for `SharedEpisodeStore.attach` in other
+        processes. Only available in shared mode, after the first batch."""
+        return {
+            policy_id: store.layout()
+            for policy_id, store in self.replay_buffers.items()
+        }
+
     @override(LocalReplayBuffer)
     def add_batch(self, batch: SampleBatchType) -> None:
-        # Make a copy so the replay buffer doesn't pin plasma memory.
-        batch = batch.copy()
+        # No copy needed: the stores copy every column into their own arrays.
         # Handle everything as if multiagent
         if isinstance(batch, SampleBatch):
             batch = MultiAgentBatch({DEFAULT_POLICY_ID: batch}, batch.count)
 
         with self.add_batch_timer:
             for policy_id, sample_batch in batch.policy_batches.items():
-                timeslices = [sample_batch]
-                for time_slice in timeslices:
-                    if "weights" in time_slice and \
-                            len(time_slice["weights"]):
-                        weight = np.mean(time_slice["weights"])
-                    else:
-                        weight = None
-                    self.replay_buffers[policy_id].add(
-                        time_slice, weight=weight)
+                self.replay_buffers[policy_id].add(sample_batch)
         self.num_added += batch.count
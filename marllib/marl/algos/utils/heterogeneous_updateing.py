@@ -1,9 +1,14 @@
+from concurrent.futures import ThreadPoolExecutor
 from ray.rllib.utils.framework import try_import_torch
 import random
 from ray.rllib.policy.sample_batch import SampleBatch
 from ray.rllib.utils.torch_ops import sequence_mask
-import re
-from marllib.marl.algos.utils.centralized_critic_hetero import get_global_name, global_state_name
+from marllib.marl.algos.utils.centralized_critic_hetero import (
+    GLOBAL_PREFIX,
+    get_global_name,
+    global_state_name,
+    state_name,
+)
 torch, nn = try_import_torch()
 
 
@@ -95,43 +100,55 @@ class IterTrainBatch(SampleBatch):
         self.keys = self.main_train_batch.keys
         self.is_training = self.main_train_batch.is_training
 
-        self.pat = re.compile(r'^state_in_(\d+)')
-
-    def get_state_index(self, string):
-        match = self.pat.findall(string)
-        if match:
-            return match[0]
-        else:
-            return None
+        self.views = get_agent_views(main_train_batch, policy_name)
 
     def __getitem__(self, item):
         """
         Adds an adaptor to get the item.
         Input a key name, it would get the corresponding opponent's key-value
         """
-        directly_get = [SampleBatch.SEQ_LENS]
-
-        if item in directly_get:
-            return self.main_train_batch[item]
-        elif get_global_name(item, self.policy_name) in self.main_train_batch:
-            return self.main_train_batch[get_global_name(item, self.policy_name)]
-        # elif state_index := self.get_state_index(item):
-        else:
-            state_index = self.get_state_index(item)
-            if state_index:
-                return self.main_train_batch[global_state_name(state_index, self.policy_name)]
+        return self.views.get(item)
 
     def __contains__(self, item):
-        if item in self.keys() or get_global_name(item, self.policy_name) in self.keys():
-            return True
-        else:
-            state_index = self.get_state_index(item)
-            return state_index and global_state_name(state_index, self.policy_name) in self.keys()
-        # elif state_index := self.get_state_index(item):
-        #     if global_state_name(state_index, self.policy_name) in self.keys():
-        #         return True
+        return item in self.views or item in self.keys()
+
+
+def get_agent_views(train_batch, policy_name):
+    """
+    The keys of one agent in the post processed train batch, mapped to the agent-wise key names.
+
+    global_<key>_agent_<policy_name> becomes <key> and state_in_<i>_of_agent_<policy_name> becomes state_in_<i>, while
+    seq_lens is shared by all agents. The values are the train batch's own tensors, so nothing is copied.
+    """
+    views = {}
 
-        # return False
+    i = 0
+    while global_state_name(i, policy_name) in train_batch:
+        views[state_name(i)] = train_batch[global_state_name(i, policy_name)]
+        i += 1
+
+    suffix_len = len(get_global_name('', policy_name)) - len(GLOBAL_PREFIX)
+    for key in list(train_batch.keys()):
+        if key.startswith(GLOBAL_PREFIX) and len(key) > len(GLOBAL_PREFIX) + suffix_len:
+            item = key[len(GLOBAL_PREFIX):-suffix_len]
+            if get_global_name(item, policy_name) == key:
+                views[item] = train_batch[key]
+
+    if SampleBatch.SEQ_LENS in train_batch:
+        views[SampleBatch.SEQ_LENS] = train_batch[SampleBatch.SEQ_LENS]
+
+    return views
+
+
+def get_iter_train_batch(train_batch, policy_name):
+    """
+    The IterTrainBatch of policy_name over train_batch. It is built once and kept on the train batch, so every SGD epoch
+    over the same batch, and every loss that iterates the agents on it, reuses the same views.
+    """
+    iter_train_batches = train_batch.__dict__.setdefault('_iter_train_batches', {})
+    if policy_name not in iter_train_batches:
+        iter_train_batches[policy_name] = IterTrainBatch(train_batch, policy_name)
+    return iter_train_batches[policy_name]
 
 
 def get_each_agent_train(model, policy, dist_class, train_batch):
@@ -142,9 +159,52 @@ def get_each_agent_train(model, policy, dist_class, train_batch):
         is_self = (policy_name == 'self')
         iter_model = [iter_policy.model, model][is_self]
         iter_dist_class = [iter_policy.dist_class, dist_class][is_self]
-        iter_train_batch = [IterTrainBatch(train_batch, policy_name), train_batch][is_self]
+        iter_train_batch = train_batch if is_self else get_iter_train_batch(train_batch, policy_name)
         iter_mask, iter_reduce_mean, current_action_dist = get_mask_and_reduce_mean(iter_model, iter_train_batch, dist_class)
         iter_actions = iter_train_batch[SampleBatch.ACTIONS]
         iter_prev_action_logp = iter_train_batch[SampleBatch.ACTION_LOGP]
 
         yield iter_model, iter_dist_class, iter_train_batch, iter_mask, iter_reduce_mean, iter_actions, iter_policy, iter_prev_action_logp
+
+
+def get_each_agent_group_train(model, policy, dist_class, train_batch, group_size=1):
+    """
+    Splits the shuffled agents of get_each_agent_train into consecutive groups of `group_size`.
+
+    The agents of one group are updated independently of each other against the same m_advantage, and the sequential
+    advantage correction is only applied between groups. A group size of 1 is the fully sequential update.
+    """
+    group = []
+    for iter_agent_info in get_each_agent_train(model, policy, dist_class, train_batch):
+        group.append(iter_agent_info)
+        if len(group) == group_size:
+            yield group
+            group = []
+    if group:
+        yield group
+
+
+def update_agent_group(update_agent, group):
+    """
+    Calls update_agent on each agent train info of the group, concurrently in a thread pool when the group has more than
+    one agent. The agents have their own models, so their forward and backward passes do not share any state.
+    Returns the results in group order.
+    """
+    if len(group) == 1:
+        return [update_agent(group[0])]
+    with ThreadPoolExecutor(max_workers=len(group)) as executor:
+        return list(executor.map(update_agent, group))
+
+
+def update_group_m_advantage(group, m_advantage):
+    for iter_model, iter_dist_class, iter_train_batch, _, _, iter_actions, _, iter_prev_action_logp in group:
+        m_advantage = update_m_advantage(
+            iter_model=iter_model,
+            iter_train_batch=iter_train_batch,
+            iter_actions=iter_actions,
+            m_advantage=m_advantage,
+            iter_dist_class=iter_dist_class,
+            iter_prev_action_logp=iter_prev_action_logp
+        )
+
+    return m_advantage
@@ -0,0 +1,120 @@
+import functools
+import os
+import shutil
+import tempfile
+import weakref
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from marllib.marl.algos.utils.shared_episode_store import SharedEpisodeStore
+
+
+class MmapEpisodeStore(SharedEpisodeStore):
+    """SharedEpisodeStore whose arrays are memory-mapped .npy files.
+
+    Every column, the per-slot lengths, seq_lens and the cursor are
+    preallocated as `array_<n>.npy` files in a new directory of its own
+    under `directory`, so stores sharing a `directory` (say, two runs
+    with the same replay_directory) never write to each other's files,
+    and `close` removes that directory again. The files are
+    sparse until episodes are written, and the OS keeps only the pages
+    in use in RAM, so the capacity is bounded by disk rather than by host
+    memory. Other processes can `attach` to the files like to a shared
+    memory store.
+
+    With a `directory`, `get_state` flushes the files and returns only
+    their paths and the cursor; `set_state` maps the same files again, so
+    episodes written after the checkpoint are kept where they are. Without
+    one, the files go to a temporary directory that is removed with the
+    store, and checkpoints hold a full copy as for SharedEpisodeStore.
+    A store restored from a checkpoint never removes the files it maps.
+    """
+
+    def __init__(self,
+                 capacity: int,
+                 episode_limit: Optional[int] = None,
+                 padded: bool = False,
+                 object_bytes: Optional[int] = None,
+                 codecs: Optional[Dict[str, str]] = None,
+                 directory: Optional[str] = None):
+        SharedEpisodeStore.__init__(self, capacity, episode_limit, padded,
+                                    object_bytes, codecs)
+        self.parent_directory = directory
+        self.directory = None
+        self._temporary = directory is None
+        self._remove_directory = None
+
+    def _shared(self, shape, dtype) -> np.ndarray:
+        if self.directory is None:
+            if self.parent_directory is not None:
+                os.makedirs(self.parent_directory, exist_ok=True)
+            self.directory = tempfile.mkdtemp(prefix="episode_store_",
+                                              dir=self.parent_directory)
+            if self._temporary:
+                self._remove_directory = weakref.finalize(
+                    self, shutil.rmtree, self.directory, True)
+            else:
+                # checkpoints point at these files, so they outlive the
+                # process unless the store is closed
+                self._remove_directory = functools.partial(
+                    shutil.rmtree, self.directory, True)
+        path = os.path.join(self.directory,
+                            "array_{}.npy".format(len(self._array_names)))
+        # open_memmap only extends the file, so it starts out zero and sparse
+        array = np.lib.format.open_memmap(path, mode="w+",
+                                          dtype=np.dtype(dtype),
+                                          shape=tuple(shape))
+        self._array_names[id(array)] = path
+        return array
+
+    def _open(self, spec) -> np.ndarray:
+        path = spec[0]
+        array = np.load(path, mmap_mode="r+" if self._owner else "r")
+        self._array_names[id(array)] = path
+        return array
+
+    def _arrays(self):
+        return [self._meta, self._versions, self._lengths, self._seq_lens,
+                self._num_seqs] + list(self._columns.values()) + \
+            list(self._seq_columns.values()) + \
+            list(self._objects.values()) + list(self._object_sizes.values())
+
+    def flush(self) -> None:
+        """Writes every dirty page of the files back to disk."""
+        for array in self._arrays():
+            if isinstance(array, np.memmap):
+                array.flush()
+
+    def close(self) -> None:
+        """Unmaps the files and removes the directory this store made."""
+        SharedEpisodeStore.close(self)
+        if self._remove_directory is not None:
+            self._remove_directory()
+
+    def get_state(self) -> Dict[str, Any]:
+        if self._temporary or self._versions is None:
+            return SharedEpisodeStore.get_state(self)
+        self.flush()
+        state = {
+            "layout": self.layout(),
+            "_num_episodes": self._num_episodes,
+            "_next_idx": self._next_idx,
+        }
+        state.update(self.stats(debug=False))
+        return state
+
+    def set_state(self, state: Dict[str, Any]) -> None:
+        if "layout" not in state:
+            SharedEpisodeStore.set_state(self, state)
+            return
+        layout = state["layout"]
+        self.episode_limit = layout["episode_limit"]
+        self.object_bytes = layout["object_bytes"]
+        self.directory = os.path.dirname(layout["meta"][0])
+        self._map(layout)
+        self._num_episodes = state["_num_episodes"]
+        self._next_idx = state["_next_idx"]
+        self._num_timesteps_added = state["added_count"]
+        self._eviction_started = state["eviction_started"]
+        self._num_timesteps_sampled = state["sampled_count"]
@@ -0,0 +1,384 @@
+import pickle
+import weakref
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Dict, Optional
+
+import numpy as np
+from ray.rllib.policy.sample_batch import SampleBatch
+
+from marllib.marl.algos.utils.episode_replay_buffer import EpisodeStore
+
+
+def _release(segments, unlink):
+    for segment in segments:
+        try:
+            segment.close()
+        except BufferError:
+            pass  # arrays still map it, the mapping goes with them
+        if unlink:
+            segment.unlink()
+
+
+class SharedEpisodeStore(EpisodeStore):
+    """EpisodeStore whose arrays live in shared memory.
+
+    The process that adds episodes owns the segments. Other processes call
+    `SharedEpisodeStore.attach(store.layout())` and then sample from the
+    same memory, without the trainer pickling SampleBatches to them.
+    There is a single writer and no lock. Each slot has a version counter
+    that is odd while the slot is being rewritten (a seqlock). Readers
+    re-sample any batch whose slots changed while they were being copied.
+
+    The layout is fixed by the first added batch. Every episode must fit in
+    `episode_limit` steps, and later batches may not bring new columns.
+    Object columns (infos) are pickled per episode into `object_bytes`
+    bytes per slot, 512 per step of `episode_limit` by default. Only these
+    need pickling; every other column is numeric and shared as-is. Cast
+    codecs work as in EpisodeStore, lz4 frames cannot be shared.
+    """
+
+    def __init__(self,
+                 capacity: int,
+                 episode_limit: Optional[int] = None,
+                 padded: bool = False,
+                 object_bytes: Optional[int] = None,
+                 codecs: Optional[Dict[str, str]] = None):
+        if codecs and "lz4" in codecs.values():
+            raise ValueError("lz4 columns cannot be kept in shared memory")
+        # num_episodes, next_idx, num_timesteps_added
+        self._meta = np.zeros(3, dtype=np.int64)
+        EpisodeStore.__init__(self, capacity, episode_limit, padded, codecs)
+        self.object_bytes = object_bytes
+        self._segments = []
+        self._array_names = {}
+        self._owner = True
+        self._objects = {}
+        self._object_sizes = {}
+        self._pending_objects = {}
+        self._versions = None
+        self._finalizer = None
+
+    # Counters other processes need are kept in the shared meta array.
+    @property
+    def _num_episodes(self) -> int:
+        return int(self._meta[0])
+
+    @_num_episodes.setter
+    def _num_episodes(self, value: int) -> None:
+        self._meta[0] = value
+
+    @property
+    def _next_idx(self) -> int:
+        return int(self._meta[1])
+
+    @_next_idx.setter
+    def _next_idx(self, value: int) -> None:
+        self._meta[1] = value
+
+    @property
+    def _num_timesteps_added(self) -> int:
+        return int(self._meta[2])
+
+    @_num_timesteps_added.setter
+    def _num_timesteps_added(self, value: int) -> None:
+        self._meta[2] = value
+
+    def _shared(self, shape, dtype) -> np.ndarray:
+        dtype = np.dtype(dtype)
+        segment = shared_memory.SharedMemory(
+            create=True, size=max(1, int(np.prod(shape)) * dtype.itemsize))
+        self._segments.append(segment)
+        array = np.ndarray(shape, dtype=dtype, buffer=segment.buf)
+        array.fill(0)
+        self._array_names[id(array)] = segment.name
+        return array
+
+    def _setup(self) -> None:
+        # move the counters and per-slot arrays EpisodeStore just allocated
+        # into shared memory
+        meta = self._shared(self._meta.shape, self._meta.dtype)
+        meta[:] = self._meta
+        self._meta = meta
+        for name in ("_lengths", "_seq_lens", "_num_seqs"):
+            array = getattr(self, name)
+            shared = self._shared(array.shape, array.dtype)
+            shared[:] = array
+            setattr(self, name, shared)
+        self._versions = self._shared((self.capacity_episodes, ), np.int64)
+        self._finalizer = weakref.finalize(self, _release, self._segments,
+                                           True)
+
+    def _allocate(self, value: np.ndarray, width: int) -> np.ndarray:
+        if self._versions is not None and self._num_episodes > 0:
+            raise ValueError(
+                "SharedEpisodeStore cannot add columns after its first "
+                "batch, readers would not see them.")
+        if value.dtype == object:
+            raise ValueError("object columns are stored pickled")
+        return self._shared((self.capacity_episodes, self.episode_limit) +
+                            value.shape[1:], value.dtype)
+
+    @staticmethod
+    def _grow(arrays: Dict[str, np.ndarray], width: int) -> None:
+        for column, array in arrays.items():
+            if array.shape[1] < width:
+                raise ValueError(
+                    "Episode of length {} does not fit in the shared store "
+                    "(episode_limit {}) for column {}.".format(
+                        width, array.shape[1], column))
+
+    def add(self, item: SampleBatch, weight: float = None) -> np.ndarray:
+        if not self._owner:
+            raise ValueError("Only the process that created the store can "
+                             "add to it.")
+        self._pending_objects = {
+            k: np.asarray(v)
+            for k, v in item.items()
+            if k != SampleBatch.SEQ_LENS and np.asarray(v).dtype == object
+        }
+        numeric = SampleBatch({
+            k: v
+            for k, v in item.items() if k not in self._pending_objects
+        })
+        if self.capacity_episodes is None:
+            if self.episode_limit is None:
+                self.episode_limit = item.count
+            # EpisodeStore sizes the per-sequence arrays on demand; a shared
+            # store needs them at full size up front.
+            self.capacity_episodes = max(1,
+                                         self.capacity // self.episode_limit)
+            self._lengths = np.zeros(self.capacity_episodes, dtype=np.int64)
+            self._seq_lens = np.zeros(
+                (self.capacity_episodes, self.episode_limit), dtype=np.int64)
+            self._num_seqs = np.zeros(self.capacity_episodes, dtype=np.int64)
+            self._setup()
+        if self.object_bytes is None:
+            self.object_bytes = 512 * self.episode_limit
+        for column in self._pending_objects:
+            if column not in self._objects:
+                self._objects[column] = self._shared(
+                    (self.capacity_episodes, self.object_bytes), np.uint8)
+                self._object_sizes[column] = self._shared(
+                    (self.capacity_episodes, ), np.int64)
+        try:
+            return EpisodeStore.add(self, numeric, weight)
+        finally:
+            self._pending_objects = {}
+
+    def _write_slot(self, slot: int, columns: Dict[str, np.ndarray],
+                    start: int, end: int, *args, **kwargs) -> None:
+        pickled = {}
+        for column in self._objects:
+            value = self._pending_objects.get(column)
+            pickled[column] = pickle.dumps(
+                value[start:end] if value is not None else
+                np.full(end - start, None, dtype=object))
+            if len(pickled[column]) > self.object_bytes:
+                raise ValueError(
+                    "Column {} of an episode takes {} bytes pickled, more "
+                    "than object_bytes={}.".format(
+                        column, len(pickled[column]), self.object_bytes))
+        self._versions[slot] += 1  # odd: slot is being rewritten
+        EpisodeStore._write_slot(self, slot, columns, start, end, *args,
+                                 **kwargs)
+        for column, data in pickled.items():
+            self._objects[column][slot, :len(data)] = np.frombuffer(
+                data, dtype=np.uint8)
+            self._object_sizes[column][slot] = len(data)
+        self._versions[slot] += 1
+
+    def _episode_objects(self, column: str, slot: int) -> np.ndarray:
+        size = self._object_sizes[column][slot]
+        return pickle.loads(self._objects[column][slot, :size].tobytes())
+
+    def gather(self, idxes: np.ndarray,
+               weights: Optional[np.ndarray] = None) -> SampleBatch:
+        out = EpisodeStore.gather(self, idxes, weights)
+        for column in self._objects:
+            out[column] = np.concatenate(
+                [self._episode_objects(column, slot) for slot in idxes])
+        return out
+
+    def gather_padded(self, idxes: np.ndarray,
+                      weights: Optional[np.ndarray] = None) -> SampleBatch:
+        out = EpisodeStore.gather_padded(self, idxes, weights)
+        T = int(self._lengths[idxes].max())
+        for column in self._objects:
+            padded = np.full((len(idxes), T), None, dtype=object)
+            for i, slot in enumerate(idxes):
+                values = self._episode_objects(column, slot)
+                padded[i, :len(values)] = values
+            out[column] = padded.reshape(-1)
+        return out
+
+    def sample(self, num_items: int, beta: float = None) -> SampleBatch:
+        """Samples `num_items` whole episodes not rewritten while copied."""
+        while True:
+            idxes = self.sample_indexes(num_items)
+            before = self._versions[idxes].copy()
+            if np.any(before & 1):
+                continue
+            try:
+                batch = self.gather_padded(idxes) if self.padded else \
+                    self.gather(idxes)
+            except Exception:
+                # a torn read of a slot being rewritten can fail in any way
+                # (unpickling infos, lengths out of step with the data); it
+                # is only a bug if nothing was rewritten meanwhile
+                if np.array_equal(before, self._versions[idxes]):
+                    raise
+                continue
+            if np.array_equal(before, self._versions[idxes]):
+                return batch
+
+    def layout(self) -> Dict[str, Any]:
+        """Everything `attach` needs to map this store in another process."""
+        def spec(array):
+            return self._array_names[id(array)], array.shape, array.dtype.str
+
+        return {
+            "capacity": self.capacity,
+            "capacity_episodes": self.capacity_episodes,
+            "episode_limit": self.episode_limit,
+            "padded": self.padded,
+            "object_bytes": self.object_bytes,
+            "codecs": self.codecs,
+            "dtypes": {k: v.str for k, v in self._dtypes.items()},
+            "meta": spec(self._meta),
+            "versions": spec(self._versions),
+            "lengths": spec(self._lengths),
+            "seq_lens": spec(self._seq_lens),
+            "num_seqs": spec(self._num_seqs),
+            "columns": {k: spec(v) for k, v in self._columns.items()},
+            "seq_columns": {k: spec(v) for k, v in self._seq_columns.items()},
+            "objects": {k: spec(v) for k, v in self._objects.items()},
+            "object_sizes": {
+                k: spec(v)
+                for k, v in self._object_sizes.items()
+            },
+        }
+
+    def _open(self, spec) -> np.ndarray:
+        name, shape, dtype = spec
+        # the creating process unlinks the segment, not the readers
+        try:
+            segment = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:  # python < 3.13
+            segment = shared_memory.SharedMemory(name=name)
+            resource_tracker.unregister(segment._name, "shared_memory")
+        self._segments.append(segment)
+        return np.ndarray(shape, dtype=np.dtype(dtype), buffer=segment.buf)
+
+    def _map(self, layout: Dict[str, Any]) -> None:
+        # point every array at the memory `layout` describes
+        self.capacity_episodes = layout["capacity_episodes"]
+        self._dtypes = {k: np.dtype(v) for k, v in layout["dtypes"].items()}
+        self._meta = self._open(layout["meta"])
+        self._versions = self._open(layout["versions"])
+        self._lengths = self._open(layout["lengths"])
+        self._seq_lens = self._open(layout["seq_lens"])
+        self._num_seqs = self._open(layout["num_seqs"])
+        self._columns = {k: self._open(v) for k, v in layout["columns"].items()}
+        self._seq_columns = {
+            k: self._open(v)
+            for k, v in layout["seq_columns"].items()
+        }
+        self._objects = {
+            k: self._open(v)
+            for k, v in layout["objects"].items()
+        }
+        self._object_sizes = {
+            k: self._open(v)
+            for k, v in layout["object_sizes"].items()
+        }
+
+    @classmethod
+    def attach(cls, layout: Dict[str, Any]) -> "SharedEpisodeStore":
+        """A read-only view of the store described by `layout`."""
+        store = cls(layout["capacity"], layout["episode_limit"],
+                    layout["padded"], layout["object_bytes"], layout["codecs"])
+        store._owner = False
+        store._map(layout)
+        store._finalizer = weakref.finalize(store, _release, store._segments,
+                                            False)
+        return store
+
+    def close(self) -> None:
+        """Unmaps the store; the owner also frees the shared memory."""
+        self._columns, self._seq_columns = {}, {}
+        self._objects, self._object_sizes = {}, {}
+        self._lengths = self._seq_lens = self._num_seqs = None
+        self._versions = None
+        self._meta = np.array(self._meta)
+        if self._finalizer is not None:
+            self._finalizer()
+
+    def get_state(self) -> Dict[str, Any]:
+        # same format as EpisodeStore, with plain copies of the arrays
+        state = EpisodeStore.get_state(self)
+        for key in ("_lengths", "_seq_lens", "_num_seqs"):
+            state[key] = np.array(state[key])
+        state["_columns"] = {k: np.array(v) for k, v in self._columns.items()}
+        state["_seq_columns"] = {
+            k: np.array(v)
+            for k, v in self._seq_columns.items()
+        }
+        for column in self._objects:
+            values = np.full((self.capacity_episodes, self.episode_limit),
+                             None,
+                             dtype=object)
+            for slot in range(self._num_episodes):
+                episode = self._episode_objects(column, slot)
+                values[slot, :len(episode)] = episode
+            state["_columns"][column] = values
+        return state
+
+    def set_state(self, state: Dict[str, Any]) -> None:
+        self.capacity_episodes = state["capacity_episodes"]
+        self.episode_limit = state["episode_limit"]
+        if self.object_bytes is None:
+            self.object_bytes = 512 * self.episode_limit
+        self._dtypes = dict(state["_dtypes"])
+        if self._versions is None:
+            self._lengths = np.zeros(self.capacity_episodes, dtype=np.int64)
+            self._seq_lens = np.zeros(
+                (self.capacity_episodes, self.episode_limit), dtype=np.int64)
+            self._num_seqs = np.zeros(self.capacity_episodes, dtype=np.int64)
+            self._setup()
+        # rewrite every episode through the normal write path
+        for column, value in state["_columns"].items():
+            if value.dtype == object:
+                if column not in self._objects:
+                    self._objects[column] = self._shared(
+                        (self.capacity_episodes, self.object_bytes), np.uint8)
+                    self._object_sizes[column] = self._shared(
+                        (self.capacity_episodes, ), np.int64)
+            elif column not in self._columns:
+                self._columns[column] = self._allocate(value[0],
+                                                       self.episode_limit)
+        for column, value in state["_seq_columns"].items():
+            if column not in self._seq_columns:
+                self._seq_columns[column] = self._shared(
+                    (self.capacity_episodes, self.episode_limit) +
+                    value.shape[2:], value.dtype)
+        for slot in range(state["_num_episodes"]):
+            length = int(state["_lengths"][slot])
+            num_seqs = int(state["_num_seqs"][slot])
+            self._pending_objects = {
+                k: v[slot]
+                for k, v in state["_columns"].items() if v.dtype == object
+            }
+            self._write_slot(
+                slot,
+                {k: v[slot]
+                 for k, v in state["_columns"].items() if v.dtype != object},
+                0, length,
+                {k: v[slot]
+                 for k, v in state["_seq_columns"].items()},
+                state["_seq_lens"][slot], 0, num_seqs)
+        self._pending_objects = {}
+        self._num_episodes = state["_num_episodes"]
+        self._next_idx = state["_next_idx"]
+        self._num_timesteps_added = state["added_count"]
+        self._eviction_started = state["eviction_started"]
+        self._num_timesteps_sampled = state["sampled_count"]
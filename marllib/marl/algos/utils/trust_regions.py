@@ -1,3 +1,4 @@
+from ray.rllib.agents.ppo.ppo_torch_policy import kl_and_loss_stats
 from ray.rllib.utils.framework import try_import_torch
 from ray.rllib.policy.sample_batch import SampleBatch
 from ray.rllib.utils.torch_ops import sequence_mask
@@ -7,14 +8,33 @@ from marllib.marl.algos.utils.manipulate_tensor import flat_grad, flat_params, f
 
 torch, nn = try_import_torch()
 
+try:
+    from torch.func import functional_call, grad as func_grad, jvp
+except ImportError:
+    functional_call = None
+
 
 class TrustRegionUpdator:
+    """Natural gradient step on the actor within a KL trust region.
+
+    The Hessian of the mean KL is applied through a graph built once per
+    update: by default the first-order KL gradient graph is kept and every
+    Fisher-vector product is a backward pass through it; with
+    `functional_hvp` the products are forward-over-reverse (jvp of grad)
+    through torch.func instead, which keeps no graph alive between the CG
+    iterations. The CG loop and the line search run entirely on the device
+    and leave their results in `metrics` as tensors.
+    """
     kl_threshold = 0.01
     ls_step = 15
     accept_ratio = 0.1
     back_ratio = 0.8
     atol = 1e-7
     critic_lr = 5e-3
+    cg_steps = 10
+    cg_residual_tol = 1e-10
+    damping = 0.1
+    functional_hvp = False
 
     # delta = 0.01
 
@@ -27,18 +47,15 @@ class TrustRegionUpdator:
         self.initialize_critic_loss = initialize_critic_loss
         self.stored_actor_parameters = None
         self.device = get_device()
+        self.metrics = {}
+        self._kl_hvp = None
 
     @property
     def actor_parameters(self):
         return self.model.actor_parameters()
 
-    @property
-    def loss(self):
-        logits, state = self.model(self.train_batch)
-        try:
-            curr_action_dist = self.dist_class(logits, self.model)
-        except ValueError as e:
-            print(e)
+    def _surrogate(self, logits, state):
+        curr_action_dist = self.dist_class(logits, self.model)
 
         logp_ratio = torch.exp(
             curr_action_dist.logp(self.train_batch[SampleBatch.ACTIONS]) -
@@ -59,20 +76,24 @@ class TrustRegionUpdator:
         else:
             loss = torch.sum(logp_ratio * self.adv_targ, dim=-1, keepdim=True).mean()
 
-        new_loss = loss
-
-        return new_loss
+        return loss
 
-    @property
-    def kl(self):
-        _logits, _state = self.model(self.train_batch)
-        _curr_action_dist = self.dist_class(_logits, self.model)
+    def _kl(self, logits):
+        _curr_action_dist = self.dist_class(logits, self.model)
         action_dist_inputs = self.train_batch[SampleBatch.ACTION_DIST_INPUTS]
         _prev_action_dist = self.dist_class(action_dist_inputs, self.model)
 
-        kl = _prev_action_dist.kl(_curr_action_dist)
+        return _prev_action_dist.kl(_curr_action_dist)
 
-        return kl
+    @property
+    def loss(self):
+        logits, state = self.model(self.train_batch)
+        return self._surrogate(logits, state)
+
+    @property
+    def kl(self):
+        _logits, _state = self.model(self.train_batch)
+        return self._kl(_logits)
 
     @property
     def entropy(self):
@@ -89,43 +110,77 @@ class TrustRegionUpdator:
         vector_to_parameters(new_flat_params, self.actor_parameters)
 
     def store_current_actor_params(self):
-        self.stored_actor_parameters = self.actor_parameters
+        self.stored_actor_parameters = flat_params(self.actor_parameters).clone()
 
     def recovery_actor_params_to_before_linear_search(self):
-        stored_actor_parameters = flat_params(self.stored_actor_parameters)
-        self.set_actor_params(stored_actor_parameters)
+        self.set_actor_params(self.stored_actor_parameters)
 
     def reset_actor_params(self):
         initialized_actor_parameters = flat_params(self.model.actor_initialized_parameters)
         self.set_actor_params(initialized_actor_parameters)
 
-    def fisher_vector_product(self, p):
-        p.detach()
-        kl = self.kl.mean()
-        kl_grads = torch.autograd.grad(kl, self.actor_parameters, create_graph=True, allow_unused=True)
+    def _cached_kl_hvp(self):
+        params = self.actor_parameters
+        kl_grads = torch.autograd.grad(self.kl.mean(), params, create_graph=True, allow_unused=True)
+        used = [param for param, g in zip(params, kl_grads) if g is not None]
         kl_grads = flat_grad(kl_grads)
-        kl_grad_p = (kl_grads * p).sum()
-        kl_hessian_p = torch.autograd.grad(kl_grad_p, self.actor_parameters, allow_unused=True)
-        kl_hessian_p = flat_hessian(kl_hessian_p)
 
-        return kl_hessian_p + 0.1 * p
+        def hvp(p):
+            # H p is the vector-Jacobian product of the KL gradient with p, as H is symmetric
+            kl_hessian_p = torch.autograd.grad(kl_grads, used, grad_outputs=p, retain_graph=True, allow_unused=True)
+            return flat_hessian([torch.zeros_like(param) if h is None else h for param, h in zip(used, kl_hessian_p)])
+
+        return hvp
+
+    def _functional_kl_hvp(self):
+        params = self.actor_parameters
+        names = {id(param): name for name, param in self.model.named_parameters()}
+        keys = [names[id(param)] for param in params]
+        prev_action_dist = self.dist_class(self.train_batch[SampleBatch.ACTION_DIST_INPUTS], self.model)
+
+        def mean_kl(values):
+            logits, _ = functional_call(self.model, dict(zip(keys, values)), (self.train_batch,))
+            return prev_action_dist.kl(self.dist_class(logits, self.model)).mean()
+
+        primals = tuple(param.detach() for param in params)
+        sizes = [param.numel() for param in params]
+
+        def hvp(p):
+            tangents = tuple(t.view_as(param) for t, param in zip(torch.split(p, sizes), primals))
+            _, kl_hessian_p = jvp(func_grad(mean_kl), (primals,), (tangents,))
+            return flat_hessian(kl_hessian_p)
+
+        return hvp
+
+    def fisher_vector_product(self, p):
+        if self._kl_hvp is None:
+            if self.functional_hvp and functional_call is not None:
+                self._kl_hvp = self._functional_kl_hvp()
+            else:
+                self._kl_hvp = self._cached_kl_hvp()
+        return self._kl_hvp(p.detach()) + self.damping * p
 
     def conjugate_gradients(self, b, nsteps, residual_tol=1e-10):
-        x = torch.zeros(b.size()).to(device=self.device)
+        x = torch.zeros_like(b)
         r = b.clone()
         p = b.clone()
         rdotr = torch.dot(r, r)
+        zero = torch.zeros_like(rdotr)
+        iterations = torch.zeros_like(rdotr)
         for i in range(nsteps):
+            # a converged solve keeps x as it is rather than breaking on a host sync
+            active = rdotr >= residual_tol
             _Avp = self.fisher_vector_product(p)
-            alpha = rdotr / torch.dot(p, _Avp)
+            alpha = torch.where(active, rdotr / torch.dot(p, _Avp), zero)
             x += alpha * p
             r -= alpha * _Avp
             new_rdotr = torch.dot(r, r)
-            betta = new_rdotr / rdotr
+            betta = torch.where(active, new_rdotr / rdotr, zero)
             p = r + betta * p
-            rdotr = new_rdotr
-            if rdotr < residual_tol:
-                break
+            rdotr = torch.where(active, new_rdotr, rdotr)
+            iterations += active
+        self.metrics["cg_iterations"] = iterations
+        self.metrics["cg_residual"] = torch.sqrt(rdotr)
         return x
 
     def update(self, update_critic=True):
@@ -152,33 +207,69 @@ class TrustRegionUpdator:
         pol_grad = flat_grad(loss_grad)
         step_dir = self.conjugate_gradients(
             b=pol_grad.data,
-            nsteps=10,
+            nsteps=self.cg_steps,
+            residual_tol=self.cg_residual_tol,
         )
+        self._kl_hvp = None
 
         fisher_norm = pol_grad.dot(step_dir)
-        scala = 0 if fisher_norm < 0 else torch.sqrt(2 * self.kl_threshold / (fisher_norm + 1e-8))
-        full_step = scala * step_dir
-        loss = policy_loss.data.cpu().numpy()
-        params = flat_grad(self.actor_parameters)
+        scala = torch.where(
+            fisher_norm < 0, torch.zeros_like(fisher_norm),
+            torch.sqrt(2 * self.kl_threshold / (fisher_norm.clamp(min=0) + 1e-8)))
+        full_step = (scala * step_dir).detach()
+        loss = policy_loss.detach()
         self.store_current_actor_params()
-
-        expected_improve = pol_grad.dot(full_step).item()
-        linear_search_updated = False
-        fraction = 1
-        if expected_improve >= self.atol:
-            for i in range(self.ls_step):
-                new_params = params + fraction * full_step
-                self.set_actor_params(new_params)
-                new_loss = self.loss.data.cpu().numpy()
-                loss_improve = new_loss - loss
-                kl = self.kl.mean()
-                if kl < self.kl_threshold and (loss_improve / expected_improve) >= self.accept_ratio and \
-                        loss_improve.item() > 0:
-                    linear_search_updated = True
+        params = self.stored_actor_parameters
+
+        expected_improve = pol_grad.dot(full_step).detach()
+
+        # the backtracking line search tries the full step first, then the
+        # smaller ones in chunks twice as long as the last; the steps of a
+        # chunk are accepted on the device, and only whether any was leaves it
+        fractions = self.back_ratio ** torch.arange(self.ls_step, dtype=params.dtype, device=params.device)
+        fraction, updated = torch.zeros_like(loss), False
+        start, size = 0, 1
+        with torch.no_grad():
+            while start < self.ls_step:
+                chunk = fractions[start:start + size]
+                new_losses, kls = [], []
+                for step_fraction in chunk:
+                    self.set_actor_params(params + step_fraction * full_step)
+                    logits, state = self.model(self.train_batch)
+                    new_losses.append(self._surrogate(logits, state))
+                    kls.append(self._kl(logits).mean())
+                loss_improve = torch.stack(new_losses) - loss
+                accepted = (expected_improve >= self.atol) & (torch.stack(kls) < self.kl_threshold) & \
+                    (loss_improve / (expected_improve * chunk) >= self.accept_ratio) & (loss_improve > 0)
+                if accepted.any():
+                    fraction, updated = chunk[accepted.float().argmax()], True
                     break
-                else:
-                    expected_improve *= self.back_ratio
-                    fraction *= self.back_ratio
+                start, size = start + size, 2 * size
+
+        self.set_actor_params(params + fraction * full_step if updated else params)
+        self.metrics["step_fraction"] = fraction
+
+
+def average_metrics(metrics):
+    """Mean of each metric over the updates of several updators."""
+    return {name: torch.stack([m[name].float() for m in metrics]).mean() for name in metrics[0]} if metrics else {}
+
+
+def trust_region_step(policy, optimizer, loss):
+    """Takes the trust-region step prepared by the loss function.
+
+    Used as the policy's extra_grad_process_fn: it runs right after the
+    backward pass and before stats_fn collects the stats of the batch, so
+    `policy.trust_region_metrics` describe the update of that same batch.
+    """
+    policy.trpo_updator.update()
+    policy.trust_region_metrics = policy.trpo_updator.metrics
+    return {}
+
 
-            if not linear_search_updated:
-                self.recovery_actor_params_to_before_linear_search()
+def trust_region_stats(policy, train_batch):
+    """PPO's loss stats plus the metrics of the trust-region update of the
+    batch, which the learner stores as `policy.trust_region_metrics`."""
+    stats = kl_and_loss_stats(policy, train_batch)
+    stats.update(getattr(policy, "trust_region_metrics", {}))
+    return stats
@@ -4,7 +4,12 @@ import torch.nn as nn
 
 
 class ValueNorm(nn.Module):
-    """ Normalize a vector of observations - across the first norm_axes dimensions"""
+    """ Normalize a vector of observations - across the first norm_axes dimensions
+
+    The running mean and mean of squares are kept stacked in one registered buffer, so they move with the module
+    across devices, are saved in its state_dict and travel with the weights, and a single lerp_ updates both.
+    Inputs are moved to the buffers' device; numpy inputs are returned as numpy, tensors as tensors on that device.
+    """
 
     def __init__(self, input_shape, norm_axes=1, beta=0.99999, per_element_update=False, epsilon=1e-5,
                  device=torch.device("cpu")):
@@ -15,38 +20,53 @@ class ValueNorm(nn.Module):
         self.epsilon = epsilon
         self.beta = beta
         self.per_element_update = per_element_update
-        self.tpdv = dict(dtype=torch.float32, device=device)
 
-        self.running_mean = nn.Parameter(torch.zeros(input_shape), requires_grad=False).to(**self.tpdv)
-        self.running_mean_sq = nn.Parameter(torch.zeros(input_shape), requires_grad=False).to(**self.tpdv)
-        self.debiasing_term = nn.Parameter(torch.tensor(0.0), requires_grad=False).to(**self.tpdv)
+        self.register_buffer("running_moments", torch.zeros((2,) + torch.zeros(input_shape).shape,
+                                                            dtype=torch.float32, device=device))
+        self.register_buffer("debiasing_term", torch.tensor(0.0, dtype=torch.float32, device=device))
 
         self.reset_parameters()
 
-        self.updated = False
+    @property
+    def tpdv(self):
+        return dict(dtype=torch.float32, device=self.running_moments.device)
+
+    @property
+    def running_mean(self):
+        return self.running_moments[0]
+
+    @property
+    def running_mean_sq(self):
+        return self.running_moments[1]
+
+    @property
+    def updated(self):
+        return bool(self.debiasing_term > 0)
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        # state dicts saved before the moments were stacked hold them as two separate parameters
+        if prefix + "running_mean" in state_dict and prefix + "running_moments" not in state_dict:
+            state_dict[prefix + "running_moments"] = torch.stack([
+                state_dict.pop(prefix + "running_mean"), state_dict.pop(prefix + "running_mean_sq")])
+        super(ValueNorm, self)._load_from_state_dict(state_dict, prefix, *args, **kwargs)
 
     def reset_parameters(self):
-        self.running_mean.zero_()
-        self.running_mean_sq.zero_()
+        self.running_moments.zero_()
         self.debiasing_term.zero_()
 
     def running_mean_var(self):
-        debiased_mean = self.running_mean / self.debiasing_term.clamp(min=self.epsilon)
-        debiased_mean_sq = self.running_mean_sq / self.debiasing_term.clamp(min=self.epsilon)
+        debiased_mean, debiased_mean_sq = self.running_moments / self.debiasing_term.clamp(min=self.epsilon)
         debiased_var = (debiased_mean_sq - debiased_mean ** 2).clamp(min=1e-2)
         return debiased_mean, debiased_var
 
+    def _as_tensor(self, input_vector):
+        return torch.as_tensor(input_vector).to(**self.tpdv)
+
     @torch.no_grad()
     def update(self, input_vector):
+        input_vector = self._as_tensor(input_vector)
 
-        self.updated = True
-
-        if type(input_vector) == np.ndarray:
-            input_vector = torch.from_numpy(input_vector)
-        input_vector = input_vector.to(**self.tpdv)
-
-        batch_mean = input_vector.mean(dim=tuple(range(self.norm_axes)))
-        batch_sq_mean = (input_vector ** 2).mean(dim=tuple(range(self.norm_axes)))
+        batch_moments = torch.stack([input_vector, input_vector ** 2]).mean(dim=tuple(range(1, self.norm_axes + 1)))
 
         if self.per_element_update:
             batch_size = np.prod(input_vector.size()[:self.norm_axes])
@@ -54,31 +74,27 @@ class ValueNorm(nn.Module):
         else:
             weight = self.beta
 
-        self.running_mean.mul_(weight).add_(batch_mean * (1.0 - weight))
-        self.running_mean_sq.mul_(weight).add_(batch_sq_mean * (1.0 - weight))
-        self.debiasing_term.mul_(weight).add_(1.0 * (1.0 - weight))
+        # running = weight * running + (1 - weight) * batch
+        self.running_moments.lerp_(batch_moments, 1.0 - weight)
+        self.debiasing_term.lerp_(torch.ones_like(self.debiasing_term), 1.0 - weight)
 
     def normalize(self, input_vector):
-        # Make sure input is float32
-        if type(input_vector) == np.ndarray:
-            input_vector = torch.from_numpy(input_vector)
-        input_vector = input_vector.to(**self.tpdv)
+        is_numpy = isinstance(input_vector, np.ndarray)
+        input_vector = self._as_tensor(input_vector)
 
         mean, var = self.running_mean_var()
         out = (input_vector - mean[(None,) * self.norm_axes]) / torch.sqrt(var)[(None,) * self.norm_axes]
+        out = out.reshape(input_vector.shape)
 
-        return out.reshape(shape=input_vector.shape)
+        return out.cpu().numpy() if is_numpy else out
 
     def denormalize(self, input_vector):
         """ Transform normalized data back into original distribution """
-        if type(input_vector) == np.ndarray:
-            input_vector = torch.from_numpy(input_vector)
-        input_vector = input_vector.to(**self.tpdv)
+        is_numpy = isinstance(input_vector, np.ndarray)
+        input_vector = self._as_tensor(input_vector)
 
         mean, var = self.running_mean_var()
         out = input_vector * torch.sqrt(var)[(None,) * self.norm_axes] + mean[(None,) * self.norm_axes]
+        out = out.reshape(input_vector.shape)
 
-        out = out.cpu().numpy()
-
-        # return out
-        return out.reshape(input_vector.shape)
+        return out.cpu().numpy() if is_numpy else out
@@ -7,6 +7,7 @@ from ray.rllib.utils.annotations import override
 from ray.rllib.utils.framework import try_import_torch
 from ray.rllib.utils.typing import Dict, TensorType, List
 from marllib.marl.models.zoo.encoder.base_encoder import Base_Encoder
+from marllib.marl.models.zoo.tracing import ModelTracer
 
 torch, nn = try_import_torch()
 
@@ -60,6 +61,9 @@ class Base_MLP(TorchModelV2, nn.Module):
         self.actors = [self.p_encoder, self.p_branch]
         self.actor_initialized_parameters = self.actor_parameters()
 
+        # opt-in record of shapes and logit/value statistics, see ModelTracer
+        self.tracer = ModelTracer.from_config(self.custom_config)
+
     @override(TorchModelV2)
     def forward(self, input_dict: Dict[str, TensorType],
                 state: List[TensorType],
@@ -78,6 +82,8 @@ class Base_MLP(TorchModelV2, nn.Module):
         self._features = self.p_encoder(self.inputs)
 
         output = self.p_branch(self._features)
+        if self.tracer is not None:
+            self.tracer.record("logits", output)
 
         if self.custom_config["mask_flag"]:
             output = output + inf_mask
@@ -91,9 +97,12 @@ class Base_MLP(TorchModelV2, nn.Module):
         x = self.vf_encoder(self.inputs)
 
         if self.q_flag:
-            return torch.reshape(self.vf_branch(x), [B, -1])
+            value = torch.reshape(self.vf_branch(x), [B, -1])
         else:
-            return torch.reshape(self.vf_branch(x), [-1])
+            value = torch.reshape(self.vf_branch(x), [-1])
+        if self.tracer is not None:
+            self.tracer.record("value", value)
+        return value
 
     def actor_parameters(self):
         return reduce(lambda x, y: x + y, map(lambda p: list(p.parameters()), self.actors))
@@ -65,6 +65,22 @@ class JointQ_MLP(TorchModelV2, nn.Module):
         q = self.q_value(x)
         return q, [h]
 
+    def unroll(self, obs, seq_lens=None):
+        """Q-values for a [B, T, n_agents, obs_size] block of observations.
+
+        There is no recurrence, so all timesteps go through the network as
+        one batch. Returns [B, T, n_agents, num_outputs] Q-values and, as
+        forward() passes its state through, the [B, n_agents, hidden]
+        initial state.
+        """
+        B, T, n_agents = obs.shape[:3]
+        inputs = obs.reshape(B * T * n_agents, -1).float()
+        if len(self.full_obs_space.shape) == 3: # 3D
+            inputs = inputs.reshape((-1,) + self.full_obs_space.shape)
+        q = self.q_value(self.mlp(self.encoder(inputs)))
+        h = self.get_initial_state()[0].expand(B, n_agents, -1)
+        return q.reshape(B, T, n_agents, -1), [h]
+
 
 def _get_size(obs_space):
     return get_preprocessor(obs_space)(obs_space).size
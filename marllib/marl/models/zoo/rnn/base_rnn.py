@@ -10,6 +10,7 @@ from ray.rllib.utils.framework import try_import_tf, try_import_torch, \
 from ray.rllib.policy.rnn_sequencing import add_time_dimension
 from functools import reduce
 from marllib.marl.models.zoo.encoder.base_encoder import Base_Encoder
+from marllib.marl.models.zoo.tracing import ModelTracer
 
 tf1, tf, tfv = try_import_tf()
 torch, nn = try_import_torch()
@@ -73,6 +74,9 @@ class Base_RNN(TorchRNN, nn.Module):
         self.actors = [self.p_encoder, self.rnn, self.p_branch]
         self.actor_initialized_parameters = self.actor_parameters()
 
+        # opt-in record of shapes and logit/value statistics, see ModelTracer
+        self.tracer = ModelTracer.from_config(self.custom_config)
+
     @override(ModelV2)
     def get_initial_state(self):
         # Place hidden states on same device as model.
@@ -96,23 +100,22 @@ class Base_RNN(TorchRNN, nn.Module):
         x = self.vf_encoder(self.inputs)
 
         if self.q_flag:
-            return torch.reshape(self.vf_branch(x), [B * L, -1])
+            value = torch.reshape(self.vf_branch(x), [B * L, -1])
         else:
-            return torch.reshape(self.vf_branch(x), [-1])
+            value = torch.reshape(self.vf_branch(x), [-1])
+        if self.tracer is not None:
+            self.tracer.record("value", value)
+        return value
 
     @override(ModelV2)
     def forward(self, input_dict: Dict[str, TensorType],
                 state: List[TensorType],
                 seq_lens: TensorType):
-        if(input_dict["obs"]["obs"][0][29] == 0):
-            print(state[0].shape)
         """
         Adds time dimension to batch before sending inputs to forward_rnn()
         """
-        #print(input_dict["obs"]["obs"][0])
-        # print(seq_lens)
         if self.custom_config["global_state_flag"] or self.custom_config["mask_flag"]:
-            
+
             flat_inputs = input_dict["obs"]["obs"].float()
             # Convert action_mask into a [0.0 || -inf]-type mask.
             if self.custom_config["mask_flag"]:
@@ -120,13 +123,12 @@ class Base_RNN(TorchRNN, nn.Module):
                 inf_mask = torch.clamp(torch.log(action_mask), min=FLOAT_MIN)
         else:
             flat_inputs = input_dict["obs"]["obs"].float()
-        
+
         if isinstance(seq_lens, np.ndarray):
             seq_lens = torch.Tensor(seq_lens).int()
         max_seq_len = flat_inputs.shape[0] // seq_lens.shape[0]
-        
+
         self.time_major = self.model_config.get("_time_major", False)
-        # print(self.time_major)
         inputs = add_time_dimension(
             flat_inputs,
             max_seq_len=max_seq_len,
@@ -134,15 +136,14 @@ class Base_RNN(TorchRNN, nn.Module):
             time_major=self.time_major,
         )
         output, new_state = self.forward_rnn(inputs, state, seq_lens)
-        
-        
+
         output = torch.reshape(output, [-1, self.num_outputs])
-        print(sum(output[0]))
+        if self.tracer is not None:
+            self.tracer.record("state_in_0", state[0])
+            self.tracer.record("logits", output)
         if self.custom_config["mask_flag"]:
             output = output + inf_mask
-        
-        
-        
+
         return output, new_state
 
     @override(TorchRNN)
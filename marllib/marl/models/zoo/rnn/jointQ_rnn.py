@@ -63,3 +63,34 @@ class JointQ_RNN(TorchModelV2, nn.Module):
         q = self.q_value(h)
         return q, [h]
 
+    def unroll(self, obs, seq_lens=None):
+        """Q-values for a [B, T, n_agents, obs_size] block of observations.
+
+        Same as carrying the hidden state through forward() one step at a
+        time from the initial state (RLlib's _unroll_mac), but the encoder
+        sees all timesteps as one batch and the GRU runs over time in a
+        single fused call. Returns [B, T, n_agents, num_outputs] Q-values
+        and the [B, n_agents, hidden] state after the last step, or after
+        step seq_lens - 1 of each zero-padded sequence when seq_lens is given.
+        """
+        B, T, n_agents = obs.shape[:3]
+        inputs = obs.reshape(B * T * n_agents, -1).float()
+        if len(self.full_obs_space.shape) == 3: # 3D
+            inputs = inputs.reshape((-1,) + self.full_obs_space.shape)
+        x = self.encoder(inputs)
+        # one sequence per (batch, agent)
+        x = x.reshape(B, T, n_agents, -1).transpose(1, 2).reshape(B * n_agents, T, -1)
+        h_in = self.get_initial_state()[0].expand(B, n_agents, -1).reshape(
+            1, B * n_agents, self.hidden_state_size).contiguous()
+        # GRUCell weights have the layout of a one layer GRU
+        with torch.backends.cudnn.flags(enabled=False):
+            h, _ = torch.gru(x, h_in, [self.rnn.weight_ih, self.rnn.weight_hh, self.rnn.bias_ih, self.rnn.bias_hh],
+                             True, 1, 0.0, self.training, False, True)
+        h = h.reshape(B, n_agents, T, -1)
+        q = self.q_value(h.transpose(1, 2))
+        if seq_lens is None:
+            h_out = h[:, :, -1]
+        else:
+            last = torch.as_tensor(seq_lens, device=h.device).long() - 1
+            h_out = h[torch.arange(B, device=h.device), :, last]
+        return q, [h_out]
@@ -0,0 +1,84 @@
+from collections import deque
+from typing import Dict, Optional
+
+from ray.rllib.agents.callbacks import DefaultCallbacks
+from ray.rllib.utils.framework import try_import_torch
+from ray.rllib.utils.typing import TensorType
+
+torch, nn = try_import_torch()
+
+
+class ModelTracer:
+    """Ring buffer of tensor shapes and statistics from a model's forward passes.
+
+    `record` keeps the shape and a [mean, std, min, max] tensor computed on
+    the tensor's own device; nothing is copied to the host until `summary`
+    reads the buffer, so tracing adds no device sync to a forward pass.
+    Models keep `tracer = None` when tracing is off and check for it before
+    recording, which is all tracing costs then.
+    """
+
+    def __init__(self, capacity: int):
+        self.records = deque(maxlen=capacity)
+
+    @classmethod
+    def from_config(cls, custom_config: Dict) -> Optional["ModelTracer"]:
+        """A tracer keeping the last `trace_capacity` records of the model
+        arch args, or None when it is 0 or unset."""
+        capacity = custom_config["model_arch_args"].get("trace_capacity", 0)
+        return cls(capacity) if capacity else None
+
+    def record(self, name: str, tensor: TensorType) -> None:
+        with torch.no_grad():
+            values = tensor.detach().float()
+            stats = torch.stack([
+                values.mean(),
+                values.std(unbiased=False),
+                values.min(),
+                values.max()
+            ]) if values.numel() else None
+        self.records.append((name, tuple(tensor.shape), stats))
+
+    def summary(self) -> Dict[str, Dict]:
+        """Per recorded name: how many records the buffer holds, the last
+        shape, the averaged mean and std, and the overall min and max."""
+        stats, shapes, counts = {}, {}, {}
+        for name, shape, values in self.records:
+            counts[name] = counts.get(name, 0) + 1
+            shapes[name] = shape
+            if values is not None:
+                stats.setdefault(name, []).append(values)
+        summary = {}
+        for name in counts:
+            summary[name] = {"count": counts[name], "shape": shapes[name]}
+            if name in stats:
+                values = torch.stack(stats[name]).cpu().numpy()
+                summary[name].update({
+                    "mean": float(values[:, 0].mean()),
+                    "std": float(values[:, 1].mean()),
+                    "min": float(values[:, 2].min()),
+                    "max": float(values[:, 3].max()),
+                })
+        return summary
+
+
+def _policy_traces(policy, policy_id):
+    tracer = getattr(getattr(policy, "model", None), "tracer", None)
+    return policy_id, tracer.summary() if tracer is not None else None
+
+
+class ModelTracingCallbacks(DefaultCallbacks):
+    """Reports the traces of every worker's models with the train results,
+    as result["info"]["model_trace"][worker][policy_id]. Worker 0 is the
+    local (learner) worker."""
+
+    def on_train_result(self, *, trainer, result: dict, **kwargs) -> None:
+        traces = trainer.workers.foreach_worker(
+            lambda worker: worker.foreach_policy(_policy_traces))
+        result["info"]["model_trace"] = {
+            "worker_{}".format(i): {
+                policy_id: summary
+                for policy_id, summary in worker_traces if summary is not None
+            }
+            for i, worker_traces in enumerate(traces)
+        }
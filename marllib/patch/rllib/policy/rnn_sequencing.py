@@ -247,22 +247,18 @@ def chop_into_sequences(*,
     """
 
     if seq_lens is None or len(seq_lens) == 0:
-        prev_id = None
-        seq_lens = []
-        seq_len = 0
         unique_ids = np.add(
             np.add(episode_ids, agent_indices),
             np.array(unroll_ids, dtype=np.int64) << 32)
-        for uid in unique_ids:
-            if (prev_id is not None and uid != prev_id) or \
-                    seq_len >= max_seq_len:
-                seq_lens.append(seq_len)
-                seq_len = 0
-            seq_len += 1
-            prev_id = uid
-        if seq_len:
-            seq_lens.append(seq_len)
-        seq_lens = np.array(seq_lens, dtype=np.int32)
+        # Runs of equal ids, each cut into pieces of at most max_seq_len.
+        run_ends = np.append(
+            np.flatnonzero(unique_ids[1:] != unique_ids[:-1]) + 1,
+            len(unique_ids))
+        run_lens = np.diff(run_ends, prepend=0)[:len(unique_ids)]
+        num_pieces = -(-run_lens // max_seq_len)
+        seq_lens = np.full(np.sum(num_pieces), max_seq_len, dtype=np.int32)
+        seq_lens[np.cumsum(num_pieces) - 1] = \
+            run_lens - (num_pieces - 1) * max_seq_len
 
     assert sum(seq_lens) == len(feature_columns[0])
 
@@ -271,24 +267,26 @@ def chop_into_sequences(*,
         max_seq_len = max(seq_lens) + _extra_padding
 
     feature_sequences = []
-    for i, f in enumerate(feature_columns):
+    length = len(seq_lens) * max_seq_len
+    # Row of every timestep in the padded [NUM_SEQUENCES * MAX_SEQ_LEN] layout,
+    # shared by all columns.
+    seq_starts = np.cumsum(seq_lens) - seq_lens
+    total = int(np.sum(seq_lens))
+    pad_index = np.arange(total) + np.repeat(
+        np.arange(len(seq_lens)) * max_seq_len - seq_starts, seq_lens)
+    for f in feature_columns:
         # Save unnecessary copy.
         if not isinstance(f, np.ndarray):
             f = np.array(f)
-        length = len(seq_lens) * max_seq_len
+        assert total == len(f), f
         if f.dtype == np.object or f.dtype.type is np.str_:
             f_pad = [None] * length
+            for row, value in zip(pad_index.tolist(), f):
+                f_pad[row] = value
         else:
             # Make sure type doesn't change.
             f_pad = np.zeros((length, ) + np.shape(f)[1:], dtype=f.dtype)
-        seq_base = 0
-        i = 0
-        for len_ in seq_lens:
-            for seq_offset in range(len_):
-                f_pad[seq_base + seq_offset] = f[i]
-                i += 1
-            seq_base += max_seq_len
-        assert i == len(f), f
+            f_pad[pad_index] = f
         feature_sequences.append(f_pad)
 
     if states_already_reduced_to_init:
@@ -299,12 +297,7 @@ def chop_into_sequences(*,
             # Skip unnecessary copy.
             if not isinstance(s, np.ndarray):
                 s = np.array(s)
-            s_init = []
-            i = 0
-            for len_ in seq_lens:
-                s_init.append(s[i])
-                i += len_
-            initial_states.append(np.array(s_init))
+            initial_states.append(s[seq_starts])
 
     if shuffle:
         permutation = np.random.permutation(len(seq_lens))
@@ -21,6 +21,9 @@ setup(
     package_data={'': ['*.yaml']},
     include_package_data=True,
     install_requires=install_requires,
+    extras_require={
+        "lz4": ["lz4"],  # the "lz4" replay codec, see EpisodeStore
+    },
     classifiers=[
         "License :: OSI Approved :: MIT License",
         "Intended Audience :: Developers",
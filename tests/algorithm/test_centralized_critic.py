@@ -0,0 +1,98 @@
+import unittest
+import numpy as np
+from gym.spaces import Box, Discrete
+from ray.rllib.policy.sample_batch import SampleBatch
+from marllib.marl.algos.utils.centralized_critic import centralized_critic_postprocessing
+
+AGENTS = ["agent_0", "agent_1", "agent_2"]
+
+
+class CentralCriticPolicy:
+    # just what the postprocessing touches: a row-wise central value function that counts its calls
+    device = "cpu"
+
+    def __init__(self, global_state_flag, opp_action_in_cc):
+        self.calls = 0
+        self.config = {
+            "gamma": 0.99,
+            "lambda": 0.95,
+            "use_gae": True,
+            "model": {"custom_model_config": {
+                "framework": "torch",
+                "algorithm": "mappo",
+                "space_obs": {"obs": Box(-1, 1, shape=(4,)), "state": Box(-1, 1, shape=(6,))},
+                "space_act": Discrete(5),
+                "mask_flag": False,
+                "global_state_flag": global_state_flag,
+                "opp_action_in_cc": opp_action_in_cc,
+                "num_agents": len(AGENTS),
+                "agent_name_ls": AGENTS,
+            }},
+        }
+
+    def compute_central_vf(self, state, opponent_actions=None):
+        self.calls += 1
+        value = state.reshape(len(state), -1).sum(1)
+        if opponent_actions is not None:
+            value = value + opponent_actions.reshape(len(state), -1).sum(1)
+        return value
+
+
+class Episode:
+
+    def __init__(self):
+        self.user_data = {}
+
+
+def agent_batches(rng, lengths, obs_dim):
+    return {
+        agent_id: SampleBatch({
+            SampleBatch.OBS: rng.normal(size=(length, obs_dim)).astype(np.float32),
+            SampleBatch.ACTIONS: rng.integers(0, 5, size=length),
+            SampleBatch.REWARDS: rng.normal(size=length).astype(np.float32),
+            SampleBatch.DONES: np.arange(length) == length - 1,
+        })
+        for agent_id, length in zip(AGENTS, lengths)
+    }
+
+
+def postprocess(policy, batches, episode):
+    # what the sample collector does at the end of an episode
+    out = {}
+    for agent_id, batch in batches.items():
+        others = {k: (policy, b) for k, b in batches.items() if k != agent_id}
+        out[agent_id] = centralized_critic_postprocessing(policy, batch, others, episode)
+    return out
+
+
+class TestCentralizedCriticPostprocessing(unittest.TestCase):
+
+    def test_one_forward_pass_per_episode(self):
+        rng = np.random.default_rng(0)
+        for global_state_flag, opp_action_in_cc in [(False, True), (False, False), (True, True), (True, False)]:
+            obs_dim = 10 if global_state_flag else 4
+            lengths = [12, 12, 9] if not global_state_flag else [12, 12, 12]
+            batches = agent_batches(rng, lengths, obs_dim)
+
+            separate = CentralCriticPolicy(global_state_flag, opp_action_in_cc)
+            expected = postprocess(separate, {k: b.copy() for k, b in batches.items()}, None)
+            self.assertEqual(separate.calls, len(AGENTS))
+
+            batched = CentralCriticPolicy(global_state_flag, opp_action_in_cc)
+            episode = Episode()
+            result = postprocess(batched, batches, episode)
+            self.assertEqual(batched.calls, 1)
+            for agent_id in AGENTS:
+                for column in expected[agent_id].keys():
+                    np.testing.assert_allclose(result[agent_id][column], expected[agent_id][column], rtol=1e-6)
+
+            # the next fragment of the episode is a new round
+            postprocess(batched, agent_batches(rng, lengths, obs_dim), episode)
+            self.assertEqual(batched.calls, 2)
+
+
+if __name__ == "__main__":
+    import pytest
+    import sys
+
+    sys.exit(pytest.main(["-v", __file__]))
@@ -0,0 +1,77 @@
+import threading
+import unittest
+import gym
+import numpy as np
+import ray
+from ray.rllib.agents.dqn import DEFAULT_CONFIG
+from ray.rllib.agents.trainer_template import build_trainer
+from ray.rllib.examples.policy.random_policy import RandomPolicy
+from marllib.marl.algos.utils.episode_execution_plan import episode_execution_plan
+
+EPISODE_LIMIT = 5
+
+
+class FixedLengthEnv(gym.Env):
+    observation_space = gym.spaces.Box(low=-1, high=1, shape=(3,), dtype=np.float32)
+    action_space = gym.spaces.Discrete(2)
+
+    def __init__(self, env_config=None):
+        self.t = 0
+
+    def reset(self):
+        self.t = 0
+        return self.observation_space.sample()
+
+    def step(self, action):
+        self.t += 1
+        return self.observation_space.sample(), 1.0, self.t == EPISODE_LIMIT, {}
+
+
+EpisodeTrainer = build_trainer(
+    name="EpisodeTrainer",
+    default_config=DEFAULT_CONFIG,
+    default_policy=RandomPolicy,
+    execution_plan=episode_execution_plan)
+
+
+class TestSharedMemoryPlan(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        ray.init(num_cpus=2, include_dashboard=False)
+
+    @classmethod
+    def tearDownClass(cls):
+        ray.shutdown()
+
+    def test_first_train_waits_for_learning_starts(self):
+        for num_workers in (0, 1):
+            trainer = EpisodeTrainer(env=FixedLengthEnv, config={
+                "framework": "torch",
+                "num_workers": num_workers,
+                "batch_mode": "complete_episodes",
+                "rollout_fragment_length": EPISODE_LIMIT,
+                "model": {"max_seq_len": EPISODE_LIMIT},
+                "shared_memory_replay": True,
+                "learning_starts": 10 * EPISODE_LIMIT,
+                "buffer_size": 100 * EPISODE_LIMIT,
+                "train_batch_size": 2,
+                "timesteps_per_iteration": 0,
+                "min_iter_time_s": 0,
+                "target_network_update_freq": 10 ** 9,
+            })
+            self.assertEqual(trainer.local_replay_buffer.num_added, 0)
+            result = trainer.train()
+            self.assertIsInstance(result, dict)
+            self.assertGreaterEqual(trainer.local_replay_buffer.num_added, 10 * EPISODE_LIMIT)
+            # only remote workers are sampled off the trainer's thread
+            ingesting = any(thread.name == "replay_ingest" for thread in threading.enumerate())
+            self.assertEqual(ingesting, num_workers > 0)
+            trainer.stop()
+
+
+if __name__ == "__main__":
+    import pytest
+    import sys
+
+    sys.exit(pytest.main(["-v", __file__]))
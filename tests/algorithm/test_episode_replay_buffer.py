@@ -0,0 +1,308 @@
+import importlib.util
+import os
+import tempfile
+import unittest
+import numpy as np
+from ray.rllib.policy.sample_batch import SampleBatch, MultiAgentBatch
+from ray.rllib.policy.rnn_sequencing import chop_into_sequences
+from marllib.marl.algos.utils.episode_replay_buffer import EpisodeBasedReplayBuffer, EpisodeStore, \
+    PrioritizedEpisodeStore, SumTree
+from marllib.marl.algos.utils.mmap_episode_store import MmapEpisodeStore
+from marllib.marl.algos.utils.shared_episode_store import SharedEpisodeStore
+
+
+def make_episode(rng, eps_id, length):
+    return SampleBatch({
+        SampleBatch.OBS: rng.normal(size=(length, 3, 4)).astype(np.float32),
+        SampleBatch.ACTIONS: rng.integers(0, 5, size=(length, 3)),
+        SampleBatch.DONES: np.arange(length) == length - 1,
+        SampleBatch.EPS_ID: np.full(length, eps_id),
+        SampleBatch.INFOS: np.array([{"_group_rewards": [float(t)] * 3} for t in range(length)], dtype=object),
+    })
+
+
+class TestEpisodeStore(unittest.TestCase):
+
+    def test_gather_matches_concat_samples(self):
+        rng = np.random.default_rng(0)
+        buffer = EpisodeBasedReplayBuffer(learning_starts=0, capacity=10 * 20, replay_batch_size=4, episode_limit=20)
+        episodes = {}
+        for eps_id in range(37):
+            batch = make_episode(rng, eps_id, int(rng.integers(1, 26)))
+            episodes[eps_id] = batch
+            if eps_id % 3 == 0:  # several episodes in one batch
+                extra = make_episode(rng, 1000 + eps_id, 5)
+                episodes[1000 + eps_id] = extra
+                batch = SampleBatch.concat_samples([batch, extra])
+            buffer.add_batch(MultiAgentBatch({"policy": batch}, batch.count))
+
+        store = buffer.replay_buffers["policy"]
+        self.assertEqual(len(store), 10)
+        for trial in range(20):
+            idxes = store.sample_indexes(4)
+            self.assertEqual(len(set(idxes)), 4)
+            sampled = store.gather(idxes)
+            expected = SampleBatch.concat_samples(
+                [episodes[int(store._columns[SampleBatch.EPS_ID][i, 0])] for i in idxes])
+            for column in expected.keys():
+                np.testing.assert_array_equal(sampled[column], expected[column])
+
+        restored = EpisodeStore(10 * 20)
+        restored.set_state(store.get_state())
+        np.testing.assert_array_equal(restored.gather(np.array([1, 2]))[SampleBatch.OBS],
+                                      store.gather(np.array([1, 2]))[SampleBatch.OBS])
+
+    def test_rnn_state_columns_follow_their_episodes(self):
+        rng = np.random.default_rng(1)
+        store = EpisodeStore(6 * 20, episode_limit=20)
+        episodes = {}
+        for eps_id in range(15):
+            batch = make_episode(rng, eps_id, int(rng.integers(1, 21)))
+            seq_lens = np.diff(np.append(np.arange(0, batch.count, 8), batch.count))
+            batch["state_in_0"] = rng.normal(size=(len(seq_lens), 16)).astype(np.float32)
+            batch[SampleBatch.SEQ_LENS] = seq_lens
+            episodes[eps_id] = batch
+            store.add(batch)
+
+        idxes = store.sample_indexes(4)
+        sampled = store.gather(idxes)
+        expected = SampleBatch.concat_samples(
+            [episodes[int(store._columns[SampleBatch.EPS_ID][i, 0])] for i in idxes])
+        for column in expected.keys():
+            np.testing.assert_array_equal(sampled[column], expected[column])
+
+    def test_padded_gather_matches_chop_into_sequences(self):
+        rng = np.random.default_rng(2)
+        store = EpisodeStore(8 * 20, episode_limit=20, padded=True)
+        for eps_id in range(12):
+            batch = make_episode(rng, eps_id, int(rng.integers(1, 21)))
+            batch[SampleBatch.UNROLL_ID] = np.zeros(batch.count, dtype=np.int64)
+            batch[SampleBatch.AGENT_INDEX] = np.zeros(batch.count, dtype=np.int64)
+            store.add(batch)
+
+        idxes = store.sample_indexes(5)
+        padded = store.gather_padded(idxes)
+        flat = store.gather(idxes)
+        columns = [SampleBatch.OBS, SampleBatch.ACTIONS, SampleBatch.DONES]
+        chopped, _, seq_lens = chop_into_sequences(
+            episode_ids=flat[SampleBatch.EPS_ID],
+            unroll_ids=flat[SampleBatch.UNROLL_ID],
+            agent_indices=flat[SampleBatch.AGENT_INDEX],
+            feature_columns=[flat[c] for c in columns],
+            state_columns=[],
+            max_seq_len=20,
+            dynamic_max=True)
+        self.assertTrue(padded.zero_padded)
+        np.testing.assert_array_equal(padded[SampleBatch.SEQ_LENS], seq_lens)
+        for column, expected in zip(columns, chopped):
+            np.testing.assert_array_equal(padded[column], expected)
+
+    def test_codecs_decode_to_the_stored_dtypes(self):
+        self.assert_codecs_decode_to_the_stored_dtypes({SampleBatch.OBS: "uint8", SampleBatch.REWARDS: "float16"})
+
+    @unittest.skipUnless(importlib.util.find_spec("lz4") is not None, "lz4 is not installed")
+    def test_lz4_codec_decodes_to_the_stored_dtypes(self):
+        self.assert_codecs_decode_to_the_stored_dtypes(
+            {SampleBatch.OBS: "uint8", SampleBatch.REWARDS: "float16", SampleBatch.ACTIONS: "lz4"})
+
+    def assert_codecs_decode_to_the_stored_dtypes(self, codecs):
+        rng = np.random.default_rng(8)
+        stores = [EpisodeStore(6 * 20, episode_limit=20, codecs=codecs),
+                  EpisodeStore(6 * 20, episode_limit=20, padded=True, codecs=codecs),
+                  SharedEpisodeStore(6 * 20, episode_limit=20, codecs={SampleBatch.OBS: "uint8"})]
+        plain = EpisodeStore(6 * 20, episode_limit=20)
+        for eps_id in range(9):
+            batch = make_episode(rng, eps_id, int(rng.integers(1, 21)))
+            batch[SampleBatch.OBS] = rng.integers(0, 36, size=batch[SampleBatch.OBS].shape).astype(np.float32)
+            batch[SampleBatch.REWARDS] = rng.integers(-8, 8, size=batch.count).astype(np.float32) / 4
+            for store in stores + [plain]:
+                store.add(batch)
+        self.assertEqual(stores[0]._columns[SampleBatch.OBS].dtype, np.uint8)
+
+        idxes = np.array([4, 1, 5])
+        reader = SharedEpisodeStore.attach(stores[2].layout())
+        for store in stores + [reader]:
+            for gather in ("gather", "gather_padded"):
+                sampled, expected = getattr(store, gather)(idxes), getattr(plain, gather)(idxes)
+                for column in (SampleBatch.OBS, SampleBatch.REWARDS, SampleBatch.ACTIONS):
+                    self.assertEqual(sampled[column].dtype, expected[column].dtype)
+                    np.testing.assert_array_equal(sampled[column], expected[column])
+        for store in (reader, stores[2]):
+            store.close()
+
+        with self.assertRaises(ValueError):
+            stores[0].add(make_episode(rng, 100, 5))  # obs are not small integers
+
+
+class TestPrioritizedEpisodeStore(unittest.TestCase):
+
+    def test_sum_tree(self):
+        rng = np.random.default_rng(3)
+        tree = SumTree(13)
+        values = np.zeros(13)
+        for _ in range(50):
+            idxes = rng.integers(0, 13, size=4)
+            new = rng.random(4)
+            tree.update(idxes, new)
+            values[idxes] = new
+            self.assertAlmostEqual(tree.total(), values.sum())
+        prefixes = rng.random(1000) * values.sum()
+        np.testing.assert_array_equal(tree.find_prefixsum_idx(prefixes),
+                                      np.searchsorted(np.cumsum(values), prefixes))
+
+    def test_samples_by_priority(self):
+        rng = np.random.default_rng(4)
+        store = PrioritizedEpisodeStore(4 * 10, episode_limit=10, alpha=1.0)
+        for eps_id in range(4):
+            store.add(make_episode(rng, eps_id, 10))
+        store.update_priorities(np.arange(4), np.array([1., 2., 3., 4.]))
+        counts = np.bincount(np.concatenate([store.sample_indexes(10) for _ in range(2000)]), minlength=4)
+        np.testing.assert_allclose(counts / counts.sum(), [.1, .2, .3, .4], atol=0.01)
+
+        batch = store.sample(10, beta=1.0)
+        slots = batch["batch_indexes"]
+        np.testing.assert_allclose(batch["weights"], 1. / (slots + 1), rtol=1e-6)
+        # a new episode takes the highest priority so far
+        store.add(make_episode(rng, 4, 10))
+        self.assertEqual(store._tree[0], 4.)
+
+
+class TestSharedEpisodeStore(unittest.TestCase):
+    store_class = SharedEpisodeStore
+
+    def assert_batches_equal(self, batch, expected):
+        for column in expected.keys():
+            if expected[column].dtype == object:
+                self.assertEqual(list(batch[column]), list(expected[column]))
+            else:
+                np.testing.assert_array_equal(batch[column], expected[column])
+
+    def test_matches_episode_store(self):
+        rng = np.random.default_rng(5)
+        shared = self.store_class(8 * 20, episode_limit=20)
+        plain = EpisodeStore(8 * 20, episode_limit=20)
+        for eps_id in range(19):
+            batch = make_episode(rng, eps_id, int(rng.integers(1, 21)))
+            shared.add(batch)
+            plain.add(batch)
+
+        reader = self.store_class.attach(shared.layout())
+        idxes = np.array([5, 0, 7, 5])
+        for store in (shared, reader):
+            self.assert_batches_equal(store.gather(idxes), plain.gather(idxes))
+            self.assert_batches_equal(store.gather_padded(idxes), plain.gather_padded(idxes))
+        with self.assertRaises(ValueError):
+            reader.add(make_episode(rng, 100, 5))
+        with self.assertRaises(ValueError):
+            shared.add(make_episode(rng, 101, 21))
+
+        restored = self.store_class(8 * 20)
+        restored.set_state(shared.get_state())
+        self.assert_batches_equal(restored.gather(idxes), plain.gather(idxes))
+        for store in (reader, restored, shared):
+            store.close()
+
+    def test_sample_retries_any_torn_read(self):
+        rng = np.random.default_rng(8)
+        store = self.store_class(4 * 10, episode_limit=10)
+        for eps_id in range(4):
+            store.add(make_episode(rng, eps_id, 10))
+        gather, calls = store.gather, []
+
+        def torn_gather(idxes):
+            calls.append(idxes)
+            if len(calls) == 1:
+                # a writer rewrote the slot mid-copy
+                store._versions[idxes] += 2
+                raise IndexError("lengths out of step with the data")
+            return gather(idxes)
+
+        store.gather = torn_gather
+        self.assertEqual(store.sample(2).count, 20)
+        self.assertEqual(len(calls), 2)
+
+        def broken_gather(idxes):
+            raise IndexError("nothing was rewritten")
+
+        store.gather = broken_gather
+        with self.assertRaises(IndexError):
+            store.sample(2)
+        store.close()
+
+
+class TestMmapEpisodeStore(TestSharedEpisodeStore):
+    store_class = MmapEpisodeStore
+
+    def test_checkpoint_holds_paths_only(self):
+        rng = np.random.default_rng(6)
+        with tempfile.TemporaryDirectory() as directory:
+            buffer = EpisodeBasedReplayBuffer(learning_starts=0, capacity=8 * 20, replay_batch_size=4,
+                                              episode_limit=20, directory=directory)
+            plain = EpisodeStore(8 * 20, episode_limit=20)
+            for eps_id in range(11):
+                batch = make_episode(rng, eps_id, int(rng.integers(1, 21)))
+                buffer.add_batch(MultiAgentBatch({"policy": batch}, batch.count))
+                plain.add(batch)
+            store = buffer.replay_buffers["policy"]
+            self.assertIsInstance(store, MmapEpisodeStore)
+
+            idxes = np.array([3, 0, 7, 3])
+            self.assert_batches_equal(store.gather(idxes), plain.gather(idxes))
+            state = buffer.get_state()
+            self.assertNotIn("_columns", state["replay_buffers"]["policy"])
+            self.assertTrue(all(os.path.dirname(path).startswith(directory)
+                                for path, _, _ in state["replay_buffers"]["policy"]["layout"]["columns"].values()))
+
+            restored = EpisodeBasedReplayBuffer(learning_starts=0, capacity=8 * 20, replay_batch_size=4,
+                                                episode_limit=20, directory=os.path.join(directory, "restored"))
+            restored.set_state(state)
+            restored_store = restored.replay_buffers["policy"]
+            self.assertEqual(len(restored_store), len(plain))
+            self.assert_batches_equal(restored_store.gather(idxes), plain.gather(idxes))
+            batch = make_episode(rng, 11, 9)
+            restored.add_batch(MultiAgentBatch({"policy": batch}, batch.count))
+            plain.add(batch)
+            self.assert_batches_equal(restored_store.gather(np.arange(8)), plain.gather(np.arange(8)))
+            for s in (store, restored_store):
+                s.close()
+
+    def test_temporary_directory_is_removed(self):
+        rng = np.random.default_rng(7)
+        store = MmapEpisodeStore(4 * 10, episode_limit=10)
+        store.add(make_episode(rng, 0, 10))
+        directory = store.directory
+        self.assertTrue(os.path.isdir(directory))
+        restored = EpisodeStore(4 * 10)
+        restored.set_state(store.get_state())
+        np.testing.assert_array_equal(restored.gather(np.array([0]))[SampleBatch.OBS],
+                                      store.gather(np.array([0]))[SampleBatch.OBS])
+        store.close()
+        self.assertFalse(os.path.exists(directory))
+
+    def test_stores_sharing_a_directory_keep_their_own_files(self):
+        rng = np.random.default_rng(9)
+        with tempfile.TemporaryDirectory() as directory:
+            stores = [MmapEpisodeStore(4 * 10, episode_limit=10, directory=directory) for _ in range(2)]
+            episodes = [make_episode(rng, eps_id, 10) for eps_id in range(2)]
+            for store, episode in zip(stores, episodes):
+                store.add(episode)
+            self.assertNotEqual(stores[0].directory, stores[1].directory)
+            for store, episode in zip(stores, episodes):
+                self.assertEqual(os.path.dirname(store.directory), directory)
+                np.testing.assert_array_equal(store.gather(np.array([0]))[SampleBatch.OBS], episode[SampleBatch.OBS])
+
+            restored = MmapEpisodeStore(4 * 10, directory=directory)
+            restored.set_state(stores[0].get_state())
+            restored.close()
+            self.assertTrue(os.path.isdir(stores[0].directory))
+            for store in stores:
+                store.close()
+                self.assertFalse(os.path.exists(store.directory))
+            self.assertEqual(os.listdir(directory), [])
+
+
+if __name__ == "__main__":
+    import pytest
+    import sys
+
+    sys.exit(pytest.main(["-v", __file__]))
@@ -0,0 +1,109 @@
+import threading
+import unittest
+from unittest import mock
+import torch
+from torch import nn
+from ray.rllib.policy.sample_batch import SampleBatch
+from marllib.marl.algos.utils import heterogeneous_updateing
+from marllib.marl.algos.utils.centralized_critic_hetero import get_global_name, global_state_name
+from marllib.marl.algos.utils.heterogeneous_updateing import (
+    get_each_agent_group_train,
+    get_iter_train_batch,
+    update_agent_group,
+    update_group_m_advantage,
+)
+
+
+class Categorical:
+
+    def __init__(self, inputs, model):
+        self.dist = torch.distributions.Categorical(logits=inputs)
+
+    def logp(self, actions):
+        return self.dist.log_prob(actions)
+
+
+class Actor(nn.Module):
+
+    def __init__(self):
+        nn.Module.__init__(self)
+        self.logits = nn.Linear(4, 3)
+
+    def forward(self, batch):
+        return self.logits(batch[SampleBatch.OBS]), []
+
+
+def agent_train_info(batch):
+    model = Actor()
+    with torch.no_grad():
+        prev_action_logp = Categorical(model(batch)[0], model).logp(batch[SampleBatch.ACTIONS]) - 0.1 * torch.rand(16)
+    return model, Categorical, batch, None, torch.mean, batch[SampleBatch.ACTIONS], None, prev_action_logp
+
+
+class TestHeterogeneousUpdating(unittest.TestCase):
+
+    def test_iter_train_batch_views(self):
+        main = SampleBatch({
+            SampleBatch.OBS: torch.zeros(6, 4),
+            SampleBatch.SEQ_LENS: torch.tensor([4, 2]),
+            "state_in_0": torch.zeros(2, 8),
+            get_global_name(SampleBatch.OBS, "agent_1"): torch.ones(6, 4),
+            get_global_name(SampleBatch.OBS, "agent_11"): torch.full((6, 4), 11.),
+            get_global_name(SampleBatch.ACTIONS, "agent_1"): torch.arange(6),
+            get_global_name("training", "agent_1"): torch.ones(6, dtype=torch.bool),
+            global_state_name(0, "agent_1"): torch.ones(2, 8),
+            global_state_name(1, "agent_1"): torch.ones(2, 8) * 2,
+        })
+        iter_batch = get_iter_train_batch(main, "agent_1")
+
+        self.assertIs(iter_batch[SampleBatch.OBS], main[get_global_name(SampleBatch.OBS, "agent_1")])
+        self.assertIs(iter_batch[SampleBatch.ACTIONS], main[get_global_name(SampleBatch.ACTIONS, "agent_1")])
+        self.assertIs(iter_batch["training"], main[get_global_name("training", "agent_1")])
+        self.assertIs(iter_batch["state_in_0"], main[global_state_name(0, "agent_1")])
+        self.assertIs(iter_batch["state_in_1"], main[global_state_name(1, "agent_1")])
+        self.assertIs(iter_batch[SampleBatch.SEQ_LENS], main[SampleBatch.SEQ_LENS])
+        self.assertIsNone(iter_batch["state_in_2"])
+        self.assertIn("state_in_1", iter_batch)
+        self.assertNotIn("state_in_2", iter_batch)
+        self.assertNotIn(SampleBatch.REWARDS, iter_batch)
+        self.assertEqual(get_iter_train_batch(main, "agent_11")[SampleBatch.OBS][0, 0], 11.)
+
+        # later epochs over the same batch reuse the views
+        self.assertIs(get_iter_train_batch(main, "agent_1"), iter_batch)
+
+    def test_agents_are_split_into_groups(self):
+        with mock.patch.object(heterogeneous_updateing, "get_each_agent_train", return_value=iter(range(5))):
+            self.assertEqual(list(get_each_agent_group_train(None, None, None, None, 2)), [[0, 1], [2, 3], [4]])
+        with mock.patch.object(heterogeneous_updateing, "get_each_agent_train", return_value=iter(range(3))):
+            self.assertEqual(list(get_each_agent_group_train(None, None, None, None)), [[0], [1], [2]])
+
+    def test_group_is_updated_concurrently(self):
+        # every update waits for all the others, which only returns if they run at the same time
+        barrier = threading.Barrier(4, timeout=10)
+
+        def update_agent(i):
+            barrier.wait()
+            return i * i
+
+        self.assertEqual(update_agent_group(update_agent, [0, 1, 2, 3]), [0, 1, 4, 9])
+        self.assertEqual(update_agent_group(lambda i: i + 1, [5]), [6])
+
+    def test_group_advantage_correction_is_the_sequential_one(self):
+        torch.manual_seed(0)
+        batch = {SampleBatch.OBS: torch.randn(16, 4), SampleBatch.ACTIONS: torch.randint(0, 3, (16, ))}
+        group = [agent_train_info(batch) for _ in range(3)]
+        m_advantage = torch.randn(16)
+
+        sequential = m_advantage
+        for iter_agent_info in group:
+            sequential = update_group_m_advantage([iter_agent_info], sequential)
+
+        torch.testing.assert_close(update_group_m_advantage(group, m_advantage), sequential)
+        torch.testing.assert_close(update_group_m_advantage(group[::-1], m_advantage), sequential)
+
+
+if __name__ == "__main__":
+    import pytest
+    import sys
+
+    sys.exit(pytest.main(["-v", __file__]))
@@ -0,0 +1,132 @@
+import unittest
+import numpy as np
+from ray.rllib.policy import rnn_sequencing
+from marllib.marl.algos.utils import unify_sample_batch_length
+
+
+def reference_chop_into_sequences(feature_columns, state_columns, max_seq_len, episode_ids, unroll_ids,
+                                  agent_indices, dynamic_max=True):
+    # the per-timestep loops chop_into_sequences used to run, kept to check the vectorized version against
+    prev_id = None
+    seq_lens = []
+    seq_len = 0
+    unique_ids = np.add(np.add(episode_ids, agent_indices), np.array(unroll_ids, dtype=np.int64) << 32)
+    for uid in unique_ids:
+        if (prev_id is not None and uid != prev_id) or seq_len >= max_seq_len:
+            seq_lens.append(seq_len)
+            seq_len = 0
+        seq_len += 1
+        prev_id = uid
+    if seq_len:
+        seq_lens.append(seq_len)
+    seq_lens = np.array(seq_lens, dtype=np.int32)
+    if dynamic_max:
+        max_seq_len = max(seq_lens)
+
+    feature_sequences = []
+    for f in feature_columns:
+        length = len(seq_lens) * max_seq_len
+        if f.dtype == object:
+            f_pad = [None] * length
+        else:
+            f_pad = np.zeros((length,) + np.shape(f)[1:], dtype=f.dtype)
+        seq_base = 0
+        i = 0
+        for len_ in seq_lens:
+            for seq_offset in range(len_):
+                f_pad[seq_base + seq_offset] = f[i]
+                i += 1
+            seq_base += max_seq_len
+        feature_sequences.append(f_pad)
+
+    initial_states = []
+    for s in state_columns:
+        s_init = []
+        i = 0
+        for len_ in seq_lens:
+            s_init.append(s[i])
+            i += len_
+        initial_states.append(np.array(s_init))
+    return feature_sequences, initial_states, seq_lens
+
+
+def mappo_batch(rng, num_agents, episode_limit, num_episodes, fragment, obs_dim=64, hidden=64, lstm=False):
+    """
+    A rollout batch shaped like a recurrent MAPPO train batch: num_agents agents' episodes of random length cut
+    into rollout fragments, with obs, actions, advantages, infos and one (GRU) or two (LSTM) state columns.
+    """
+    lengths = rng.integers(episode_limit // 2, episode_limit + 1, size=num_episodes)
+    episode_ids = np.repeat(np.arange(num_episodes), lengths)
+    steps = np.concatenate([np.arange(length) for length in lengths])
+    count = len(episode_ids) * num_agents
+    batch = {
+        "eps_id": np.tile(episode_ids, num_agents),
+        "agent_index": np.repeat(np.arange(num_agents), len(episode_ids)),
+        "unroll_id": np.tile(steps // fragment + episode_ids * 1000, num_agents),
+        "obs": rng.normal(size=(count, obs_dim)).astype(np.float32),
+        "actions": rng.integers(0, 10, size=count),
+        "advantages": rng.normal(size=count).astype(np.float32),
+        "dones": np.zeros(count, dtype=bool),
+        "infos": np.array([{"step": int(t)} for t in range(count)], dtype=object),
+    }
+    states = ["state_in_0", "state_in_1"] if lstm else ["state_in_0"]
+    for key in states:
+        batch[key] = rng.normal(size=(count, hidden)).astype(np.float32)
+    return batch, states
+
+
+def chop(module, batch, states, max_seq_len):
+    return module.chop_into_sequences(
+        feature_columns=[batch[k] for k in ("obs", "actions", "advantages", "dones", "infos")],
+        state_columns=[batch[k] for k in states],
+        episode_ids=batch["eps_id"],
+        unroll_ids=batch["unroll_id"],
+        agent_indices=batch["agent_index"],
+        max_seq_len=max_seq_len,
+        dynamic_max=True)
+
+
+class TestChopIntoSequences(unittest.TestCase):
+
+    def assert_same(self, expected, result):
+        for expected_part, part in zip(expected, result):
+            for e, r in zip(expected_part, part):
+                if isinstance(e, list):
+                    self.assertEqual(e, r)
+                else:
+                    self.assertEqual(e.dtype, r.dtype)
+                    np.testing.assert_array_equal(e, r)
+        np.testing.assert_array_equal(expected[2], result[2])
+        self.assertEqual(expected[2].dtype, result[2].dtype)
+
+    def test_matches_reference(self):
+        rng = np.random.default_rng(0)
+        for lstm in (False, True):
+            for max_seq_len in (1, 7, 20, 200):
+                batch, states = mappo_batch(rng, 3, 25, 6, 16, obs_dim=5, hidden=4, lstm=lstm)
+                expected = reference_chop_into_sequences(
+                    [batch[k] for k in ("obs", "actions", "advantages", "dones", "infos")],
+                    [batch[k] for k in states], max_seq_len, batch["eps_id"], batch["unroll_id"],
+                    batch["agent_index"])
+                for module in (rnn_sequencing, unify_sample_batch_length):
+                    self.assert_same(expected, chop(module, batch, states, max_seq_len))
+
+    def test_docstring_example(self):
+        for module in (rnn_sequencing, unify_sample_batch_length):
+            f_pad, s_init, seq_lens = module.chop_into_sequences(
+                episode_ids=[1, 1, 5, 5, 5, 5],
+                unroll_ids=[4, 4, 4, 4, 4, 4],
+                agent_indices=[0, 0, 0, 0, 0, 0],
+                feature_columns=[[4, 4, 8, 8, 8, 8], [1, 1, 0, 1, 1, 0]],
+                state_columns=[[4, 5, 4, 5, 5, 5]],
+                max_seq_len=3)
+            np.testing.assert_array_equal(f_pad, [[4, 4, 0, 8, 8, 8, 8, 0, 0], [1, 1, 0, 0, 1, 1, 0, 0, 0]])
+            np.testing.assert_array_equal(s_init, [[4, 4, 5]])
+            np.testing.assert_array_equal(seq_lens, [2, 3, 1])
+
+
+if __name__ == "__main__":
+    import pytest
+    import sys
+
+    sys.exit(pytest.main(["-v", __file__]))
@@ -0,0 +1,169 @@
+import unittest
+from types import SimpleNamespace
+import torch
+from torch import nn
+from ray.rllib.policy.sample_batch import SampleBatch
+from marllib.marl.algos.utils.trust_regions import TrustRegionUpdator, trust_region_stats, trust_region_step
+
+
+class Categorical:
+    # the part of TorchCategorical the updator uses
+
+    def __init__(self, inputs, model):
+        self.dist = torch.distributions.Categorical(logits=inputs)
+
+    def logp(self, actions):
+        return self.dist.log_prob(actions)
+
+    def kl(self, other):
+        return torch.distributions.kl_divergence(self.dist, other.dist)
+
+    def entropy(self):
+        return self.dist.entropy()
+
+
+class ActorCritic(nn.Module):
+
+    def __init__(self):
+        nn.Module.__init__(self)
+        self.actor = nn.Sequential(nn.Linear(4, 8), nn.Tanh(), nn.Linear(8, 3))
+        self.critic = nn.Linear(4, 1)
+
+    def forward(self, batch):
+        return self.actor(batch[SampleBatch.OBS]), []
+
+    def actor_parameters(self):
+        return list(self.actor.parameters())
+
+    def critic_parameters(self):
+        return list(self.critic.parameters())
+
+
+def updator(model, batch, **overrides):
+    advantages = batch["advantages"]
+    logits, state = model(batch)
+    updator = TrustRegionUpdator(model, Categorical, batch, advantages, None)
+    updator.initialize_policy_loss = updator._surrogate(logits, state)
+    for name, value in overrides.items():
+        setattr(updator, name, value)
+    return updator
+
+
+def make_batch(model, n=64):
+    torch.manual_seed(1)
+    obs = torch.randn(n, 4)
+    with torch.no_grad():
+        logits = model.actor(obs) + 0.1 * torch.randn(n, 3)
+    dist = torch.distributions.Categorical(logits=logits)
+    actions = dist.sample()
+    return {
+        SampleBatch.OBS: obs,
+        SampleBatch.ACTIONS: actions,
+        SampleBatch.ACTION_LOGP: dist.log_prob(actions),
+        SampleBatch.ACTION_DIST_INPUTS: logits,
+        "advantages": torch.randn(n),
+    }
+
+
+def fisher_matrix(model, batch):
+    params = model.actor_parameters()
+    shapes = [p.shape for p in params]
+    sizes = [p.numel() for p in params]
+    flat = torch.cat([p.detach().reshape(-1) for p in params])
+
+    def mean_kl(flat):
+        weights = [v.view(s) for v, s in zip(torch.split(flat, sizes), shapes)]
+        hidden = torch.tanh(batch[SampleBatch.OBS] @ weights[0].t() + weights[1])
+        logits = hidden @ weights[2].t() + weights[3]
+        prev = torch.distributions.Categorical(logits=batch[SampleBatch.ACTION_DIST_INPUTS])
+        return torch.distributions.kl_divergence(prev, torch.distributions.Categorical(logits=logits)).mean()
+
+    return torch.autograd.functional.hessian(mean_kl, flat)
+
+
+class TestTrustRegionUpdator(unittest.TestCase):
+
+    def setUp(self):
+        torch.manual_seed(0)
+        self.model = ActorCritic()
+        self.batch = make_batch(self.model)
+
+    def test_fisher_vector_products(self):
+        fisher = fisher_matrix(self.model, self.batch)
+        p = torch.randn(len(fisher))
+        for functional_hvp in [False, True]:
+            trust_region = updator(self.model, self.batch, functional_hvp=functional_hvp)
+            torch.testing.assert_close(trust_region.fisher_vector_product(p),
+                                       fisher @ p + trust_region.damping * p,
+                                       rtol=1e-4, atol=1e-6)
+
+    def test_conjugate_gradients_on_device(self):
+        trust_region = updator(self.model, self.batch)
+        fisher = fisher_matrix(self.model, self.batch)
+        fisher = fisher + trust_region.damping * torch.eye(len(fisher))
+        b = torch.randn(len(fisher))
+        x = trust_region.conjugate_gradients(b, nsteps=len(fisher) * 2)
+        torch.testing.assert_close(x, torch.linalg.solve(fisher, b), rtol=1e-3, atol=1e-4)
+        # iterations past convergence are masked out
+        self.assertLess(trust_region.metrics["cg_iterations"].item(), len(fisher) * 2)
+        self.assertLess(trust_region.metrics["cg_residual"].item(), 1e-5)
+
+    def test_update_stays_in_trust_region(self):
+        before = updator(self.model, self.batch).loss.item()
+        trust_region = updator(self.model, self.batch)
+        trust_region.update(update_critic=False)
+
+        fraction = trust_region.metrics["step_fraction"].item()
+        self.assertIn(round(fraction, 6), [round(trust_region.back_ratio ** i, 6) for i in range(trust_region.ls_step)])
+        self.assertGreater(trust_region.loss.item(), before)
+        self.assertLess(trust_region.kl.mean().item(), trust_region.kl_threshold)
+
+    def test_rejected_line_search_keeps_the_parameters(self):
+        before = [p.detach().clone() for p in self.model.actor_parameters()]
+        trust_region = updator(self.model, self.batch, accept_ratio=float("inf"))
+        trust_region.update(update_critic=False)
+
+        self.assertEqual(trust_region.metrics["step_fraction"].item(), 0)
+        for p, q in zip(self.model.actor_parameters(), before):
+            torch.testing.assert_close(p.detach(), q, rtol=0, atol=0)
+
+    def test_line_search_stops_at_the_first_accepted_step(self):
+        def forwards(**overrides):
+            calls = []
+            forward = self.model.forward
+            self.model.forward = lambda batch: calls.append(1) or forward(batch)
+            initial = [p.detach().clone() for p in self.model.actor_parameters()]
+            trust_region = updator(self.model, self.batch, **overrides)
+            trust_region.update(update_critic=False)
+            self.model.forward = forward
+            with torch.no_grad():
+                for p, q in zip(self.model.actor_parameters(), initial):
+                    p.copy_(q)
+            return len(calls), trust_region
+
+        rejected, trust_region = forwards(accept_ratio=float("inf"))
+        outside_line_search = rejected - trust_region.ls_step
+        # the full step, and a step a few fractions in
+        for overrides, tried in [({}, 1), ({"back_ratio": 0.8, "kl_threshold": 1, "accept_ratio": 0.9}, 5)]:
+            calls, trust_region = forwards(**overrides)
+            self.assertAlmostEqual(trust_region.metrics["step_fraction"].item(), trust_region.back_ratio ** (tried - 1))
+            # the chunks tried at most twice the steps up to the accepted one
+            self.assertLess(calls - outside_line_search, 2 * tried)
+            self.assertLess(calls - outside_line_search, trust_region.ls_step)
+
+    def test_stats_report_the_update_of_the_batch(self):
+        # TorchPolicy calls extra_grad_process_fn after the backward pass and stats_fn right after it
+        policy = SimpleNamespace(trpo_updator=updator(self.model, self.batch))
+        policy.trpo_updator.initialize_critic_loss = self.model.critic(self.batch[SampleBatch.OBS]).pow(2).mean()
+        trust_region_step(policy, None, policy.trpo_updator.initialize_policy_loss)
+        stats = trust_region_stats(policy, self.batch)
+
+        for name in ["cg_iterations", "cg_residual", "step_fraction"]:
+            self.assertIs(stats[name], policy.trpo_updator.metrics[name])
+
+
+if __name__ == "__main__":
+    import pytest
+    import sys
+
+    sys.exit(pytest.main(["-v", __file__]))
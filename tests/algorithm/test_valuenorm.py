@@ -0,0 +1,66 @@
+import unittest
+import numpy as np
+import torch
+from marllib.marl.algos.utils.popart import PopArt
+from marllib.marl.algos.utils.valuenorm import ValueNorm
+
+
+class TestValueNorm(unittest.TestCase):
+
+    def test_statistics(self):
+        value_norm = ValueNorm(1, beta=0.9)
+        self.assertFalse(value_norm.updated)
+        values = np.random.default_rng(0).normal(3., 2., size=(4096, 1)).astype(np.float32)
+        for batch in np.split(values, 64):
+            value_norm.update(batch)
+        self.assertTrue(value_norm.updated)
+
+        mean, var = value_norm.running_mean_var()
+        self.assertAlmostEqual(mean.item(), 3., delta=0.3)
+        self.assertAlmostEqual(var.item(), 4., delta=1.)
+
+        normalized = value_norm.normalize(values)
+        self.assertIsInstance(normalized, np.ndarray)
+        np.testing.assert_allclose(value_norm.denormalize(normalized), values, rtol=1e-4, atol=1e-4)
+        # tensors stay tensors
+        self.assertIsInstance(value_norm.normalize(torch.from_numpy(values)), torch.Tensor)
+
+    def test_statistics_are_saved_with_the_state_dict(self):
+        value_norm = ValueNorm(1)
+        value_norm.update(torch.randn(32, 1) + 5.)
+        model = torch.nn.ModuleDict({"value_normalizer": value_norm})
+
+        restored = torch.nn.ModuleDict({"value_normalizer": ValueNorm(1)})
+        restored.load_state_dict(model.state_dict())
+        for expected, actual in zip(value_norm.running_mean_var(), restored["value_normalizer"].running_mean_var()):
+            torch.testing.assert_close(actual, expected)
+        self.assertEqual(list(value_norm.parameters()), [])
+
+        # state dicts with the moments as two separate entries still load
+        state = value_norm.state_dict()
+        running_mean, running_mean_sq = state.pop("running_moments")
+        state.update(running_mean=running_mean, running_mean_sq=running_mean_sq)
+        restored = ValueNorm(1)
+        restored.load_state_dict(state)
+        torch.testing.assert_close(restored.running_moments, value_norm.running_moments)
+
+    def test_popart_updates_in_forward(self):
+        popart = PopArt(2, norm_axes=2, beta=0.9)
+        value_norm = ValueNorm(2, norm_axes=2, beta=0.9)
+        values = torch.randn(4, 5, 2, requires_grad=True)
+
+        value_norm.update(values)
+        out = popart(values)
+        torch.testing.assert_close(out, value_norm.normalize(values))
+        out.sum().backward()
+        self.assertIsNotNone(values.grad)
+
+        popart(values, train=False)
+        torch.testing.assert_close(popart.running_moments, value_norm.running_moments)
+
+
+if __name__ == "__main__":
+    import pytest
+    import sys
+
+    sys.exit(pytest.main(["-v", __file__]))
@@ -0,0 +1,169 @@
+import math
+import unittest
+import numpy as np
+from shapely import Point, Polygon, box
+from marllib.envs.base_env.mecanum import Mecanum, MecanumBatch, ObstacleArray
+from marllib.envs.base_env.mecanum_pst_movement_env import MecMvmt
+from marllib.envs.base_env.mecanum_sampler import GoalSampler
+
+ENV_CONFIG = {"min_x": -100, "max_x": 100, "min_y": -100, "max_y": 100, "max_time": 60, "timestep": 0.1, "seed": 0}
+ROBOT = {"max_motor_velocity": 7.5, "motor_acceleration": 7.5, "wheel_radius": 1.8895, "track_width": 9.0, "wheelbase_length": 11.0}
+
+
+class TestMecanumBatch(unittest.TestCase):
+
+    def test_matches_scalar_kinematics(self):
+        rng = np.random.default_rng(0)
+        starts = rng.uniform([-100, -100, 0], [100, 100, 2*math.pi], size=(8, 3))
+        batch = MecanumBatch(num_robots=8, start_points=starts, **ROBOT)
+        robots = [Mecanum(start_point=start, **ROBOT) for start in starts]
+        for step in range(100):
+            commands = rng.uniform(-1, 1, size=(8, 3))
+            batch.move(commands[:, 0], commands[:, 1], commands[:, 2], timestep=0.1)
+            for robot, command in zip(robots, commands):
+                robot.move(*command, timestep=0.1)
+            if(step % 7 == 0):
+                batch.revert()
+                for robot in robots:
+                    robot.revert()
+            np.testing.assert_allclose(batch.pose, [[robot.x, robot.y, robot.theta] for robot in robots], atol=1e-9)
+            np.testing.assert_allclose(batch.motor_velocities, [robot.motor_velocities for robot in robots], atol=1e-12)
+            np.testing.assert_allclose(batch.corners(), [np.asarray(robot.robot_shape.exterior.coords)[:-1] for robot in robots], atol=1e-9)
+
+    def test_geometry_matches_shapely(self):
+        rng = np.random.default_rng(1)
+        starts = rng.uniform([-60, -60, 0], [60, 60, 2*math.pi], size=(200, 3))
+        batch = MecanumBatch(num_robots=200, start_points=starts, **ROBOT)
+        shapes = [Polygon(corners) for corners in batch.corners()]
+        obstacles = [Point(rng.uniform(-60, 60, size=2)).buffer(rng.uniform(1, 10), quad_segs=2) for i in range(10)]
+        obstacles += [box(-5, -5, 5, 5), Polygon([(30, 30), (45, 30), (30, 50)])]
+        clips = batch.clips_polygons(ObstacleArray(obstacles))
+        for k, shape in enumerate(shapes):
+            self.assertEqual(list(clips[k]), [shape.intersects(poly) and not shape.touches(poly) for poly in obstacles])
+
+        goals = rng.uniform(-60, 60, size=(200, 2))
+        contained = batch.point_contained(goals)
+        out = batch.out_of_bounds(-50, -50, 50, 50)
+        field = box(-50, -50, 50, 50)
+        for k, shape in enumerate(shapes):
+            self.assertEqual(contained[k], shape.contains(Point(goals[k])))
+            self.assertEqual(out[k], not field.contains_properly(shape))
+        self.assertEqual(batch.clips_polygons(ObstacleArray([])).shape, (200, 0))
+
+    def test_grid_index_matches_dense(self):
+        rng = np.random.default_rng(2)
+        obstacles = [Point(rng.uniform(-70, 70, size=2)).buffer(rng.uniform(0.5, 4), quad_segs=2) for i in range(40)]
+        obstacles.append(Polygon([(-20, 90), (20, 90), (0, 120)]))
+        starts = rng.uniform([-120, -120, 0], [120, 120, 2*math.pi], size=(500, 3))
+        batch = MecanumBatch(num_robots=500, start_points=starts, **ROBOT)
+        dense = batch.clips_polygons(ObstacleArray(obstacles))
+        for cell_size in (None, 5.0, 100.0):
+            indexed = batch.clips_polygons(ObstacleArray(obstacles, reach=batch.robot_diagonal, cell_size=cell_size))
+            np.testing.assert_array_equal(indexed, dense)
+        self.assertTrue(dense.any())
+
+
+class TestMecMvmtFrameSkip(unittest.TestCase):
+
+    def test_frame_skip_matches_repeated_actions(self):
+        rng = np.random.default_rng(3)
+        single = MecMvmt(dict(ENV_CONFIG, frame_skip=1, **ROBOT))
+        skipping = MecMvmt(dict(ENV_CONFIG, frame_skip=4, **ROBOT))
+        for episode in range(20):
+            single.reset()
+            skipping.reset()
+            done = False
+            while not done:
+                action = {agent: rng.uniform(0, 1, size=1) for agent in single.agents}
+                obs, rewards, dones, _ = skipping.step(action)
+                total = 0.0
+                for substep in range(4):
+                    single_obs, single_rewards, single_dones, _ = single.step(action)
+                    total += single_rewards["power"]
+                    if(single_rewards["power"] != -0.5 or single_dones["__all__"]):
+                        break
+                done = dones["__all__"]
+                self.assertEqual(done, single_dones["__all__"])
+                self.assertAlmostEqual(rewards["power"], total)
+                np.testing.assert_array_equal(obs["power"]["obs"], single_obs["power"]["obs"])
+
+
+class TestGoalSampler(unittest.TestCase):
+
+    def test_curriculum_widens_with_success(self):
+        config = {"goal_sampler": "curriculum", "curriculum_start_radius": 10, "curriculum_window": 5, "curriculum_threshold": 0.6}
+        sampler = GoalSampler([-100, -100, 0], [100, 100, 2*math.pi], np.random.default_rng(0), config)
+        for trial in range(100):
+            start, goal = sampler.sample()
+            self.assertLessEqual(np.linalg.norm(goal - start[:2]), 10 + 1e-9)
+            self.assertTrue(((goal >= -100) & (goal <= 100)).all())
+        for episode in range(5):
+            sampler.record(start, goal, success = episode != 0)
+        self.assertAlmostEqual(sampler.radius, 12.5)
+        for episode in range(5):
+            sampler.record(start, goal, success = episode < 2)
+        self.assertAlmostEqual(sampler.radius, 12.5)
+
+    def test_hard_pairs_are_replayed(self):
+        config = {"hard_buffer_size": 2, "hard_replay_prob": 1.0}
+        sampler = GoalSampler([-100, -100, 0], [100, 100, 2*math.pi], np.random.default_rng(0), config)
+        start, goal = sampler.sample()
+        sampler.record(start, goal, success = True)
+        self.assertEqual(len(sampler.hard_pairs), 0)
+        sampler.record(start, goal, success = False)
+        replayed_start, replayed_goal = sampler.sample()
+        np.testing.assert_array_equal(replayed_start, start)
+        np.testing.assert_array_equal(replayed_goal, goal)
+
+    def test_hard_pairs_are_stored_once(self):
+        config = {"hard_buffer_size": 2, "hard_replay_prob": 0.0}
+        sampler = GoalSampler([-100, -100, 0], [100, 100, 2*math.pi], np.random.default_rng(0), config)
+        first, second, third = [sampler.sample() for pair in range(3)]
+        for start, goal in [first, first, second, first]:
+            sampler.record(start, goal, success = False)
+        self.assertEqual(len(sampler.hard_pairs), 2)
+        #the third pair evicts the first, which can then be stored again
+        for start, goal in [third, first]:
+            sampler.record(start, goal, success = False)
+        np.testing.assert_array_equal(sampler.hard_pairs[0][0], third[0])
+        np.testing.assert_array_equal(sampler.hard_pairs[1][0], first[0])
+
+    def test_replayed_pairs_leave_the_curriculum_alone(self):
+        config = {"goal_sampler": "curriculum", "curriculum_window": 2, "curriculum_threshold": 0.5,
+                  "hard_buffer_size": 4, "hard_replay_prob": 1.0}
+        sampler = GoalSampler([-100, -100, 0], [100, 100, 2*math.pi], np.random.default_rng(0), config)
+        first, second = sampler.sample(), sampler.sample()
+        self.assertFalse(sampler.replaying)
+        for start, goal in [first, second]:
+            sampler.record(start, goal, success = False)
+        #replays only ever draw stored pairs; their outcomes do not count towards the radius, and solved ones are dropped
+        radius, outcomes = sampler.radius, list(sampler.outcomes)
+        for episode in range(10):
+            start, goal = sampler.sample()
+            self.assertTrue(sampler.replaying)
+            sampler.record(start, goal, success = True)
+            self.assertEqual(list(sampler.outcomes), outcomes)
+            if(len(sampler.hard_pairs) == 0):
+                break
+        self.assertEqual(sampler.radius, radius)
+        self.assertEqual(len(sampler.hard_pairs), 0)
+        self.assertEqual(len(sampler.hard_keys), 0)
+
+    def test_env_records_episode_outcomes(self):
+        env = MecMvmt(dict(ENV_CONFIG, goal_sampler="curriculum", curriculum_start_radius=5, curriculum_window=3, **ROBOT))
+        robot = env.robot
+        while env.goal_sampler.radius == 5:
+            env.reset()
+            done = False
+            while not done:
+                obs, rewards, dones, _ = env.step({agent: np.zeros(1) for agent in env.agents})
+                done = dones["__all__"]
+        self.assertIs(env.robot, robot)
+        self.assertGreater(env.goal_sampler.radius, 5)
+
+
+if __name__ == "__main__":
+    import pytest
+    import sys
+
+    sys.exit(pytest.main(["-v", __file__]))
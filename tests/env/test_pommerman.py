@@ -0,0 +1,109 @@
+import queue
+import unittest
+from collections import defaultdict
+import numpy as np
+
+try:
+    from pommerman import constants, utility
+    from marllib.envs.base_env.pommerman import NEIGHBOURS, SimpleAgent, distance_map
+except ImportError:
+    constants = None
+
+EXCLUDE = None if constants is None else [constants.Item.Fog, constants.Item.Rigid, constants.Item.Flames]
+
+
+def queue_djikstra(board, my_position, bombs, enemies, depth):
+    """The SimpleAgent search before the array BFS, collecting every parent
+    it could have picked for a cell instead of flipping coins between them."""
+    items = defaultdict(list)
+    dist = {}
+    parents = {}
+    Q = queue.Queue()
+
+    my_x, my_y = my_position
+    for r in range(max(0, my_x - depth), min(len(board), my_x + depth)):
+        for c in range(max(0, my_y - depth), min(len(board), my_y + depth)):
+            position = (r, c)
+            if abs(c - my_y) + abs(r - my_x) > depth or utility.position_in_items(board, position, EXCLUDE):
+                continue
+
+            parents[position] = set()
+            items[constants.Item(board[position])].append(position)
+
+            if position == my_position:
+                Q.put(position)
+                dist[position] = 0
+            else:
+                dist[position] = np.inf
+
+    for bomb in bombs:
+        if bomb['position'] == my_position:
+            items[constants.Item.Bomb].append(my_position)
+
+    while not Q.empty():
+        position = Q.get()
+
+        if utility.position_is_passable(board, position, enemies):
+            x, y = position
+            val = dist[(x, y)] + 1
+            for row, col in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
+                new_position = (row + x, col + y)
+                if new_position not in dist:
+                    continue
+
+                if val < dist[new_position]:
+                    dist[new_position] = val
+                    parents[new_position] = {position}
+                    Q.put(new_position)
+                elif val == dist[new_position]:
+                    parents[new_position].add(position)
+
+    return items, dist, parents
+
+
+@unittest.skipIf(constants is None, "pommerman is not installed")
+class TestSimpleAgentDistances(unittest.TestCase):
+
+    def random_searches(self, trials=300):
+        rng = np.random.default_rng(0)
+        for trial in range(trials):
+            board = rng.choice([0, 0, 0, 0, 1, 2, 2, 3, 4, 5, 6, 7, 8, 10, 11, 12, 13], size=(11, 11)).astype(np.uint8)
+            my_position = tuple(rng.integers(0, 11, 2).tolist())
+            board[my_position] = constants.Item.Agent0.value
+            enemies = [constants.Item(v) for v in rng.choice([9, 11, 12, 13], size=rng.integers(1, 4), replace=False)]
+            depth = int(rng.choice([1, 3, 10]))
+            bombs = [{'position': my_position, 'blast_strength': 2}] if trial % 5 == 0 else []
+            yield board, my_position, bombs, enemies, depth
+
+    def test_matches_queue_search(self):
+        for board, my_position, bombs, enemies, depth in self.random_searches():
+            expected_items, expected_dist, expected_parents = queue_djikstra(board, my_position, bombs, enemies, depth)
+            items, dist, prev = SimpleAgent._djikstra(board, my_position, bombs, enemies, depth=depth)
+
+            self.assertEqual(dist, expected_dist)
+            self.assertEqual({item: positions for item, positions in items.items() if positions}, dict(expected_items))
+            self.assertEqual(set(prev), set(expected_parents))
+            for position, parent in prev.items():
+                if expected_parents[position]:
+                    self.assertIn(parent, expected_parents[position])
+                else:
+                    self.assertIsNone(parent)
+
+            positions, _, _, parents = distance_map(board, my_position, enemies, depth, EXCLUDE)
+            for x, y in positions:
+                self.assertEqual({(x + row, y + col) for (row, col), is_parent in zip(NEIGHBOURS.tolist(), parents[:, x, y])
+                                  if is_parent}, expected_parents[(x, y)])
+
+    def test_cached_boards_still_pick_random_parents(self):
+        board = np.zeros((11, 11), dtype=np.uint8)
+        board[0, 0] = constants.Item.Agent0.value
+        picked = {SimpleAgent._djikstra(board, (0, 0), [], [constants.Item.Agent1], depth=10)[2][(1, 1)]
+                  for trial in range(50)}
+        self.assertEqual(picked, {(0, 1), (1, 0)})
+
+
+if __name__ == "__main__":
+    import pytest
+    import sys
+
+    sys.exit(pytest.main(["-v", __file__]))
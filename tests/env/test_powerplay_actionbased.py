@@ -0,0 +1,32 @@
+import unittest
+from marllib.envs.base_env.powerplay_actionbased import Powerplay, get_path_table
+
+
+class TestPowerplayPathTable(unittest.TestCase):
+
+    def test_path_table_against_networkx(self):
+        env = Powerplay({"seed": 1})
+        table = get_path_table()
+        stations = list(env.junctions.values()) + [env.red_substation, env.blue_substation,
+                                                   env.red_stack_one, env.red_stack_two,
+                                                   env.blue_stack_one, env.blue_stack_two]
+        for station in stations:
+            for box in range(36):
+                for heading in (0, 90, 180, 270):
+                    nx_path, nx_time = station.closest_path_to(box, heading, env.graph)
+                    path, time = station.closest_path_to(box, heading, env.graph, table)
+                    self.assertLessEqual(time, nx_time)
+                    self.assertEqual(len(path), len(nx_path))
+                    self.assertEqual(path[-1] if path else box, station.nearest_box(box))
+                    last = box
+                    for next_box in path:
+                        self.assertIn(next_box - last, (1, -1, 6, -6))
+                        self.assertEqual(abs(next_box % 6 - last % 6) + abs(next_box // 6 - last // 6), 1)
+                        last = next_box
+
+
+if __name__ == "__main__":
+    import pytest
+    import sys
+
+    sys.exit(pytest.main(["-v", __file__]))
@@ -0,0 +1,29 @@
+import random
+import unittest
+from marllib.envs.base_env import powerplay_actionbased, powerplay_movementbased
+
+
+class TestPowerplayCircuit(unittest.TestCase):
+
+    def check_against_bfs(self, env_class):
+        rng = random.Random(0)
+        for trial in range(200):
+            env = env_class({"seed": 1})
+            env.red_terminal_one_captured = env.red_terminal_two_captured = rng.random() < 0.9
+            env.blue_terminal_one_captured = env.blue_terminal_two_captured = rng.random() < 0.9
+            for change in range(60):
+                env.set_junction_owner(rng.randint(4, 28), rng.choice(["red", "blue", "blue", "red", None]))
+                self.assertEqual(env.find_circuit(), env.find_circuit_bfs())
+
+    def test_movementbased(self):
+        self.check_against_bfs(powerplay_movementbased.Powerplay)
+
+    def test_actionbased(self):
+        self.check_against_bfs(powerplay_actionbased.Powerplay)
+
+
+if __name__ == "__main__":
+    import pytest
+    import sys
+
+    sys.exit(pytest.main(["-v", __file__]))
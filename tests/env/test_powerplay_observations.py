@@ -0,0 +1,181 @@
+import unittest
+import numpy as np
+from marllib.envs.base_env import powerplay_actionbased, powerplay_movementbased
+
+ADJUSTMENT_PERIODS = {"red_1": 1, "red_2": 3, "blue_1": 2, "blue_2": 2}
+
+# observations and action masks of the agents asked to act at a few steps of one scripted match, as produced by the
+# object-backed observation builder that generate_observations replaced
+EXPECTED = {
+    "movementbased": {
+        0: {
+            "red_1": (
+                [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 11,
+                 2, 0, 0, 2, 23, 2, 0, 0, 6, 6, 0, 0, 0, 4, 24, 0, 0, 0, 4, 0, 0, 1, 1, 1, 1, 30, 30, 0, 0, 0, 0],
+                [1, 0, 1, 1, 0, 0, 0, 0, 0, 0, 0]),
+            "red_2": (
+                [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 11,
+                 2, 0, 0, 2, 23, 2, 0, 0, 6, 6, 0, 0, 0, 4, 24, 0, 0, 0, 4, 0, 0, 1, 1, 1, 1, 30, 30, 0, 0, 0, 0],
+                [1, 0, 1, 1, 0, 0, 0, 0, 0, 1, 0]),
+            "blue_1": (
+                [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 11,
+                 2, 0, 0, 2, 23, 2, 0, 0, 6, 6, 0, 0, 0, 4, 24, 0, 0, 0, 4, 0, 0, 1, 1, 1, 1, 30, 30, 0, 0, 0, 0],
+                [0, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0]),
+            "blue_2": (
+                [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 11,
+                 2, 0, 0, 2, 23, 2, 0, 0, 6, 6, 0, 0, 0, 4, 24, 0, 0, 0, 4, 0, 0, 1, 1, 1, 1, 30, 30, 0, 0, 0, 0],
+                [0, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0]),
+        },
+        5: {
+            "red_1": (
+                [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 2, 1, 0, 5, 2,
+                 0, 0, 2, 22, 2, 0, 0, 6, 2, 0, 0, 0, 4, 13, 0, 0, 0, 4, 0, 0, 1, 1, 1, 1, 30, 30, 0, 0, 0, 0],
+                [1, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0]),
+            "red_2": (
+                [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 2, 1, 0, 5, 2,
+                 0, 0, 2, 22, 2, 0, 0, 6, 2, 0, 0, 0, 4, 13, 0, 0, 0, 4, 0, 0, 1, 1, 1, 1, 30, 30, 0, 0, 0, 0],
+                [1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0]),
+            "blue_1": (
+                [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 2, 0, 0, 5, 2,
+                 0, 0, 2, 22, 2, 0, 0, 6, 2, 0, 0, 0, 4, 13, 0, 0, 0, 4, 0, 0, 1, 1, 1, 1, 30, 30, 0, 0, 0, 0],
+                [1, 1, 0, 1, 0, 0, 0, 0, 0, 1, 0]),
+            "blue_2": (
+                [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 2, 0, 0, 5, 2,
+                 0, 0, 2, 22, 2, 0, 0, 6, 2, 0, 0, 0, 4, 13, 0, 0, 0, 4, 0, 0, 1, 1, 1, 1, 30, 30, 0, 0, 0, 0],
+                [1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0]),
+        },
+        20: {
+            "red_1": (
+                [0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 9, 1, 0, 23,
+                 2, 0, 0, 2, 0, 2, 0, 0, 6, 8, 0, 1, 0, 4, 21, 0, 0, 0, 4, 0, 0, 1, 1, 1, 1, 29, 30, 0, 0, 0, 0],
+                [1, 0, 1, 1, 0, 0, 0, 0, 0, 1, 0]),
+            "red_2": (
+                [0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 9, 1, 0, 23,
+                 2, 0, 0, 2, 0, 2, 0, 0, 6, 8, 0, 1, 0, 4, 21, 0, 0, 0, 4, 0, 0, 1, 1, 1, 1, 29, 30, 0, 0, 0, 0],
+                [0, 1, 0, 1, 0, 0, 0, 0, 0, 0, 0]),
+            "blue_1": (
+                [0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 9, 0, 0, 23,
+                 2, 0, 0, 2, 0, 2, 0, 0, 6, 8, 0, 1, 0, 4, 21, 0, 0, 0, 4, 0, 0, 1, 1, 1, 1, 29, 30, 0, 0, 0, 0],
+                [1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0]),
+            "blue_2": (
+                [0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 9, 0, 0, 23,
+                 2, 0, 0, 2, 0, 2, 0, 0, 6, 8, 0, 1, 0, 4, 21, 0, 0, 0, 4, 0, 0, 1, 1, 1, 1, 29, 30, 0, 0, 0, 0],
+                [1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0]),
+        },
+        40: {
+            "red_2": (
+                [0, 0, 0, 0, 0, 0, 1, 2, 0, 0, 1, 0, 2, 0, 0, 0, 0, 0, 2, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 19, 1, 0, 9,
+                 2, 1, 0, 2, 21, 2, 0, 0, 6, 1, 0, 1, 0, 4, 21, 0, 0, 0, 4, 1, 1, 1, 1, 1, 1, 29, 29, 0, 0, 0, 0],
+                [1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0]),
+            "blue_1": (
+                [0, 0, 0, 0, 0, 0, 1, 2, 0, 0, 1, 0, 2, 0, 0, 0, 0, 0, 2, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 19, 0, 0, 9,
+                 2, 1, 0, 2, 21, 2, 0, 0, 6, 1, 0, 1, 0, 4, 21, 0, 0, 0, 4, 1, 1, 1, 1, 1, 1, 29, 29, 0, 0, 0, 0],
+                [1, 1, 0, 1, 0, 0, 1, 1, 1, 0, 0]),
+            "blue_2": (
+                [0, 0, 0, 0, 0, 0, 1, 2, 0, 0, 1, 0, 2, 0, 0, 0, 0, 0, 2, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 19, 0, 0, 9,
+                 2, 1, 0, 2, 21, 2, 0, 0, 6, 1, 0, 1, 0, 4, 21, 0, 0, 0, 4, 1, 1, 1, 1, 1, 1, 29, 29, 0, 0, 0, 0],
+                [1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0]),
+        },
+    },
+    "actionbased": {
+        0: {
+            "red_1": (
+                [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 11,
+                 2, 0, 0, 2, 23, 2, 0, 0, 6, 6, 0, 0, 0, 4, 24, 0, 0, 0, 4, 0, 0, 1, 1, 1, 1, 30, 30, 0, 0, 0, 0],
+                [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]),
+            "red_2": (
+                [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 11,
+                 2, 0, 0, 2, 23, 2, 0, 0, 6, 6, 0, 0, 0, 4, 24, 0, 0, 0, 4, 0, 0, 1, 1, 1, 1, 30, 30, 0, 0, 0, 0],
+                [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]),
+            "blue_1": (
+                [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 11,
+                 2, 0, 0, 2, 23, 2, 0, 0, 6, 6, 0, 0, 0, 4, 24, 0, 0, 0, 4, 0, 0, 1, 1, 1, 1, 30, 30, 0, 0, 0, 0],
+                [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]),
+            "blue_2": (
+                [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 11,
+                 2, 0, 0, 2, 23, 2, 0, 0, 6, 6, 0, 0, 0, 4, 24, 0, 0, 0, 4, 0, 0, 1, 1, 1, 1, 30, 30, 0, 0, 0, 0],
+                [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]),
+        },
+        5: {
+            "red_1": (
+                [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 2, 1, 2, 17,
+                 1, 1, 0, 2, 22, 2, 1, 0, 6, 1, 0, 1, 0, 4, 0, 1, 0, 0, 4, 0, 0, 1, 1, 1, 1, 30, 30, 0, 0, 0, 0],
+                [0.05, 1, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05,
+                 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05]),
+            "red_2": (
+                [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 2, 1, 3, 17,
+                 1, 1, 0, 2, 22, 2, 1, 0, 6, 1, 0, 1, 0, 4, 0, 1, 0, 0, 4, 0, 0, 1, 1, 1, 1, 30, 30, 0, 0, 0, 0],
+                [0.05, 0.05, 1, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05,
+                 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05]),
+            "blue_1": (
+                [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 2, 0, 9, 17,
+                 1, 1, 0, 2, 22, 2, 1, 0, 6, 1, 0, 1, 0, 4, 0, 1, 0, 0, 4, 0, 0, 1, 1, 1, 1, 30, 30, 0, 0, 0, 0],
+                [0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 1, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05,
+                 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05]),
+            "blue_2": (
+                [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 2, 0, 0, 17,
+                 1, 1, 0, 2, 22, 2, 1, 0, 6, 1, 0, 1, 0, 4, 0, 1, 0, 0, 4, 0, 0, 1, 1, 1, 1, 30, 30, 0, 0, 0, 0],
+                [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]),
+        },
+        20: {
+            "red_1": (
+                [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 2, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 2, 0, 0, 0, 0, 0, 9, 1, 23, 2,
+                 3, 1, 0, 2, 22, 3, 1, 0, 6, 9, 1, 1, 0, 4, 13, 3, 1, 0, 4, 0, 0, 1, 1, 1, 1, 30, 30, 0, 0, 0, 0],
+                [0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05,
+                 0.05, 0.05, 0.05, 0.05, 0.05, 1, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05]),
+            "blue_2": (
+                [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 2, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 2, 0, 0, 0, 0, 0, 9, 0, 18, 2,
+                 3, 1, 0, 2, 22, 3, 1, 0, 6, 9, 1, 1, 0, 4, 13, 3, 1, 0, 4, 0, 0, 1, 1, 1, 1, 30, 30, 0, 0, 0, 0],
+                [0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05,
+                 1, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05, 0.05]),
+        },
+        40: {
+            "red_2": (
+                [0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 1, 2, 0, 0, 0, 0, 2, 0, 2, 0, 0, 0, 0, 2, 0, 0, 0, 0, 0, 19, 1, 0, 15,
+                 2, 1, 0, 2, 23, 0, 0, 0, 6, 13, 3, 1, 0, 4, 2, 1, 0, 0, 4, 0, 1, 1, 1, 1, 1, 30, 30, 0, 0, 0, 0],
+                [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]),
+        },
+    },
+}
+
+
+def scripted_match(module, steps):
+    """Observations of a match with fixed adjustment periods, every agent picking a random valid action."""
+    env = module.Powerplay({"seed": 0})
+    for agent, period in ADJUSTMENT_PERIODS.items():
+        env.robots[agent].adjustmentPeriod = period
+    rng = np.random.default_rng(0)
+    obs = {agent: env.generate_observation(agent) for agent in env.agents}
+    for step in range(steps):
+        yield step, obs
+        actions = {}
+        for agent in sorted(obs):
+            valid = np.nonzero(obs[agent]["action_mask"])[0]
+            if len(valid) > 0:
+                actions[agent] = int(rng.choice(valid))
+        obs, rewards, dones, _ = env.step(actions)
+
+
+class TestPowerplayObservations(unittest.TestCase):
+
+    def assert_matches_expected(self, module, expected):
+        for step, obs in scripted_match(module, max(expected) + 1):
+            if step not in expected:
+                continue
+            self.assertEqual(list(obs), list(expected[step]))
+            for agent, (agent_obs, action_mask) in expected[step].items():
+                np.testing.assert_array_equal(obs[agent]["obs"], agent_obs)
+                np.testing.assert_array_equal(obs[agent]["action_mask"], action_mask)
+
+    def test_movementbased(self):
+        self.assert_matches_expected(powerplay_movementbased, EXPECTED["movementbased"])
+
+    def test_actionbased(self):
+        self.assert_matches_expected(powerplay_actionbased, EXPECTED["actionbased"])
+
+
+if __name__ == "__main__":
+    import pytest
+    import sys
+
+    sys.exit(pytest.main(["-v", __file__]))
@@ -0,0 +1,42 @@
+import os
+import unittest
+import yaml
+import marllib
+from marllib.envs.base_env import powerplay_actionbased, powerplay_movementbased
+
+CONFIG_DIR = os.path.join(os.path.dirname(marllib.__file__), "envs", "base_env", "config")
+
+
+def shipped_env_args(env_name):
+    with open(os.path.join(CONFIG_DIR, env_name + ".yaml")) as f:
+        return yaml.safe_load(f)["env_args"]
+
+
+def matches(env, episodes=10):
+    """The random part of each match: the adjustment periods drawn for the robots at every reset."""
+    periods = []
+    for episode in range(episodes):
+        env.reset()
+        periods.append(tuple(env.robots[agent].adjustmentPeriod for agent in env.agents))
+    return periods
+
+
+class TestPowerplaySeeding(unittest.TestCase):
+
+    def test_env_copies_draw_their_own_matches(self):
+        for module in [powerplay_movementbased, powerplay_actionbased]:
+            env_args = shipped_env_args(module.__name__.split(".")[-1])
+            self.assertIsNone(env_args["seed"])
+            self.assertNotEqual(matches(module.Powerplay(dict(env_args))), matches(module.Powerplay(dict(env_args))))
+
+    def test_explicit_seed_replays_the_matches(self):
+        for module in [powerplay_movementbased, powerplay_actionbased]:
+            env_args = dict(shipped_env_args(module.__name__.split(".")[-1]), seed=3)
+            self.assertEqual(matches(module.Powerplay(dict(env_args))), matches(module.Powerplay(dict(env_args))))
+
+
+if __name__ == "__main__":
+    import pytest
+    import sys
+
+    sys.exit(pytest.main(["-v", __file__]))
@@ -0,0 +1,51 @@
+import unittest
+import numpy as np
+from marllib.envs.base_env.powerplay_movementbased import Powerplay
+from marllib.envs.base_env.powerplay_vectorized import PowerplayVecEnv, AGENTS
+
+
+class TestPowerplayVecEnv(unittest.TestCase):
+
+    def test_matches_scalar_env(self):
+        rng = np.random.default_rng(0)
+        for episode in range(20):
+            env = Powerplay({})
+            vec_env = PowerplayVecEnv({"num_envs": 1, "seed": episode})
+            for i, agent in enumerate(AGENTS):
+                env.robots[agent].adjustmentPeriod = int(vec_env.adjustment_period[0, i])
+            obs = {agent: env.generate_observation(agent) for agent in env.agents}
+            vec_obs = vec_env.generate_observation()
+
+            while env.agents:
+                actions = {}
+                vec_actions = -np.ones((1, 4), dtype=np.int64)
+                for i, agent in enumerate(AGENTS):
+                    if agent not in obs:
+                        continue
+                    np.testing.assert_array_equal(obs[agent]["obs"], vec_obs["obs"][0, i])
+                    np.testing.assert_array_equal(obs[agent]["action_mask"], vec_obs["action_mask"][0, i])
+                    valid = np.nonzero(obs[agent]["action_mask"])[0]
+                    if len(valid) > 0:
+                        actions[agent] = vec_actions[0, i] = rng.choice(valid)
+
+                obs, rewards, dones, _ = env.step(actions)
+                vec_obs, vec_rewards, vec_dones, info = vec_env.step(vec_actions)
+                self.assertEqual(set(obs), {agent for i, agent in enumerate(AGENTS) if info["active"][0, i]})
+                np.testing.assert_array_equal([rewards[agent] for agent in AGENTS], vec_rewards[0])
+                self.assertEqual(dones["__all__"], vec_dones[0])
+
+    def test_batched_reset(self):
+        vec_env = PowerplayVecEnv({"num_envs": 8, "seed": 0})
+        vec_env.step(np.zeros((8, 4), dtype=np.int64))
+        obs = vec_env.reset([1, 3])
+        self.assertEqual(obs["obs"].shape, (8, 4, 64))
+        self.assertEqual(obs["action_mask"].shape, (8, 4, 11))
+        self.assertTrue((vec_env.box[[1, 3]] == [11, 23, 6, 24]).all())
+        self.assertTrue((vec_env.box[0] != [11, 23, 6, 24]).any())
+
+
+if __name__ == "__main__":
+    import pytest
+    import sys
+
+    sys.exit(pytest.main(["-v", __file__]))
@@ -0,0 +1,49 @@
+import subprocess
+import sys
+import unittest
+from marllib.envs.base_env import ENV_REGISTRY
+from marllib.envs.base_env.registry import LazyEnvRegistry
+
+
+class TestLazyEnvRegistry(unittest.TestCase):
+
+    def test_env_modules_are_not_imported_eagerly(self):
+        self.assertIn("smac", ENV_REGISTRY)
+        self.assertNotIn("marllib.envs.base_env.smac", sys.modules)
+        self.assertNotIn("marllib.envs.base_env.metadrive", sys.modules)
+
+    def test_importing_marllib_loads_no_env(self):
+        # in a fresh interpreter, as other tests import env modules
+        loaded = subprocess.check_output([sys.executable, "-c", (
+            "import sys; from marllib import marl; "
+            "print(sorted(m for m in sys.modules if m.startswith('marllib.envs.base_env.') and m != 'marllib.envs.base_env.registry'))")])
+        self.assertEqual(loaded.decode().strip(), "[]")
+
+    def test_entries_resolve_on_lookup(self):
+        registry = LazyEnvRegistry({"decoder": "json.decoder:JSONDecoder", "broken": "no_such_simulator:Env"})
+        self.assertEqual(list(registry), ["decoder", "broken"])
+        import json.decoder
+        self.assertIs(registry["decoder"], json.decoder.JSONDecoder)
+        self.assertIsNone(registry.error("decoder"))
+        self.assertIsInstance(registry["broken"], str)
+        self.assertIn("no_such_simulator", registry.error("broken"))
+        self.assertEqual([row[:2] for row in registry.status()], [["decoder", "Ready"], ["broken", "Error"]])
+
+    def test_assigned_classes_override_paths(self):
+        registry = LazyEnvRegistry({"broken": "no_such_simulator:Env"})
+        registry["broken"] = dict
+        registry["custom"] = list
+        self.assertIs(registry["broken"], dict)
+        self.assertIs(registry["custom"], list)
+        self.assertEqual(len(registry), 2)
+        del registry["custom"]
+        self.assertNotIn("custom", registry)
+        with self.assertRaises(KeyError):
+            registry["custom"]
+
+
+if __name__ == "__main__":
+    import pytest
+    import sys
+
+    sys.exit(pytest.main(["-v", __file__]))
@@ -0,0 +1,78 @@
+import unittest
+import numpy as np
+import torch
+from gym.spaces import Box
+from marllib.marl.models.zoo.mlp.jointQ_mlp import JointQ_MLP
+from marllib.marl.models.zoo.rnn.jointQ_rnn import JointQ_RNN
+
+N_AGENTS = 3
+OBS_SIZE = 6
+N_ACTIONS = 5
+HIDDEN = 8
+
+
+def build_model(model_cls, core_arch):
+    obs_space = Box(low=-1, high=1, shape=(OBS_SIZE,), dtype=np.float32)
+    model_config = {
+        "fcnet_activation": "relu",
+        "custom_model_config": {
+            "num_agents": N_AGENTS,
+            "global_state_flag": False,
+            "space_obs": {"obs": obs_space},
+            "model_arch_args": {"core_arch": core_arch, "hidden_state_size": HIDDEN, "fc_layer": 1,
+                                "encode_layer": "16"},
+        },
+    }
+    return model_cls(obs_space, None, N_ACTIONS, model_config, "jointq")
+
+
+def step_through_time(model, obs):
+    """Q-values and final states of forward() carried one step at a time, like RLlib's _unroll_mac."""
+    B, T = obs.shape[:2]
+    h = [s.expand(B, N_AGENTS, -1).reshape(B * N_AGENTS, -1) for s in model.get_initial_state()]
+    q, states = [], []
+    for t in range(T):
+        q_t, h = model.forward({"obs_flat": obs[:, t].reshape(B * N_AGENTS, -1)}, h, None)
+        q.append(q_t.reshape(B, N_AGENTS, -1))
+        states.append(h[0].reshape(B, N_AGENTS, -1))
+    return torch.stack(q, dim=1), torch.stack(states, dim=1)
+
+
+class TestJointQUnroll(unittest.TestCase):
+
+    def setUp(self):
+        torch.manual_seed(0)
+        # zero-padded episodes of different lengths
+        self.seq_lens = torch.tensor([7, 3, 1, 5])
+        self.obs = torch.randn(len(self.seq_lens), 7, N_AGENTS, OBS_SIZE)
+        for b, seq_len in enumerate(self.seq_lens):
+            self.obs[b, seq_len:] = 0
+
+    def assert_matches_step_through_time(self, model):
+        with torch.no_grad():
+            q_steps, h_steps = step_through_time(model, self.obs)
+            q, (h, ) = model.unroll(self.obs)
+            torch.testing.assert_close(q, q_steps)
+            torch.testing.assert_close(h, h_steps[:, -1])
+
+            q, (h, ) = model.unroll(self.obs, self.seq_lens)
+            torch.testing.assert_close(q, q_steps)
+            for b, seq_len in enumerate(self.seq_lens):
+                torch.testing.assert_close(h[b], h_steps[b, seq_len - 1])
+
+    def test_rnn_unroll_matches_gru_cell_steps(self):
+        model = build_model(JointQ_RNN, "gru")
+        self.assert_matches_step_through_time(model)
+        # the hidden state does not stay at its initial value
+        _, (h, ) = model.unroll(self.obs)
+        self.assertGreater(h.abs().sum().item(), 0)
+
+    def test_mlp_unroll_matches_forward_steps(self):
+        self.assert_matches_step_through_time(build_model(JointQ_MLP, "mlp"))
+
+
+if __name__ == "__main__":
+    import pytest
+    import sys
+
+    sys.exit(pytest.main(["-v", __file__]))
@@ -0,0 +1,35 @@
+import unittest
+import torch
+from marllib.marl.models.zoo.tracing import ModelTracer
+
+
+class TestModelTracer(unittest.TestCase):
+
+    def test_off_unless_configured(self):
+        self.assertIsNone(ModelTracer.from_config({"model_arch_args": {"core_arch": "gru"}}))
+        self.assertIsNone(ModelTracer.from_config({"model_arch_args": {"trace_capacity": 0}}))
+        self.assertEqual(ModelTracer.from_config({"model_arch_args": {"trace_capacity": 8}}).records.maxlen, 8)
+
+    def test_summary_of_the_last_records(self):
+        tracer = ModelTracer(4)
+        for i in range(6):
+            tracer.record("logits", torch.full((3, 5), float(i)))
+            tracer.record("state_in_0", torch.zeros(i, 16))
+        summary = tracer.summary()
+        # logits 4, 5 and state_in_0 of length 4 and 5 are left in the buffer
+        self.assertEqual(summary["logits"]["count"], 2)
+        self.assertEqual(summary["logits"]["shape"], (3, 5))
+        self.assertAlmostEqual(summary["logits"]["mean"], 4.5)
+        self.assertEqual(summary["logits"]["min"], 4.)
+        self.assertEqual(summary["logits"]["max"], 5.)
+        self.assertEqual(summary["state_in_0"]["shape"], (5, 16))
+
+        tracer.record("value", torch.zeros(0))
+        self.assertEqual(tracer.summary()["value"], {"count": 1, "shape": (0, )})
+
+
+if __name__ == "__main__":
+    import pytest
+    import sys
+
+    sys.exit(pytest.main(["-v", __file__]))